@@ -4,6 +4,28 @@ import fs from "node:fs";
 
 const PROJECT_ROOT = path.join(process.cwd(), "..");
 const PRODUCTS_DIR = path.join(PROJECT_ROOT, "bot", "Content", "products");
+// Скільки пам'ятати, що зменшеної копії ще немає (бот будує рендиції у фоні) — як MISSING_TTL в image_store.py
+const MISSING_RENDITION_TTL_MS = 60_000;
+// Запити з довільними іменами не повинні роздувати кеш
+const SERVED_PATHS_LIMIT = 5000;
+
+// Оригінал -> шлях, який віддаємо: знайдена рендиція кешується назавжди (імена фото — хеш вмісту),
+// відсутня — на MISSING_RENDITION_TTL_MS, щоб не перевіряти диск на кожен запит
+const servedPaths = new Map<string, { path: string; expiresAt: number }>();
+
+function resolveServedPath(filePath: string): string {
+  const cached = servedPaths.get(filePath);
+  if (cached && cached.expiresAt > Date.now()) return cached.path;
+  // Бот кладе поруч зменшену копію <ім'я>_web.jpg (bot/ulits/image_store.py) — для каталогу віддаємо її
+  const webRendition = filePath.replace(/\.[^./\\]+$/, "") + "_web.jpg";
+  const found = fs.existsSync(webRendition);
+  if (servedPaths.size >= SERVED_PATHS_LIMIT) servedPaths.clear();
+  servedPaths.set(filePath, {
+    path: found ? webRendition : filePath,
+    expiresAt: found ? Number.POSITIVE_INFINITY : Date.now() + MISSING_RENDITION_TTL_MS,
+  });
+  return found ? webRendition : filePath;
+}
 
 export async function GET(
   _request: NextRequest,
@@ -21,8 +43,19 @@ export async function GET(
     return NextResponse.json({ error: "Forbidden" }, { status: 403 });
   }
 
+  let servedPath = resolveServedPath(filePath);
+
   try {
-    const stat = fs.statSync(filePath);
+    let stat: fs.Stats;
+    try {
+      stat = fs.statSync(servedPath);
+    } catch (e) {
+      // Закешовану рендицію видалили — забуваємо її і віддаємо оригінал
+      if (servedPath === filePath) throw e;
+      servedPaths.delete(filePath);
+      servedPath = filePath;
+      stat = fs.statSync(servedPath);
+    }
     if (!stat.isFile()) {
       return NextResponse.json({ error: "Not found" }, { status: 404 });
     }
@@ -31,7 +64,7 @@ export async function GET(
     if (ifNoneMatch === etag || ifNoneMatch === `W/${etag}`) {
       return new NextResponse(null, { status: 304, headers: { "Cache-Control": "public, max-age=31536000, immutable", ETag: etag } });
     }
-    const ext = path.extname(filename).toLowerCase();
+    const ext = path.extname(servedPath).toLowerCase();
     const contentType =
       ext === ".png"
         ? "image/png"
@@ -40,7 +73,7 @@ export async function GET(
           : ext === ".webp"
             ? "image/webp"
             : "image/jpeg";
-    const buffer = fs.readFileSync(filePath);
+    const buffer = fs.readFileSync(servedPath);
     return new NextResponse(buffer, {
       headers: {
         "Content-Type": contentType,
@@ -295,9 +295,7 @@ export function addPartnerCredit(
     const percent = getPartnerReferralPercent();
     const creditAmount = Math.round(purchaseAmount * (percent / 100) * 10) / 10;
     if (creditAmount <= 0) return true;
-    database
-      .prepare("UPDATE users SET partner_balance = COALESCE(partner_balance, 0) + ? WHERE user_id = ?")
-      .run(creditAmount, partnerId);
+    // Баланс у partner_accounts оновлюють тригери бота (partner_earnings → partner_ledger)
     database
       .prepare(
         `INSERT INTO partner_earnings (partner_id, buyer_id, purchase_amount, credit_amount, percent, product_name, payment_type)
@@ -496,12 +494,10 @@ export function getUserRecurringSubscriptions(telegramUserId: number) {
 export function getPartnerBalance(telegramUserId: number): number {
   try {
     const database = getDb();
-    const info = database.prepare("PRAGMA table_info(users)").all() as Array<{ name: string }>;
-    if (!info.some((c) => c.name === "partner_balance")) return 0;
     const row = database
-      .prepare("SELECT COALESCE(partner_balance, 0) FROM users WHERE user_id = ?")
-      .get(telegramUserId) as { "COALESCE(partner_balance, 0)": number } | undefined;
-    return row ? Number(row["COALESCE(partner_balance, 0)"]) : 0;
+      .prepare("SELECT balance FROM partner_accounts WHERE partner_id = ?")
+      .get(telegramUserId) as { balance: number } | undefined;
+    return row ? Number(row.balance) : 0;
   } catch {
     return 0;
   }
@@ -504,6 +504,20 @@ def get_user_token_invalid_text(product_name: str, masked_card: str) -> str:
     )
 
 
+def get_user_token_precheck_text(product_name: str, masked_card: str, next_payment_date: str) -> str:
+    """Текст користувачу: картку визнано недійсною ще до дня списання."""
+    return (
+        f"⚠️ <b>Картка для автоматичного платежу недійсна</b>\n\n"
+        f"Підписка: <b>{product_name}</b>\n"
+        f"Картка: <b>{masked_card}</b>\n"
+        f"Наступне списання: <b>{format_date(next_payment_date)}</b>\n\n"
+        f"Списати оплату з цієї картки не вийде. Щоб підписка не перервалась, до дати списання:\n"
+        f"1. Оформіть підписку знову в каталозі\n"
+        f"2. При оплаті збережіть нову картку\n\n"
+        f"Якщо картку не оновити, у день списання підписку буде скасовано."
+    )
+
+
 def get_admin_token_invalid_text(
     user_id: int,
     username: str | None,
@@ -0,0 +1,247 @@
+"""
+Перевірка та бенчмарк format_entities: порівнює однопрохідний рендер з попередньою
+реалізацією (скопійована нижче як legacy_format_entities, без налагоджувальних print).
+
+1. Еквівалентність — випадкові тексти з емодзі та сутностями, які попередня реалізація
+   обробляла коректно (окремі сутності та групи на одному діапазоні): HTML має збігатися байт у байт.
+2. Вкладені й перехресні сутності — попередня реалізація тут дублювала текст або закривала теги
+   не на своїх межах; для нового рендера перевіряється, що без тегів лишається вихідний текст,
+   а теги збалансовані.
+3. Бенчмарк на довгому промо-пості та на стрес-наборі сутностей.
+
+Запуск (з директорії bot):
+    python bench_entities.py --cases 2000 --entities 100
+"""
+import argparse
+import random
+import re
+import sys
+import timeit
+
+from aiogram.types import MessageEntity
+
+from ulits.admin_functions import format_entities, get_entity_tags, get_entity_priority
+
+WORDS = ["Netflix", "підписка", "знижка", "🔥", "Spotify", "YouTube", "Premium", "акція", "👉", "₴", "сьогодні", "🎁"]
+STYLE_TYPES = ["bold", "italic", "underline", "strikethrough", "spoiler", "code"]
+
+
+def legacy_create_utf16_to_utf8_mapping(text: str) -> dict:
+    utf16_to_utf8 = {}
+    utf16_pos = 0
+    for utf8_pos, char in enumerate(text):
+        utf16_to_utf8[utf16_pos] = utf8_pos
+        utf16_pos += len(char.encode('utf-16-le')) // 2
+    utf16_to_utf8[utf16_pos] = len(text)
+    return utf16_to_utf8
+
+
+def legacy_format_entities(text: str, entities: list = None) -> str:
+    if not text or not entities:
+        return text
+
+    utf16_to_utf8_map = legacy_create_utf16_to_utf8_mapping(text)
+
+    adjusted_entities = []
+    for entity in entities:
+        utf8_offset = utf16_to_utf8_map.get(entity.offset, None)
+        utf8_end = utf16_to_utf8_map.get(entity.offset + entity.length, None)
+        if utf8_offset is None or utf8_end is None:
+            continue
+        new_entity = entity.__class__(**entity.__dict__)
+        new_entity.offset = utf8_offset
+        new_entity.length = utf8_end - utf8_offset
+        if new_entity.offset < 0 or new_entity.offset >= len(text):
+            continue
+        if new_entity.length <= 0:
+            continue
+        if new_entity.offset + new_entity.length > len(text):
+            continue
+        adjusted_entities.append(new_entity)
+
+    if not adjusted_entities:
+        return text
+
+    entities_sorted = sorted(adjusted_entities, key=lambda e: (e.offset, get_entity_priority(e.type), -e.length))
+
+    result = []
+    current_pos = 0
+    open_tags = []
+    processed_entities = set()
+
+    for entity in entities_sorted:
+        if id(entity) in processed_entities:
+            continue
+        entity_type = entity.type
+        offset = entity.offset
+        length = entity.length
+        try:
+            if offset > current_pos:
+                result.append(text[current_pos:offset])
+            while open_tags and open_tags[-1]['end'] <= offset:
+                tag_info = open_tags.pop()
+                result.append(tag_info['close_tag'])
+            entity_text = text[offset:offset + length]
+            if not entity_text.strip() and entity_type != "custom_emoji":
+                continue
+            open_tag, close_tag = get_entity_tags(entity, entity_text)
+            if not open_tag:
+                continue
+            nested_entities = []
+            for other_entity in entities_sorted:
+                if (other_entity != entity and
+                        other_entity.type != entity_type and
+                        other_entity.offset >= offset and
+                        other_entity.offset + other_entity.length <= offset + length and
+                        other_entity.length > 0 and
+                        not (other_entity.offset == offset and other_entity.length == length)):
+                    nested_entities.append(other_entity)
+            if nested_entities:
+                result.append(open_tag)
+                open_tags.append({'end': offset + length, 'close_tag': close_tag})
+                processed_entities.add(id(entity))
+                current_pos = offset
+            else:
+                same_range_entities = [
+                    e for e in entities_sorted
+                    if e != entity and e.offset == offset and e.length == length and id(e) not in processed_entities
+                ]
+                if same_range_entities:
+                    all_entities = [entity] + same_range_entities
+                    all_entities.sort(key=lambda e: get_entity_priority(e.type))
+                    for e in all_entities:
+                        e_open_tag, e_close_tag = get_entity_tags(e, text[offset:offset + length])
+                        result.append(e_open_tag)
+                        open_tags.append({'end': offset + length, 'close_tag': e_close_tag})
+                        processed_entities.add(id(e))
+                    result.append(entity_text)
+                    current_pos = offset + length
+                else:
+                    result.append(open_tag)
+                    result.append(entity_text)
+                    result.append(close_tag)
+                    processed_entities.add(id(entity))
+                    current_pos = offset + length
+        except Exception:
+            continue
+
+    while open_tags:
+        result.append(open_tags.pop()['close_tag'])
+    if current_pos < len(text):
+        result.append(text[current_pos:])
+    return ''.join(result)
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode('utf-16-le')) // 2
+
+
+def make_text(rng: random.Random, words: int) -> tuple[str, list]:
+    """Текст і межі слів як (початок, кінець) у UTF-16, як їх рахує Telegram."""
+    parts, bounds, position = [], [], 0
+    for i in range(words):
+        if i:
+            parts.append(" ")
+            position += 1
+        word = rng.choice(WORDS)
+        bounds.append((position, position + utf16_len(word)))
+        parts.append(word)
+        position += utf16_len(word)
+    return "".join(parts), bounds
+
+
+def make_entity(rng: random.Random, entity_type: str, offset: int, length: int) -> MessageEntity:
+    if entity_type == "text_link":
+        return MessageEntity(type="text_link", offset=offset, length=length, url=f"https://example.com/{rng.randrange(1000)}")
+    if entity_type == "custom_emoji":
+        return MessageEntity(type="custom_emoji", offset=offset, length=length, custom_emoji_id=str(rng.randrange(10 ** 18)))
+    return MessageEntity(type=entity_type, offset=offset, length=length)
+
+
+def flat_case(rng: random.Random, words: int, entities: int):
+    """Сутності не перетинаються; група на одному діапазоні — лише там, де за нею одразу йде наступна або кінець."""
+    text, bounds = make_text(rng, words)
+    chosen = sorted(rng.sample(range(len(bounds)), min(entities, len(bounds))))
+    result = []
+    for position, index in enumerate(chosen):
+        start, end = bounds[index]
+        next_start = bounds[chosen[position + 1]][0] if position + 1 < len(chosen) else None
+        group_allowed = next_start is None or next_start == end
+        kinds = rng.sample(STYLE_TYPES + ["text_link"], rng.randint(2, 3) if group_allowed and rng.random() < 0.4 else 1)
+        result.extend(make_entity(rng, kind, start, end - start) for kind in kinds)
+    rng.shuffle(result)
+    return text, result
+
+
+def nested_case(rng: random.Random, words: int, entities: int):
+    """Довільні вкладені та перехресні діапазони по межах слів."""
+    text, bounds = make_text(rng, words)
+    result = []
+    for _ in range(entities):
+        first = rng.randrange(len(bounds))
+        last = min(len(bounds) - 1, first + rng.randint(0, 6))
+        start, end = bounds[first][0], bounds[last][1]
+        result.append(make_entity(rng, rng.choice(STYLE_TYPES + ["text_link", "blockquote"]), start, end - start))
+    return text, result
+
+
+_TAG = re.compile(r"<(/?)([a-z-]+)[^>]*>")
+
+
+def check_well_formed(text: str, html: str) -> bool:
+    if _TAG.sub("", html) != text:
+        return False
+    stack = []
+    for closing, name in _TAG.findall(html):
+        if not closing:
+            stack.append(name)
+        elif not stack or stack.pop() != name:
+            return False
+    return not stack
+
+
+def run(args):
+    rng = random.Random(args.seed)
+
+    mismatches = 0
+    for _ in range(args.cases):
+        text, entities = flat_case(rng, rng.randint(5, 120), rng.randint(1, 40))
+        if format_entities(text, entities) != legacy_format_entities(text, entities):
+            mismatches += 1
+            if mismatches == 1:
+                print("Розбіжність:", text, entities, sep="\n")
+    print(f"Еквівалентність (окремі сутності та групи): {args.cases - mismatches}/{args.cases} збігів")
+
+    broken = legacy_broken = 0
+    for _ in range(args.cases):
+        text, entities = nested_case(rng, rng.randint(5, 120), rng.randint(1, 30))
+        broken += not check_well_formed(text, format_entities(text, entities))
+        legacy_broken += not check_well_formed(text, legacy_format_entities(text, entities))
+    print(f"Вкладені/перехресні: некоректний HTML — новий рендер {broken}, попередній {legacy_broken} з {args.cases}")
+
+    print(f"\n{'Набір':<36}{'попередній, мс':>16}{'новий, мс':>12}")
+    benchmarks = (
+        ("промо-пост, 100 сутностей", flat_case(rng, 700, 100)),
+        ("промо-пост, вкладені, 100", nested_case(rng, 700, 100)),
+        (f"стрес, {args.entities * 10} сутностей", flat_case(rng, args.entities * 30, args.entities * 10)),
+    )
+    for title, (text, entities) in benchmarks:
+        number = max(1, args.repeat // max(1, len(entities) // 100))
+        legacy = timeit.timeit(lambda: legacy_format_entities(text, entities), number=number) / number
+        current = timeit.timeit(lambda: format_entities(text, entities), number=number) / number
+        print(f"{title:<36}{legacy * 1000:>16.2f}{current * 1000:>12.2f}")
+
+    return 1 if mismatches or broken else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Еквівалентність і швидкодія format_entities")
+    parser.add_argument("--cases", type=int, default=2000, help="випадкових повідомлень на кожну перевірку")
+    parser.add_argument("--entities", type=int, default=100, help="база розміру стрес-набору")
+    parser.add_argument("--repeat", type=int, default=50, help="повторів для бенчмарку")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
@@ -22,4 +22,15 @@ BOT_DIR = os.path.dirname(os.path.abspath(__file__))
 CATALOG_IMAGE_PATH = os.path.join(BOT_DIR, 'Content', 'catalog.png')
 
 # Директорія для збереження фото товарів (абсолютний шлях)
-CONTENT_PRODUCTS_DIR = os.path.join(BOT_DIR, 'Content', 'products')
\ No newline at end of file
+CONTENT_PRODUCTS_DIR = os.path.join(BOT_DIR, 'Content', 'products')
+
+# Read-only копія бази для адмінських звітів (оновлюється backup API), щоб довгі вибірки не тримали блокування основного файлу
+ANALYTICS_DB_PATH = os.getenv('ANALYTICS_DATABASE_PATH') or os.path.splitext(DB_PATH)[0] + '_analytics.db'
+
+# Архів розрахованих платежів: місячні файли JSONL.gz. Горизонт не менше 60 днів — місячна статистика та звірка з випискою (31 доба) працюють лише з гарячими таблицями
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR') or os.path.join(os.path.dirname(DB_PATH), 'archive')
+ARCHIVE_AFTER_DAYS = max(60, int(os.getenv('ARCHIVE_AFTER_DAYS', '180')))
+
+# Вікно зведення адмін-повідомлень (секунди): продажі, автосписання та скасування за вікно приходять одним дайджестом.
+# 0 — кожна подія окремим повідомленням. Події, що потребують дії адміна, надсилаються одразу
+ADMIN_DIGEST_WINDOW = max(0, int(os.getenv('ADMIN_DIGEST_WINDOW', '300')))
\ No newline at end of file
@@ -1,6 +1,7 @@
 import sqlite3
 
 from config import DB_PATH
+from database.analytics_db import analytics_cursor
 
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
@@ -154,108 +155,119 @@ def get_product_payment_type(product_id: int) -> str:
 
 def get_admin_subscriptions_stats():
     """Отримує статистику підписок для адміна"""
+    reader = analytics_cursor() or cursor
     try:
         stats = {}
         
         # Користувачі
-        cursor.execute("SELECT COUNT(*) FROM users")
-        stats['total_users'] = cursor.fetchone()[0]
+        reader.execute("SELECT COUNT(*) FROM users")
+        stats['total_users'] = reader.fetchone()[0]
         
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*) FROM users 
             WHERE DATE(join_date) = DATE('now', 'localtime')
         """)
-        stats['new_users_today'] = cursor.fetchone()[0]
+        stats['new_users_today'] = reader.fetchone()[0]
         
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*) FROM users 
             WHERE DATE(join_date) >= DATE('now', 'localtime', '-7 days')
         """)
-        stats['new_users_week'] = cursor.fetchone()[0]
+        stats['new_users_week'] = reader.fetchone()[0]
         
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*) FROM users 
             WHERE DATE(join_date) >= DATE('now', 'localtime', 'start of month')
         """)
-        stats['new_users_month'] = cursor.fetchone()[0]
+        stats['new_users_month'] = reader.fetchone()[0]
         
         # Товари
-        cursor.execute("SELECT COUNT(*) FROM products")
-        stats['total_products'] = cursor.fetchone()[0]
+        reader.execute("SELECT COUNT(*) FROM products")
+        stats['total_products'] = reader.fetchone()[0]
         
         # Загальна кількість підписок
-        cursor.execute("SELECT COUNT(*) FROM subscriptions")
-        stats['total_simple_subscriptions'] = cursor.fetchone()[0]
+        reader.execute("SELECT COUNT(*) FROM subscriptions")
+        stats['total_simple_subscriptions'] = reader.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) FROM recurring_subscriptions")
-        stats['total_recurring_subscriptions'] = cursor.fetchone()[0]
+        reader.execute("SELECT COUNT(*) FROM recurring_subscriptions")
+        stats['total_recurring_subscriptions'] = reader.fetchone()[0]
         
         # Активні підписки
-        cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE status = 'active'")
-        stats['active_simple_subscriptions'] = cursor.fetchone()[0]
+        reader.execute("SELECT COUNT(*) FROM subscriptions WHERE status = 'active'")
+        stats['active_simple_subscriptions'] = reader.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) FROM recurring_subscriptions WHERE status = 'active'")
-        stats['active_recurring_subscriptions'] = cursor.fetchone()[0]
+        reader.execute("SELECT COUNT(*) FROM recurring_subscriptions WHERE status = 'active'")
+        stats['active_recurring_subscriptions'] = reader.fetchone()[0]
         
         # Статистика платежів за сьогодні
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*), COALESCE(SUM(amount), 0) 
             FROM payments 
             WHERE status = 'success' AND DATE(created_at) = DATE('now', 'localtime')
         """)
-        today_payments = cursor.fetchone()
+        today_payments = reader.fetchone()
         stats['today_payments_count'] = today_payments[0]
         stats['today_revenue'] = today_payments[1]
         
         # Статистика автоматичних платежів за сьогодні
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*), COALESCE(SUM(amount), 0) 
             FROM subscription_payments 
             WHERE status = 'success' AND DATE(payment_date) = DATE('now', 'localtime')
         """)
-        today_auto_payments = cursor.fetchone()
+        today_auto_payments = reader.fetchone()
         stats['today_auto_payments_count'] = today_auto_payments[0]
         stats['today_auto_revenue'] = today_auto_payments[1]
         
         # Статистика за місяць
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*), COALESCE(SUM(amount), 0) 
             FROM payments 
             WHERE status = 'success' AND DATE(created_at) >= DATE('now', 'localtime', 'start of month')
         """)
-        month_payments = cursor.fetchone()
+        month_payments = reader.fetchone()
         stats['month_payments_count'] = month_payments[0]
         stats['month_revenue'] = month_payments[1]
         
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*), COALESCE(SUM(amount), 0) 
             FROM subscription_payments 
             WHERE status = 'success' AND DATE(payment_date) >= DATE('now', 'localtime', 'start of month')
         """)
-        month_auto_payments = cursor.fetchone()
+        month_auto_payments = reader.fetchone()
         stats['month_auto_payments_count'] = month_auto_payments[0]
         stats['month_auto_revenue'] = month_auto_payments[1]
         
         # Невдалі платежі сьогодні
-        cursor.execute("""
+        reader.execute("""
             SELECT COUNT(*) 
             FROM subscription_payments 
             WHERE status = 'failed' AND DATE(payment_date) = DATE('now', 'localtime')
         """)
-        stats['today_failed_payments'] = cursor.fetchone()[0]
+        stats['today_failed_payments'] = reader.fetchone()[0]
         
         # Загальний дохід (всього часу)
-        cursor.execute("""
+        reader.execute("""
             SELECT COALESCE(SUM(amount), 0) FROM payments 
             WHERE status = 'success'
         """)
-        stats['total_revenue'] = cursor.fetchone()[0]
+        stats['total_revenue'] = reader.fetchone()[0]
         
-        cursor.execute("""
+        reader.execute("""
             SELECT COALESCE(SUM(amount), 0) FROM subscription_payments 
             WHERE status = 'success'
         """)
-        stats['total_auto_revenue'] = cursor.fetchone()[0]
+        stats['total_auto_revenue'] = reader.fetchone()[0]
+
+        # Рядки, перенесені в архів, враховуються через їхні підсумки
+        reader.execute("""
+            SELECT table_name, COALESCE(SUM(amount), 0) FROM archive_totals
+            WHERE status = 'success' AND table_name IN ('payments', 'subscription_payments')
+            GROUP BY table_name
+        """)
+        archived = dict(reader.fetchall())
+        stats['total_revenue'] += archived.get('payments', 0)
+        stats['total_auto_revenue'] += archived.get('subscription_payments', 0)
         
         return stats
         
@@ -265,7 +277,7 @@ def get_admin_subscriptions_stats():
 
 
 def get_all_subscriptions_for_admin():
-    """Отримує всі підписки для адміна"""
+    """Отримує всі підписки для адміна (з основної бази: після активації/деактивації список одразу актуальний)"""
     try:
         subscriptions = []
         
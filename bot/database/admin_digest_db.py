@@ -0,0 +1,54 @@
+import json
+import sqlite3
+import time
+
+from database.client_db import cursor, _commit
+
+
+def create_admin_digest_table():
+    """Адмін-події, що чекають на зведене повідомлення (дайджест) в адмін-чат"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS admin_digest_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                amount REAL NOT NULL DEFAULT 0,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT UNIQUE,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці admin_digest_events: {e}")
+
+
+def add_admin_digest_event(kind: str, summary: str, amount: float, payload: dict, dedupe_key: str = None) -> bool:
+    """Додає подію до наступного дайджесту; всередині transaction() фіксується разом зі зміною стану. False — дублікат."""
+    cursor.execute("""
+        INSERT OR IGNORE INTO admin_digest_events (kind, summary, amount, payload, dedupe_key, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (kind, summary, amount or 0, json.dumps(payload, ensure_ascii=False), dedupe_key, int(time.time())))
+    added = cursor.rowcount > 0
+    _commit()
+    return added
+
+
+def get_admin_digest_events() -> list:
+    """Події в порядку надходження: [(id, kind, summary, amount, payload dict, created_at)]"""
+    try:
+        cursor.execute("SELECT id, kind, summary, amount, payload, created_at FROM admin_digest_events ORDER BY id")
+        return [
+            (event_id, kind, summary, amount, json.loads(payload), created_at)
+            for event_id, kind, summary, amount, payload, created_at in cursor.fetchall()
+        ]
+    except sqlite3.Error as e:
+        print(f"Помилка при вибірці подій дайджесту: {e}")
+        return []
+
+
+def delete_admin_digest_events(max_id: int):
+    """Видаляє події, що увійшли в дайджест (до max_id включно); пізніші чекають наступного вікна."""
+    cursor.execute("DELETE FROM admin_digest_events WHERE id <= ?", (max_id,))
+    _commit()
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+from config import DB_PATH, ANALYTICS_DB_PATH
+
+# Скільки сторінок копіюється за крок і пауза між кроками: між кроками основна база вільна для записів
+ANALYTICS_BACKUP_PAGES = 256
+ANALYTICS_BACKUP_SLEEP = 0.01
+# Якщо під час копіювання основну базу змінюють, SQLite починає заново; після цього ліміту лишаємо попередню копію
+ANALYTICS_BACKUP_TIMEOUT = 120
+ANALYTICS_REFRESH_INTERVAL = 300
+
+_conn = None
+_snapshot_at = None
+
+
+def build_analytics_snapshot():
+    """Копіює основну базу кроками backup API у тимчасовий файл і атомарно підміняє копію. Виконується в окремому потоці."""
+    temp_path = f"{ANALYTICS_DB_PATH}.{os.getpid()}.tmp"
+    started = time.monotonic()
+
+    def progress(status, remaining, total):
+        if time.monotonic() - started > ANALYTICS_BACKUP_TIMEOUT:
+            raise TimeoutError(f"копіювання не завершилось за {ANALYTICS_BACKUP_TIMEOUT} с")
+
+    # Власні з'єднання: функція працює поза потоком, у якому відкриті з'єднання модулів
+    source = sqlite3.connect(DB_PATH)
+    target = sqlite3.connect(temp_path)
+    try:
+        source.backup(target, pages=ANALYTICS_BACKUP_PAGES, progress=progress, sleep=ANALYTICS_BACKUP_SLEEP)
+    except Exception:
+        target.close()
+        os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(temp_path, ANALYTICS_DB_PATH)
+
+
+def open_analytics_snapshot():
+    """Перевідкриває з'єднання на свіжу копію (старе з'єднання дивиться на замінений файл)."""
+    global _conn, _snapshot_at
+    if not os.path.isfile(ANALYTICS_DB_PATH):
+        return
+    try:
+        conn = sqlite3.connect(f"file:{ANALYTICS_DB_PATH}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        print(f"Помилка при відкритті аналітичної копії бази: {e}")
+        return
+    if _conn is not None:
+        _conn.close()
+    _conn = conn
+    _snapshot_at = datetime.fromtimestamp(os.path.getmtime(ANALYTICS_DB_PATH))
+
+
+def analytics_cursor():
+    """Курсор на read-only копію для звітів; None, поки копії немає (тоді звіт читає основну базу)."""
+    if _conn is None:
+        return None
+    return _conn.cursor()
+
+
+def get_analytics_snapshot_time():
+    """Час, станом на який зібрана копія, або None."""
+    return _snapshot_at if _conn is not None else None
+
+
+def close_analytics_snapshot():
+    global _conn
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+
+
+
+def connect_analytics_reader() -> sqlite3.Connection:
+    """Нове read-only з'єднання на копію (без копії — на основну базу) для читання в окремому потоці."""
+    path = ANALYTICS_DB_PATH if os.path.isfile(ANALYTICS_DB_PATH) else DB_PATH
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
@@ -0,0 +1,205 @@
+import gzip
+import json
+import os
+import sqlite3
+from datetime import date, timedelta
+
+from config import ARCHIVE_DIR
+from database.client_db import cursor, _commit, transaction
+
+# Таблиці, історію яких читає iter_history, і колонка дати періоду (вона ж ділить архів на місяці)
+HISTORY_TABLES = {
+    "payments": "created_at",
+    "subscription_payments": "payment_date",
+    "subscriptions": "start_date",
+    "recurring_subscriptions": "created_at",
+    "partner_earnings": "created_at",
+}
+# Таблиці з архівом -> (ключ, умова «рядок розраховано», колонка суми)
+ARCHIVE_TABLES = {
+    "payments": ("invoice_id", "status != 'pending'", "amount"),
+    "subscription_payments": ("id", "status != 'processing'", "amount"),
+    "partner_earnings": ("id", "1 = 1", "credit_amount"),
+}
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def create_archive_tables():
+    """Підсумки заархівованих рядків по місяцях і статусах (для загальних сум без читання архіву)"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archive_totals (
+                table_name TEXT NOT NULL,
+                month TEXT NOT NULL,
+                status TEXT NOT NULL,
+                rows INTEGER NOT NULL DEFAULT 0,
+                amount REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, month, status)
+            ) WITHOUT ROWID
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці archive_totals: {e}")
+
+
+def _partition_path(table: str, month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, table, f"{month}.jsonl.gz")
+
+
+def select_archive_batch(table: str, cutoff: str, limit: int = ARCHIVE_BATCH_SIZE) -> list:
+    """
+    Розраховані рядки, старші за cutoff (РРРР-ММ-ДД), як dict.
+    Рядок з найбільшим rowid не архівується ніколи: інакше SQLite повторно видасть його id новому рядку.
+    """
+    settled = ARCHIVE_TABLES[table][1]
+    date_column = HISTORY_TABLES[table]
+    try:
+        cursor.execute(f"""
+            SELECT * FROM {table}
+            WHERE {date_column} < ? AND {settled}
+            AND rowid < (SELECT MAX(rowid) FROM {table})
+            ORDER BY rowid
+            LIMIT ?
+        """, (cutoff, limit))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Помилка при вибірці рядків {table} для архіву: {e}")
+        return []
+
+
+def write_archive_partition(table: str, month: str, records: list):
+    """
+    Дописує рядки в місячний файл: старий вміст переписується потоково в тимчасовий файл разом з новими
+    рядками, і файл атомарно підміняється — обірваний запис ніколи не псує архів. Без звернень до БД.
+    """
+    path = _partition_path(table, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            if os.path.isfile(path):
+                with gzip.open(path, "rb") as existing:
+                    for line in existing:
+                        archive.write(line)
+            for record in records:
+                archive.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temp_path, path)
+
+
+def delete_archived_rows(table: str, month: str, records: list) -> int:
+    """Видаляє записані в архів рядки і додає їх до archive_totals однією транзакцією."""
+    key, settled, amount_column = ARCHIVE_TABLES[table]
+    totals = {}
+    for record in records:
+        status = record.get("status") or ""
+        rows, amount = totals.get(status, (0, 0.0))
+        totals[status] = (rows + 1, amount + float(record.get(amount_column) or 0))
+    with transaction():
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE {key} = ? AND {settled}",
+            [(record[key],) for record in records],
+        )
+        cursor.executemany("""
+            INSERT INTO archive_totals (table_name, month, status, rows, amount)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(table_name, month, status) DO UPDATE SET
+                rows = rows + excluded.rows,
+                amount = amount + excluded.amount
+        """, [(table, month, status, rows, amount) for status, (rows, amount) in totals.items()])
+    return len(records)
+
+
+def purge_payments_temp_data(older_than_hours: int = 24) -> int:
+    """Видаляє тимчасові дані рахунків, які вже не pending (або яких немає): після розрахунку вони не читаються."""
+    try:
+        cursor.execute("""
+            DELETE FROM payments_temp_data
+            WHERE created_at < datetime('now', ?)
+            AND NOT EXISTS (
+                SELECT 1 FROM payments p
+                WHERE p.invoice_id = payments_temp_data.invoice_id AND p.status = 'pending'
+            )
+        """, (f"-{older_than_hours} hours",))
+        deleted = cursor.rowcount
+        _commit()
+        return deleted
+    except sqlite3.Error as e:
+        print(f"Помилка при очищенні payments_temp_data: {e}")
+        return 0
+
+
+def expire_abandoned_pending_payments(older_than_days: int) -> int:
+    """Pending-рахунки, старші за вікно виписки: їх уже не закриє ні опитування, ні звірка."""
+    try:
+        cursor.execute("""
+            UPDATE payments SET status = 'expired', updated_at = datetime('now')
+            WHERE status = 'pending' AND created_at < datetime('now', ?)
+        """, (f"-{older_than_days} days",))
+        expired = cursor.rowcount
+        _commit()
+        return expired
+    except sqlite3.Error as e:
+        print(f"Помилка при закритті завислих pending-рахунків: {e}")
+        return 0
+
+
+def _months_between(date_from: date, date_to: date) -> list:
+    months = []
+    current = date_from.replace(day=1)
+    while current <= date_to:
+        months.append(f"{current:%Y-%m}")
+        current = (current + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def iter_archived_rows(table: str, date_from: date, date_to: date):
+    """Рядки з місячних файлів архіву, що потрапляють у період [date_from, date_to], як dict."""
+    if table not in ARCHIVE_TABLES:
+        return
+    date_column = HISTORY_TABLES[table]
+    lower, upper = date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()
+    for month in _months_between(date_from, date_to):
+        path = _partition_path(table, month)
+        if not os.path.isfile(path):
+            continue
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            for line in archive:
+                record = json.loads(line)
+                value = record.get(date_column) or ""
+                if lower <= value < upper:
+                    yield record
+
+
+def iter_history(table: str, date_from: date, date_to: date, reader: sqlite3.Connection, batch_size: int = 500):
+    """
+    Єдине читання історії таблиці за період: гарячі рядки через reader (fetchmany), далі архів.
+    Перший елемент — назви колонок; рядок, що є і в гарячій таблиці, і в архіві (або двічі в архіві
+    після обірваного запуску архівації), віддається один раз.
+    """
+    date_column = HISTORY_TABLES[table]
+    key = ARCHIVE_TABLES[table][0] if table in ARCHIVE_TABLES else None
+    hot = reader.execute(
+        f"SELECT * FROM {table} WHERE {date_column} >= ? AND {date_column} < ? ORDER BY rowid",
+        (date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()),
+    )
+    columns = [column[0] for column in hot.description]
+    yield columns
+    key_index = columns.index(key) if key else None
+    seen = set()
+    while True:
+        rows = hot.fetchmany(batch_size)
+        if not rows:
+            break
+        if key_index is not None:
+            seen.update(row[key_index] for row in rows)
+        yield from rows
+    if key is None:
+        return
+    for record in iter_archived_rows(table, date_from, date_to):
+        if record.get(key) in seen:
+            continue
+        seen.add(record.get(key))
+        yield tuple(record.get(column) for column in columns)
@@ -1,12 +1,51 @@
+import calendar
 import sqlite3
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 import pytz
 
 from config import DB_PATH
+from database.settings_db import get_setting, set_setting
+from database.links_db import track_link_registration
+from database.analytics_db import analytics_cursor
 
 conn = sqlite3.connect(DB_PATH)
 cursor = conn.cursor()
 
+_transaction_depth = 0
+
+
+@contextmanager
+def transaction():
+    """Атомарний блок записів (BEGIN IMMEDIATE); вкладені виклики приєднуються до зовнішньої транзакції"""
+    global _transaction_depth
+    if _transaction_depth:
+        _transaction_depth += 1
+        try:
+            yield cursor
+        finally:
+            _transaction_depth -= 1
+        return
+    if conn.in_transaction:
+        conn.commit()
+    cursor.execute("BEGIN IMMEDIATE")
+    _transaction_depth = 1
+    try:
+        yield cursor
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _transaction_depth = 0
+
+
+def _commit():
+    """Фіксує зміни, якщо виклик не всередині transaction() — тоді фіксує зовнішній блок"""
+    if not _transaction_depth:
+        conn.commit()
+
 def create_table():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -18,7 +57,7 @@ def create_table():
             discounts INTEGER DEFAULT 0
         )
     ''')
-    conn.commit()
+    _commit()
     
     
 def create_products_table():
@@ -34,7 +73,7 @@ def create_products_table():
             payment_type TEXT DEFAULT 'one'
         )
     ''')
-    conn.commit()
+    _commit()
 
 
 def create_catalog_images_table():
@@ -45,7 +84,7 @@ def create_catalog_images_table():
             image_path TEXT NOT NULL
         )
     ''')
-    conn.commit()
+    _commit()
 
 
 def migrate_products_table():
@@ -56,7 +95,7 @@ def migrate_products_table():
         
         if 'payment_type' not in columns:
             cursor.execute("ALTER TABLE products ADD COLUMN payment_type TEXT DEFAULT 'one'")
-            conn.commit()
+            _commit()
             print("Поле payment_type успішно додано до таблиці products")
         else:
             print("Поле payment_type вже існує в таблиці products")
@@ -73,7 +112,7 @@ def create_contest_table():
             invite_date TEXT
         )
     ''')
-    conn.commit()
+    _commit()
     
     
     
@@ -92,7 +131,7 @@ def migrate_users_marketing_link():
     columns = {column[1] for column in cursor.fetchall()}
     if "marketing_link_id" not in columns:
         cursor.execute("ALTER TABLE users ADD COLUMN marketing_link_id INTEGER")
-        conn.commit()
+        _commit()
 
 
 def get_marketing_link_id_by_user(user_id: int):
@@ -104,30 +143,79 @@ def get_marketing_link_id_by_user(user_id: int):
     return row[0] if row and row[0] is not None else None
 
 
+# Кеш відомих користувачів: повторний /start не ходить у БД
+_known_users: set[int] = set()
+
+
+def create_users_index():
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)")
+    _commit()
+
+
+def create_profile_indexes():
+    """Індекси для запиту кабінету (get_user_profile_rows)."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_user_id ON subscriptions(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recurring_subscriptions_user_id ON recurring_subscriptions(user_id)")
+    _commit()
+
+
+def load_known_users():
+    """Прогріває кеш відомих користувачів одним запитом (на старті бота)."""
+    try:
+        cursor.execute("SELECT user_id FROM users")
+        _known_users.update(int(row[0]) for row in cursor.fetchall() if row[0] is not None)
+    except sqlite3.Error as e:
+        print(f"Помилка завантаження користувачів: {e}")
+
+
+def register_user(user_id: int, user_name: str, ref_id=None, marketing_link_id=None, contest_ref_id=None) -> bool:
+    """
+    Реєстрація за одну транзакцію: вставка користувача (якщо його ще немає) та запис конкурсу — один commit.
+    Лічильники маркетингового посилання йдуть у буфер links_db після успішної реєстрації.
+    Повертає True, якщо користувача створено.
+    """
+    current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        if marketing_link_id:
+            cursor.execute("SELECT 1 FROM links WHERE id = ?", (marketing_link_id,))
+            if cursor.fetchone() is None:
+                marketing_link_id = None
+        cursor.execute("""
+            INSERT INTO users (user_id, user_name, ref_id, join_date, marketing_link_id)
+            SELECT ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM users WHERE user_id = ?)
+        """, (user_id, user_name, ref_id, current_date, marketing_link_id, user_id))
+        if cursor.rowcount == 0:
+            conn.rollback()
+            _known_users.add(user_id)
+            return False
+        if contest_ref_id:
+            cursor.execute("""
+                INSERT INTO contest (user_id, invite_id, invite_date)
+                VALUES (?, ?, datetime('now'))
+            """, (user_id, contest_ref_id))
+        _commit()
+        _known_users.add(user_id)
+        if marketing_link_id:
+            track_link_registration(marketing_link_id, user_id)
+        print(f"User {user_id} added successfully")
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Помилка реєстрації користувача {user_id}: {e}")
+        return False
+
+
 def add_user(user_id, user_name, ref_id, marketing_link_id=None):
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    existing_user = cursor.fetchone()
-    if existing_user is None:
-        current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        try:
-            cursor.execute('''
-                INSERT INTO users (user_id, user_name, ref_id, join_date, marketing_link_id)
-                VALUES (?, ?, ?, ?, ?)
-                ''', (user_id, user_name, ref_id, current_date, marketing_link_id))
-            conn.commit()
-            if marketing_link_id:
-                from database.links_db import link_exists, increment_link_registrations
-                if link_exists(marketing_link_id):
-                    increment_link_registrations(marketing_link_id)
-            print(f"User {user_id} added successfully")  # Логування
-        except Exception as e:
-            print(f"Error inserting user: {e}")  # Вивід помилки
+    register_user(user_id, user_name, ref_id, marketing_link_id)
 
         
 def check_user(user_id):
-    cursor.execute(f'SELECT * FROM users WHERE user_id = {user_id}')
-    user = cursor.fetchone()
-    if user:
+    if user_id in _known_users:
+        return True
+    cursor.execute("SELECT 1 FROM users WHERE user_id = ? LIMIT 1", (user_id,))
+    if cursor.fetchone():
+        _known_users.add(user_id)
         return True
     return False
 
@@ -175,21 +263,71 @@ def create_payments_table():
             updated_at DATETIME
         )
     ''')
-    conn.commit()
+    _commit()
 
-def save_payment_info(payment_id: str, invoice_id: str, user_id: int, product_id: int, months: int, amount: float, status: str, payment_type: str = 'one_time') -> bool:
+def save_payment_info(payment_id: str, invoice_id: str, user_id: int, product_id: int, months: int, amount: float, status: str, payment_type: str = 'one_time',
+                      page_url: str = None, validity_seconds: int = None) -> bool:
     try:
         cursor.execute("""
             INSERT INTO payments (
-                payment_id, invoice_id, user_id, product_id, months, amount, status, payment_type, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-        """, (payment_id, invoice_id, user_id, product_id, months, amount, status, payment_type))
-        conn.commit()
+                payment_id, invoice_id, user_id, product_id, months, amount, status, payment_type, created_at,
+                page_url, expires_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?,
+                      CASE WHEN ? IS NULL THEN NULL ELSE datetime('now', '+' || ? || ' seconds') END)
+        """, (payment_id, invoice_id, user_id, product_id, months, amount, status, payment_type,
+              page_url, validity_seconds, validity_seconds))
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при збереженні платежу: {e}")
         return False
 
+
+def find_reusable_payment(user_id: int, product_id: int, months: int, amount: float, payment_type: str,
+                          min_remaining_minutes: int = 5) -> tuple | None:
+    """Ще дійсний pending-рахунок на той самий тариф: (payment_id, invoice_id, page_url) або None."""
+    try:
+        cursor.execute("""
+            SELECT payment_id, invoice_id, page_url
+            FROM payments
+            WHERE user_id = ? AND product_id = ? AND status = 'pending'
+            AND months = ? AND ABS(amount - ?) < 0.005 AND payment_type = ?
+            AND page_url IS NOT NULL
+            AND expires_at > datetime('now', ?)
+            ORDER BY created_at DESC
+            LIMIT 1
+        """, (user_id, product_id, months, amount, payment_type, f'+{min_remaining_minutes} minutes'))
+        return cursor.fetchone()
+    except sqlite3.Error as e:
+        print(f"Помилка при пошуку рахунку для повторного використання: {e}")
+        return None
+
+
+def get_superseded_payments(user_id: int, product_id: int, keep_invoice_id: str) -> list:
+    """Інші pending-рахунки користувача на цей товар, які замінив новий рахунок."""
+    try:
+        cursor.execute("""
+            SELECT invoice_id FROM payments
+            WHERE user_id = ? AND product_id = ? AND status = 'pending' AND invoice_id != ?
+        """, (user_id, product_id, keep_invoice_id))
+        return [row[0] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні застарілих рахунків: {e}")
+        return []
+
+
+def save_payment_temp_data(invoice_id: str, wallet_id: str, payment_type: str, local_payment_id: str) -> bool:
+    try:
+        cursor.execute("""
+            INSERT OR REPLACE INTO payments_temp_data (invoice_id, wallet_id, payment_type, local_payment_id)
+            VALUES (?, ?, ?, ?)
+        """, (invoice_id, wallet_id, payment_type, local_payment_id))
+        _commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Помилка при збереженні тимчасових даних платежу: {e}")
+        return False
+
 def get_payment_info(invoice_id: str) -> tuple:
     try:
         cursor.execute("""
@@ -209,12 +347,128 @@ def update_payment_status(invoice_id: str, status: str) -> bool:
             SET status = ?, updated_at = datetime('now')
             WHERE invoice_id = ?
         """, (status, invoice_id))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при оновленні статусу платежу: {e}")
         return False
 
+def get_due_pending_payments(now_ts: int, limit: int = 100):
+    """Pending-рахунки, час перевірки яких настав (індекс idx_payments_pending_due)."""
+    try:
+        cursor.execute("""
+            SELECT invoice_id, user_id, product_id, months, amount, payment_type,
+                   CAST(strftime('%s', created_at) AS INTEGER), check_count
+            FROM payments
+            WHERE status = 'pending' AND next_check_at <= ?
+            ORDER BY next_check_at
+            LIMIT ?
+        """, (now_ts, limit))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні pending платежів: {e}")
+        return []
+
+
+def schedule_payment_check(invoice_id: str, next_check_at: int, last_status: str) -> bool:
+    """Записує результат перевірки та час наступної."""
+    try:
+        cursor.execute("""
+            UPDATE payments
+            SET next_check_at = ?, check_count = COALESCE(check_count, 0) + 1, last_status = ?
+            WHERE invoice_id = ?
+        """, (next_check_at, last_status, invoice_id))
+        _commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Помилка при плануванні перевірки платежу: {e}")
+        return False
+
+
+def claim_payment_success(invoice_id: str) -> bool:
+    """Атомарно переводить pending-рахунок у success; False — рахунок уже оброблено іншим шляхом."""
+    try:
+        cursor.execute("""
+            UPDATE payments
+            SET status = 'success', updated_at = datetime('now')
+            WHERE invoice_id = ? AND status = 'pending'
+        """, (invoice_id,))
+        _commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Помилка при оновленні статусу платежу: {e}")
+        return False
+
+
+def get_stale_pending_payments(older_than_ts: int) -> list:
+    """Pending-рахунки, створені раніше older_than_ts (для звірки з випискою)."""
+    try:
+        cursor.execute("""
+            SELECT invoice_id, user_id, product_id, months, amount, payment_type,
+                   CAST(strftime('%s', created_at) AS INTEGER)
+            FROM payments
+            WHERE status = 'pending' AND created_at < datetime(?, 'unixepoch')
+        """, (older_than_ts,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні pending платежів: {e}")
+        return []
+
+
+def get_stale_processing_charges(older_than_ts: int) -> list:
+    """Списання по токену, що зависли в processing (id, subscription_id, user_id, invoice_id, product_name, months, price, created)."""
+    try:
+        cursor.execute("""
+            SELECT sp.id, sp.subscription_id, sp.user_id, sp.invoice_id, rs.product_name, rs.months, rs.price,
+                   CAST(strftime('%s', sp.created_at) AS INTEGER)
+            FROM subscription_payments sp
+            JOIN recurring_subscriptions rs ON sp.subscription_id = rs.id
+            WHERE sp.status = 'processing' AND sp.invoice_id IS NOT NULL
+            AND sp.created_at < datetime(?, 'unixepoch')
+        """, (older_than_ts,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні processing платежів: {e}")
+        return []
+
+
+def get_local_payment_states(invoice_ids: list) -> dict:
+    """invoice_id -> (джерело, статус, сума) з payments та subscription_payments."""
+    states = {}
+    invoice_ids = list(invoice_ids)
+    try:
+        for start in range(0, len(invoice_ids), 500):
+            chunk = invoice_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"""
+                SELECT invoice_id, 'payments', status, amount FROM payments WHERE invoice_id IN ({placeholders})
+                UNION ALL
+                SELECT invoice_id, 'subscription_payments', status, amount FROM subscription_payments
+                WHERE invoice_id IN ({placeholders})
+            """, chunk + chunk)
+            for invoice_id, source, status, amount in cursor.fetchall():
+                states[invoice_id] = (source, status, amount)
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні статусів платежів: {e}")
+    return states
+
+
+def create_reconciliation_indexes():
+    """Індекси для звірки subscription_payments з випискою за invoice_id"""
+    try:
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_subscription_payments_invoice
+            ON subscription_payments(invoice_id)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_subscription_payments_processing
+            ON subscription_payments(created_at) WHERE status = 'processing'
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні індексів subscription_payments: {e}")
+
+
 def get_pending_payments(hours: int = 24):
     try:
         cursor.execute("""
@@ -242,7 +496,7 @@ def create_subscriptions_table():
             status TEXT
         )
     ''')
-    conn.commit()
+    _commit()
 
 
 def create_user_tokens_table():
@@ -260,7 +514,7 @@ def create_user_tokens_table():
             is_active INTEGER DEFAULT 1
         )
     ''')
-    conn.commit()
+    _commit()
 
 
 def create_recurring_subscriptions_table():
@@ -282,7 +536,91 @@ def create_recurring_subscriptions_table():
             FOREIGN KEY (wallet_id) REFERENCES user_tokens(wallet_id)
         )
     ''')
-    conn.commit()
+    _commit()
+
+
+def migrate_recurring_next_payment_ts():
+    """Нормалізований час наступного списання (next_payment_ts) з індексом для вибірки білінгу"""
+    try:
+        cursor.execute("PRAGMA table_info(recurring_subscriptions)")
+        columns = {column[1] for column in cursor.fetchall()}
+        if 'next_payment_ts' not in columns:
+            cursor.execute("ALTER TABLE recurring_subscriptions ADD COLUMN next_payment_ts INTEGER")
+        # Тригери тримають колонку в актуальному стані і для записів вебдодатку
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_recurring_next_payment_ts_insert
+            AFTER INSERT ON recurring_subscriptions
+            BEGIN
+                UPDATE recurring_subscriptions
+                SET next_payment_ts = CAST(strftime('%s', substr(NEW.next_payment_date, 1, 16) || ':00') AS INTEGER)
+                WHERE id = NEW.id;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_recurring_next_payment_ts_update
+            AFTER UPDATE OF next_payment_date ON recurring_subscriptions
+            BEGIN
+                UPDATE recurring_subscriptions
+                SET next_payment_ts = CAST(strftime('%s', substr(NEW.next_payment_date, 1, 16) || ':00') AS INTEGER)
+                WHERE id = NEW.id;
+            END
+        """)
+        cursor.execute("""
+            UPDATE recurring_subscriptions
+            SET next_payment_ts = CAST(strftime('%s', substr(next_payment_date, 1, 16) || ':00') AS INTEGER)
+            WHERE next_payment_ts IS NULL AND next_payment_date IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_recurring_due
+            ON recurring_subscriptions(next_payment_ts) WHERE status = 'active'
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при міграції таблиці recurring_subscriptions: {e}")
+
+
+# Вікно списань у день платежу (київський час). Слот підписки — детермінований зсув від її id
+# всередині вікна, тож підписки, оформлені після однієї розсилки, списуються рівномірно протягом дня
+BILLING_WINDOW_START_HOUR = 9
+BILLING_WINDOW_HOURS = 12
+_CHARGE_SLOT_SQL = (
+    "CAST(strftime('%s', substr({date}, 1, 10)) AS INTEGER) + {start} + (({id} * 2654435761) % {length})"
+)
+
+
+def migrate_recurring_charge_slot():
+    """Час списання в межах дня платежу (charge_slot_ts) з індексом для вибірки білінгу"""
+    slot = {"start": BILLING_WINDOW_START_HOUR * 3600, "length": BILLING_WINDOW_HOURS * 3600}
+    try:
+        cursor.execute("PRAGMA table_info(recurring_subscriptions)")
+        columns = {column[1] for column in cursor.fetchall()}
+        if 'charge_slot_ts' not in columns:
+            cursor.execute("ALTER TABLE recurring_subscriptions ADD COLUMN charge_slot_ts INTEGER")
+        # Тригери перераховують слот при кожній зміні дати, у тому числі з вебдодатку;
+        # перестворюються при запуску, щоб підхопити змінене вікно
+        for event, when in (("insert", "AFTER INSERT"), ("update", "AFTER UPDATE OF next_payment_date")):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_recurring_charge_slot_{event}")
+            cursor.execute(f"""
+                CREATE TRIGGER trg_recurring_charge_slot_{event}
+                {when} ON recurring_subscriptions
+                BEGIN
+                    UPDATE recurring_subscriptions
+                    SET charge_slot_ts = {_CHARGE_SLOT_SQL.format(date="NEW.next_payment_date", id="NEW.id", **slot)}
+                    WHERE id = NEW.id;
+                END
+            """)
+        cursor.execute(f"""
+            UPDATE recurring_subscriptions
+            SET charge_slot_ts = {_CHARGE_SLOT_SQL.format(date="next_payment_date", id="id", **slot)}
+            WHERE charge_slot_ts IS NULL AND next_payment_date IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_recurring_charge_slot
+            ON recurring_subscriptions(charge_slot_ts) WHERE status = 'active'
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при міграції слотів списання: {e}")
 
 
 def create_subscription_payments_table():
@@ -302,7 +640,7 @@ def create_subscription_payments_table():
             FOREIGN KEY (subscription_id) REFERENCES recurring_subscriptions(id)
         )
     ''')
-    conn.commit()
+    _commit()
 
 
 def create_payments_temp_data_table():
@@ -317,7 +655,7 @@ def create_payments_temp_data_table():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
-    conn.commit()
+    _commit()
     
     
 def add_subscription(user_id: int, product_type: str, product_id: int, product_name: str, 
@@ -329,7 +667,7 @@ def add_subscription(user_id: int, product_type: str, product_id: int, product_n
                 price, start_date, end_date, status
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, (user_id, product_type, product_id, product_name, price, start_date, end_date, status))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при додаванні підписки: {e}")
@@ -406,6 +744,35 @@ def get_user_subscriptions(user_id: int) -> list:
         return []
 
 
+def get_user_profile_rows(user_id: int) -> list:
+    """
+    Один запит для кабінету: рядок користувача ('user'), разові підписки ('simple')
+    та підписки з автосплатою ('recurring') у порядку, як у окремих запитах.
+    """
+    try:
+        cursor.execute("""
+            SELECT kind, id, product_name, price, months, first_date, second_date, status, payment_failures
+            FROM (
+                SELECT 'user' AS kind, NULL AS id, NULL AS product_name, NULL AS price, NULL AS months,
+                       join_date AS first_date, NULL AS second_date, NULL AS status, NULL AS payment_failures,
+                       0 AS part, NULL AS sort_key
+                FROM users WHERE user_id = ?
+                UNION ALL
+                SELECT 'simple', id, product_name, price, NULL, start_date, end_date, status, NULL,
+                       1, end_date
+                FROM subscriptions WHERE user_id = ?
+                UNION ALL
+                SELECT 'recurring', id, product_name, price, months, next_payment_date, NULL, status, payment_failures,
+                       2, created_at
+                FROM recurring_subscriptions WHERE user_id = ?
+            )
+            ORDER BY part, sort_key DESC
+        """, (user_id, user_id, user_id))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні профілю користувача: {e}")
+        return []
+
 def add_discount(user_id: int, discount: int):
     cursor.execute("SELECT discounts FROM users WHERE user_id = ?", (user_id,))
     result = cursor.fetchone()
@@ -422,7 +789,7 @@ def add_discount(user_id: int, discount: int):
             VALUES (?, ?)
         """, (user_id, discount))
     
-    conn.commit()
+    _commit()
 
 
 def get_user_name(user_id: int) -> str:
@@ -441,7 +808,7 @@ def save_user_token(user_id: int, wallet_id: str, card_token: str, masked_card:
             (user_id, wallet_id, card_token, masked_card, card_type, updated_at)
             VALUES (?, ?, ?, ?, ?, datetime('now'))
         """, (user_id, wallet_id, card_token, masked_card, card_type))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при збереженні токена: {e}")
@@ -475,7 +842,7 @@ def create_recurring_subscription(user_id: int, product_id: int, product_name: s
             (user_id, product_id, product_name, months, price, wallet_id, next_payment_date)
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """, (user_id, product_id, product_name, months, price, wallet_id, next_payment_date))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при створенні підписки: {e}")
@@ -494,14 +861,59 @@ def get_active_recurring_subscriptions() -> list:
             SELECT id, user_id, product_id, product_name, months, price, wallet_id, next_payment_date
             FROM recurring_subscriptions 
             WHERE status = 'active' 
-            AND datetime(substr(next_payment_date, 1, 16) || ':00') <= ?
-        """, (date_string,))
+            AND charge_slot_ts <= ?
+            ORDER BY charge_slot_ts, id
+        """, (_payment_ts(date_string),))
         return cursor.fetchall()
     except sqlite3.Error as e:
         print(f"Помилка при отриманні підписок: {e}")
         return []
 
 
+def _payment_ts(date_string: str) -> int:
+    """Київський час 'YYYY-MM-DD HH:MM:SS' у той самий формат, що й next_payment_ts (секунди без поясу)"""
+    return calendar.timegm(datetime.strptime(date_string[:16], '%Y-%m-%d %H:%M').timetuple())
+
+
+def iter_due_recurring_subscriptions(chunk_size: int = 200):
+    """
+    Підписки, чий слот списання настав, разом з активним токеном картки, порціями по індексу charge_slot_ts.
+    Підписки з токеном, який свіжа попередня перевірка визнала недійсним, сюди не потрапляють.
+    """
+    from database.token_health_db import TOKEN_HEALTH_TTL
+    kyiv_tz = pytz.timezone('Europe/Kiev')
+    now_ts = _payment_ts(datetime.now(kyiv_tz).strftime('%Y-%m-%d %H:%M:00'))
+    last_ts, last_id = -1, 0
+    chunk_cursor = conn.cursor()
+    while True:
+        try:
+            chunk_cursor.execute("""
+                SELECT r.id, r.user_id, r.product_id, r.product_name, r.months, r.price, r.wallet_id,
+                       r.next_payment_date, r.charge_slot_ts,
+                       t.wallet_id, t.card_token, t.masked_card, t.card_type
+                FROM recurring_subscriptions r
+                LEFT JOIN user_tokens t ON t.user_id = r.user_id AND t.is_active = 1
+                LEFT JOIN token_health h ON h.user_id = t.user_id AND h.card_token = t.card_token
+                WHERE r.status = 'active'
+                AND r.charge_slot_ts <= ?
+                AND (r.charge_slot_ts, r.id) > (?, ?)
+                AND (h.status IS NULL OR h.status != 'invalid' OR h.checked_at < ?)
+                ORDER BY r.charge_slot_ts, r.id
+                LIMIT ?
+            """, (now_ts, last_ts, last_id, int(time.time()) - TOKEN_HEALTH_TTL, chunk_size))
+            rows = chunk_cursor.fetchall()
+        except sqlite3.Error as e:
+            print(f"Помилка при отриманні підписок: {e}")
+            return
+        if not rows:
+            return
+        for row in rows:
+            yield row[:8], (row[9:] if row[9] is not None else None)
+        last_ts, last_id = rows[-1][8], rows[-1][0]
+        if len(rows) < chunk_size:
+            return
+
+
 def update_subscription_next_payment(subscription_id: int, months: int) -> bool:
     """Оновлює дату наступного платежу підписки"""
     try:
@@ -514,13 +926,46 @@ def update_subscription_next_payment(subscription_id: int, months: int) -> bool:
             SET next_payment_date = ?, updated_at = datetime('now')
             WHERE id = ?
         """, (next_payment_date, subscription_id))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при оновленні дати платежу: {e}")
         return False
 
 
+def defer_charge_slot(subscription_id: int, delay: int) -> bool:
+    """
+    Переносить слот списання на delay секунд від поточного моменту. Білінг робить це до спроби списання:
+    успішна оплата змінить дату платежу і слот перерахується, інакше наступна спроба — не раніше delay.
+    """
+    now_ts = _payment_ts(datetime.now(pytz.timezone('Europe/Kiev')).strftime('%Y-%m-%d %H:%M:00'))
+    try:
+        cursor.execute("""
+            UPDATE recurring_subscriptions SET charge_slot_ts = ? WHERE id = ?
+        """, (now_ts + delay, subscription_id))
+        _commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Помилка при перенесенні слоту списання: {e}")
+        return False
+
+
+def reset_charge_slot(subscription_id: int) -> bool:
+    """Повертає слот, обчислений з дати платежу: спроба не відбулася (збій Monobank до створення рахунку)."""
+    slot = {"start": BILLING_WINDOW_START_HOUR * 3600, "length": BILLING_WINDOW_HOURS * 3600}
+    try:
+        cursor.execute(f"""
+            UPDATE recurring_subscriptions
+            SET charge_slot_ts = {_CHARGE_SLOT_SQL.format(date="next_payment_date", id="id", **slot)}
+            WHERE id = ?
+        """, (subscription_id,))
+        _commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Помилка при відновленні слоту списання: {e}")
+        return False
+
+
 def increment_payment_failures(subscription_id: int) -> bool:
     """Збільшує лічильник невдалих платежів"""
     try:
@@ -529,7 +974,7 @@ def increment_payment_failures(subscription_id: int) -> bool:
             SET payment_failures = payment_failures + 1, updated_at = datetime('now')
             WHERE id = ?
         """, (subscription_id,))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при оновленні лічильника помилок: {e}")
@@ -544,7 +989,7 @@ def deactivate_subscription(subscription_id: int) -> bool:
             SET status = 'inactive', updated_at = datetime('now')
             WHERE id = ?
         """, (subscription_id,))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при деактивації підписки: {e}")
@@ -561,7 +1006,7 @@ def save_subscription_payment(subscription_id: int, user_id: int, amount: float,
             (subscription_id, user_id, amount, payment_date, status, invoice_id, payment_id, error_message)
             VALUES (?, ?, ?, datetime('now'), ?, ?, ?, ?)
         """, (subscription_id, user_id, amount, status, invoice_id, payment_id, error_message))
-        conn.commit()
+        _commit()
         return True
     except sqlite3.Error as e:
         print(f"Помилка при збереженні платежу підписки: {e}")
@@ -590,7 +1035,7 @@ def migrate_payments_temp_data_table():
         
         if 'local_payment_id' not in columns:
             cursor.execute("ALTER TABLE payments_temp_data ADD COLUMN local_payment_id TEXT")
-            conn.commit()
+            _commit()
             print("Поле local_payment_id успішно додано до таблиці payments_temp_data")
         else:
             print("Поле local_payment_id вже існує в таблиці payments_temp_data")
@@ -606,7 +1051,7 @@ def migrate_payments_table():
         
         if 'payment_type' not in columns:
             cursor.execute("ALTER TABLE payments ADD COLUMN payment_type TEXT DEFAULT 'one_time'")
-            conn.commit()
+            _commit()
             print("Поле payment_type успішно додано до таблиці payments")
         else:
             print("Поле payment_type вже існує в таблиці payments")
@@ -614,20 +1059,57 @@ def migrate_payments_table():
         print(f"Помилка при міграції таблиці payments: {e}")
 
 
-# --- Партнерська програма ---
+def migrate_payments_invoice_reuse():
+    """Поля для повторного використання рахунків: посилання на оплату та термін дії"""
+    try:
+        cursor.execute("PRAGMA table_info(payments)")
+        columns = {column[1] for column in cursor.fetchall()}
+        if 'page_url' not in columns:
+            cursor.execute("ALTER TABLE payments ADD COLUMN page_url TEXT")
+        if 'expires_at' not in columns:
+            cursor.execute("ALTER TABLE payments ADD COLUMN expires_at DATETIME")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_user_product_status ON payments(user_id, product_id, status)")
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при міграції таблиці payments: {e}")
+
 
-def migrate_users_partner_balance():
-    """Додає поле partner_balance до таблиці users"""
+def migrate_payments_polling_schedule():
+    """Розклад перевірок pending-рахунків: next_check_at (unix), кількість перевірок, останній статус"""
     try:
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if "partner_balance" not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN partner_balance REAL DEFAULT 0")
-            conn.commit()
+        cursor.execute("PRAGMA table_info(payments)")
+        columns = {column[1] for column in cursor.fetchall()}
+        if 'next_check_at' not in columns:
+            cursor.execute("ALTER TABLE payments ADD COLUMN next_check_at INTEGER")
+        if 'check_count' not in columns:
+            cursor.execute("ALTER TABLE payments ADD COLUMN check_count INTEGER DEFAULT 0")
+        if 'last_status' not in columns:
+            cursor.execute("ALTER TABLE payments ADD COLUMN last_status TEXT")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_payments_pending_due
+            ON payments(next_check_at) WHERE status = 'pending'
+        """)
+        # Рахунки, створені вебдодатком або старою версією бота, одразу стають у чергу перевірки
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_payments_schedule_check
+            AFTER INSERT ON payments
+            WHEN NEW.status = 'pending' AND NEW.next_check_at IS NULL
+            BEGIN
+                UPDATE payments SET next_check_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE invoice_id = NEW.invoice_id;
+            END
+        """)
+        cursor.execute("""
+            UPDATE payments SET next_check_at = CAST(strftime('%s', 'now') AS INTEGER)
+            WHERE status = 'pending' AND next_check_at IS NULL
+        """)
+        _commit()
     except sqlite3.Error as e:
-        print(f"Помилка при міграції users.partner_balance: {e}")
+        print(f"Помилка при міграції таблиці payments: {e}")
 
 
+# --- Партнерська програма ---
+
 def create_partner_settings_table():
     """Налаштування партнерської програми (відсоток нарахування)"""
     cursor.execute("""
@@ -639,7 +1121,7 @@ def create_partner_settings_table():
     cursor.execute(
         "INSERT OR IGNORE INTO partner_settings (key, value) VALUES ('referral_percent', '20')"
     )
-    conn.commit()
+    _commit()
 
 
 def create_partner_earnings_table():
@@ -657,7 +1139,125 @@ def create_partner_earnings_table():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     """)
-    conn.commit()
+    _commit()
+
+
+def create_partner_ledger_tables():
+    """Журнал руху партнерських коштів з балансом після кожного запису та підсумки по партнерах"""
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'partner_ledger'")
+        ledger_existed = cursor.fetchone() is not None
+        cursor.execute("PRAGMA table_info(users)")
+        has_legacy_balance = 'partner_balance' in {column[1] for column in cursor.fetchall()}
+
+        cursor.execute("PRAGMA table_info(partner_earnings)")
+        if 'source_ref' not in {column[1] for column in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE partner_earnings ADD COLUMN source_ref TEXT")
+        # Один платіж (invoice_id) нараховує партнеру не більше одного разу
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_partner_earnings_source_ref
+            ON partner_earnings(source_ref) WHERE source_ref IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_partner_earnings_partner
+            ON partner_earnings(partner_id, created_at)
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS partner_ledger (
+                id INTEGER PRIMARY KEY,
+                partner_id INTEGER NOT NULL,
+                entry_type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                balance_after REAL,
+                ref TEXT,
+                note TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_partner_ledger_ref
+            ON partner_ledger(ref) WHERE ref IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_partner_ledger_partner
+            ON partner_ledger(partner_id, id)
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS partner_accounts (
+                partner_id INTEGER PRIMARY KEY,
+                balance REAL NOT NULL DEFAULT 0,
+                total_earned REAL NOT NULL DEFAULT 0,
+                total_debited REAL NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Кожен запис журналу оновлює підсумки партнера і фіксує баланс після операції
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_partner_ledger_apply
+            AFTER INSERT ON partner_ledger
+            BEGIN
+                INSERT INTO partner_accounts (partner_id, balance, total_earned, total_debited)
+                VALUES (
+                    NEW.partner_id,
+                    NEW.amount,
+                    CASE WHEN NEW.entry_type = 'credit' THEN NEW.amount ELSE 0 END,
+                    CASE WHEN NEW.amount < 0 THEN -NEW.amount ELSE 0 END
+                )
+                ON CONFLICT(partner_id) DO UPDATE SET
+                    balance = balance + excluded.balance,
+                    total_earned = total_earned + excluded.total_earned,
+                    total_debited = total_debited + excluded.total_debited,
+                    updated_at = datetime('now');
+                UPDATE partner_ledger
+                SET balance_after = (SELECT balance FROM partner_accounts WHERE partner_id = NEW.partner_id)
+                WHERE id = NEW.id;
+            END
+        """)
+        # Нарахування з вебдодатку теж потрапляють у журнал
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_partner_earnings_ledger
+            AFTER INSERT ON partner_earnings
+            BEGIN
+                INSERT INTO partner_ledger (partner_id, entry_type, amount, ref, note)
+                VALUES (NEW.partner_id, 'credit', NEW.credit_amount, 'earning:' || NEW.id, NEW.product_name);
+            END
+        """)
+        if not ledger_existed and has_legacy_balance:
+            # Початкові залишки з users.partner_balance та історичні нарахування з partner_earnings
+            cursor.execute("""
+                INSERT INTO partner_ledger (partner_id, entry_type, amount, ref, note)
+                SELECT user_id, 'opening', partner_balance, 'opening:' || user_id, 'Залишок на момент запуску журналу'
+                FROM users WHERE COALESCE(partner_balance, 0) != 0
+            """)
+            cursor.execute("""
+                INSERT OR IGNORE INTO partner_accounts (partner_id)
+                SELECT DISTINCT partner_id FROM partner_earnings
+            """)
+            cursor.execute("""
+                UPDATE partner_accounts SET
+                    total_earned = COALESCE((SELECT SUM(credit_amount) FROM partner_earnings
+                                             WHERE partner_id = partner_accounts.partner_id), 0),
+                    total_debited = MAX(COALESCE((SELECT SUM(credit_amount) FROM partner_earnings
+                                                  WHERE partner_id = partner_accounts.partner_id), 0) - balance, 0)
+            """)
+        if has_legacy_balance:
+            # Баланс веде лише partner_accounts; стара колонка перенесена в журнал і більше не оновлюється
+            cursor.execute("ALTER TABLE users DROP COLUMN partner_balance")
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні партнерського журналу: {e}")
+
+
+def _debit_partner(partner_id: int, amount: float, entry_type: str, ref: str = None, note: str = None) -> bool:
+    """Списання в межах transaction(): запис у журнал додається лише якщо коштів достатньо, баланс оновлює тригер"""
+    cursor.execute(
+        """
+        INSERT INTO partner_ledger (partner_id, entry_type, amount, ref, note)
+        SELECT ?, ?, ?, ?, ? FROM partner_accounts WHERE partner_id = ? AND balance >= ?
+        """,
+        (partner_id, entry_type, -amount, ref, note, partner_id, amount),
+    )
+    return cursor.rowcount > 0
 
 
 def create_partner_withdrawal_requests_table():
@@ -674,7 +1274,7 @@ def create_partner_withdrawal_requests_table():
             payout_details TEXT
         )
     """)
-    conn.commit()
+    _commit()
 
 
 def migrate_partner_withdrawal_payout_details():
@@ -686,7 +1286,7 @@ def migrate_partner_withdrawal_payout_details():
             cursor.execute(
                 "ALTER TABLE partner_withdrawal_requests ADD COLUMN payout_details TEXT"
             )
-            conn.commit()
+            _commit()
     except sqlite3.Error as e:
         print(f"Помилка migrate_partner_withdrawal_payout_details: {e}")
 
@@ -699,7 +1299,7 @@ def get_ref_id_by_user(buyer_id: int):
 
 
 def get_partner_balance(user_id: int) -> float:
-    cursor.execute("SELECT partner_balance FROM users WHERE user_id = ?", (user_id,))
+    cursor.execute("SELECT balance FROM partner_accounts WHERE partner_id = ?", (user_id,))
     row = cursor.fetchone()
     return float(row[0]) if row and row[0] is not None else 0.0
 
@@ -710,71 +1310,58 @@ def add_partner_credit(
     purchase_amount: float,
     product_name: str,
     payment_type: str = "one_time",
-) -> bool:
-    """Нараховує партнеру % від покупки реферала."""
+    source_ref: str = None,
+) -> float:
+    """Нараховує партнеру % від покупки реферала. Повертає нараховану суму (0, якщо цей платіж уже враховано)."""
     try:
         percent = get_partner_referral_percent()
         credit_amount = round(purchase_amount * (percent / 100), 1)
         if credit_amount <= 0:
-            return True
-        cursor.execute(
-            """
-            UPDATE users SET partner_balance = COALESCE(partner_balance, 0) + ?
-            WHERE user_id = ?
-            """,
-            (credit_amount, partner_id),
-        )
-        cursor.execute(
-            """
-            INSERT INTO partner_earnings
-            (partner_id, buyer_id, purchase_amount, credit_amount, percent, product_name, payment_type)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (partner_id, buyer_id, purchase_amount, credit_amount, percent, product_name, payment_type),
-        )
-        conn.commit()
-        return True
+            return 0.0
+        with transaction():
+            cursor.execute(
+                """
+                INSERT OR IGNORE INTO partner_earnings
+                (partner_id, buyer_id, purchase_amount, credit_amount, percent, product_name, payment_type, source_ref)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (partner_id, buyer_id, purchase_amount, credit_amount, percent, product_name, payment_type, source_ref),
+            )
+            if cursor.rowcount == 0:
+                return 0.0
+            # Запис журналу і баланс у partner_accounts додають тригери partner_earnings / partner_ledger
+        return credit_amount
     except sqlite3.Error as e:
         print(f"Помилка add_partner_credit: {e}")
-        return False
+        return 0.0
 
 
-def get_partner_earnings_history(partner_id: int, limit: int = 50) -> list:
-    """Історія нарахувань для партнера (buyer_id, purchase_amount, credit_amount, product_name, created_at)."""
+def get_partner_ledger_page(partner_id: int, before_id: int = None, limit: int = 20) -> list:
+    """
+    Сторінка журналу партнера від новіших до старіших: (id, entry_type, amount, balance_after, note, created_at,
+    buyer_id, purchase_amount, payment_type); останні три — лише для нарахувань (з partner_earnings за ref).
+    """
     cursor.execute(
         """
-        SELECT buyer_id, purchase_amount, credit_amount, product_name, payment_type, created_at
-        FROM partner_earnings WHERE partner_id = ? ORDER BY created_at DESC LIMIT ?
+        SELECT l.id, l.entry_type, l.amount, l.balance_after, l.note, l.created_at,
+               e.buyer_id, e.purchase_amount, e.payment_type
+        FROM partner_ledger l
+        LEFT JOIN partner_earnings e
+            ON l.ref LIKE 'earning:%' AND e.id = CAST(substr(l.ref, 9) AS INTEGER)
+        WHERE l.partner_id = ? AND l.id < ?
+        ORDER BY l.id DESC LIMIT ?
         """,
-        (partner_id, limit),
+        (partner_id, before_id if before_id is not None else 2 ** 63 - 1, limit),
     )
     return cursor.fetchall()
 
 
 def get_partner_referral_percent() -> float:
-    cursor.execute(
-        "SELECT value FROM partner_settings WHERE key = 'referral_percent'"
-    )
-    row = cursor.fetchone()
-    if row:
-        try:
-            return float(row[0])
-        except (ValueError, TypeError):
-            pass
-    return 20.0
+    return get_setting("referral_percent")
 
 
 def set_partner_referral_percent(percent: float) -> bool:
-    try:
-        cursor.execute(
-            "INSERT OR REPLACE INTO partner_settings (key, value) VALUES ('referral_percent', ?)",
-            (str(percent),),
-        )
-        conn.commit()
-        return True
-    except sqlite3.Error as e:
-        print(f"Помилка set_partner_referral_percent: {e}")
-        return False
+    return set_setting("referral_percent", percent)
 
 
 def create_withdrawal_request(user_id: int, amount: float, payout_details: str = None) -> int | None:
@@ -787,7 +1374,7 @@ def create_withdrawal_request(user_id: int, amount: float, payout_details: str =
             """,
             (user_id, amount, payout_details or ""),
         )
-        conn.commit()
+        _commit()
         return cursor.lastrowid
     except sqlite3.Error as e:
         print(f"Помилка create_withdrawal_request: {e}")
@@ -796,24 +1383,25 @@ def create_withdrawal_request(user_id: int, amount: float, payout_details: str =
 
 def get_partner_stats_for_admin() -> list:
     """Список партнерів для адмінки: (user_id, user_name, balance, referral_count, total_earned)."""
-    cursor.execute("""
-        SELECT u.user_id, u.user_name, COALESCE(u.partner_balance, 0),
+    reader = analytics_cursor() or cursor
+    reader.execute("""
+        SELECT u.user_id, u.user_name, COALESCE(a.balance, 0),
                (SELECT COUNT(*) FROM users u2 WHERE u2.ref_id = u.user_id),
-               (SELECT COALESCE(SUM(credit_amount), 0) FROM partner_earnings WHERE partner_id = u.user_id)
+               COALESCE(a.total_earned, 0)
         FROM users u
+        LEFT JOIN partner_accounts a ON a.partner_id = u.user_id
         WHERE u.user_id IN (SELECT ref_id FROM users WHERE ref_id IS NOT NULL)
-        ORDER BY COALESCE(u.partner_balance, 0) DESC
+        ORDER BY COALESCE(a.balance, 0) DESC
     """)
-    return cursor.fetchall()
+    return reader.fetchall()
 
 
 def get_partner_participants_count() -> int:
-    """Кількість учасників партнерської програми (мають рефералів або баланс > 0 або є в partner_earnings)."""
+    """Кількість учасників партнерської програми (мають рефералів або рахунок у partner_accounts)."""
     cursor.execute("""
         SELECT COUNT(DISTINCT u.user_id) FROM users u
         WHERE (SELECT COUNT(*) FROM users u2 WHERE u2.ref_id = u.user_id) > 0
-           OR COALESCE(u.partner_balance, 0) > 0
-           OR u.user_id IN (SELECT partner_id FROM partner_earnings)
+           OR u.user_id IN (SELECT partner_id FROM partner_accounts)
     """)
     row = cursor.fetchone()
     return row[0] if row else 0
@@ -822,15 +1410,15 @@ def get_partner_participants_count() -> int:
 def get_all_partner_participants(limit: int, offset: int) -> list:
     """Список усіх учасників: (user_id, user_name, balance, referral_count, total_earned)."""
     cursor.execute("""
-        SELECT u.user_id, u.user_name, COALESCE(u.partner_balance, 0),
+        SELECT u.user_id, u.user_name, COALESCE(a.balance, 0),
                (SELECT COUNT(*) FROM users u2 WHERE u2.ref_id = u.user_id),
-               (SELECT COALESCE(SUM(credit_amount), 0) FROM partner_earnings WHERE partner_id = u.user_id)
+               COALESCE(a.total_earned, 0)
         FROM users u
+        LEFT JOIN partner_accounts a ON a.partner_id = u.user_id
         WHERE (SELECT COUNT(*) FROM users u2 WHERE u2.ref_id = u.user_id) > 0
-           OR COALESCE(u.partner_balance, 0) > 0
-           OR u.user_id IN (SELECT partner_id FROM partner_earnings)
-        ORDER BY (SELECT COALESCE(SUM(credit_amount), 0) FROM partner_earnings WHERE partner_id = u.user_id) DESC,
-                 COALESCE(u.partner_balance, 0) DESC
+           OR a.partner_id IS NOT NULL
+        ORDER BY COALESCE(a.total_earned, 0) DESC,
+                 COALESCE(a.balance, 0) DESC
         LIMIT ? OFFSET ?
     """, (limit, offset))
     return cursor.fetchall()
@@ -848,7 +1436,7 @@ def get_referrals_of_partner(partner_user_id: int) -> list:
 def get_partner_total_earned(user_id: int) -> float:
     """Сума нарахованих партнеру коштів."""
     cursor.execute(
-        "SELECT COALESCE(SUM(credit_amount), 0) FROM partner_earnings WHERE partner_id = ?",
+        "SELECT COALESCE(total_earned, 0) FROM partner_accounts WHERE partner_id = ?",
         (user_id,),
     )
     row = cursor.fetchone()
@@ -887,30 +1475,25 @@ def get_withdrawal_requests(status: str = None) -> list:
 def complete_withdrawal_request(request_id: int, admin_note: str = None) -> bool:
     """Позначає вивід як виконаний і списує баланс."""
     try:
-        cursor.execute(
-            "SELECT user_id, amount, status FROM partner_withdrawal_requests WHERE id = ?",
-            (request_id,),
-        )
-        row = cursor.fetchone()
-        if not row or row[2] != "pending":
-            return False
-        user_id, amount = row[0], row[1]
-        balance = get_partner_balance(user_id)
-        if balance < amount:
-            return False
-        cursor.execute(
-            "UPDATE users SET partner_balance = partner_balance - ? WHERE user_id = ?",
-            (amount, user_id),
-        )
-        cursor.execute(
-            """
-            UPDATE partner_withdrawal_requests
-            SET status = 'completed', processed_at = datetime('now'), admin_note = ?
-            WHERE id = ?
-            """,
-            (admin_note or "", request_id),
-        )
-        conn.commit()
+        with transaction():
+            cursor.execute(
+                "SELECT user_id, amount, status FROM partner_withdrawal_requests WHERE id = ?",
+                (request_id,),
+            )
+            row = cursor.fetchone()
+            if not row or row[2] != "pending":
+                return False
+            user_id, amount = row[0], row[1]
+            if not _debit_partner(user_id, amount, "withdrawal", f"withdrawal:{request_id}", admin_note):
+                return False
+            cursor.execute(
+                """
+                UPDATE partner_withdrawal_requests
+                SET status = 'completed', processed_at = datetime('now'), admin_note = ?
+                WHERE id = ? AND status = 'pending'
+                """,
+                (admin_note or "", request_id),
+            )
         return True
     except sqlite3.Error as e:
         print(f"Помилка complete_withdrawal_request: {e}")
@@ -927,25 +1510,18 @@ def reject_withdrawal_request(request_id: int, admin_note: str = None) -> bool:
             """,
             (admin_note or "", request_id),
         )
-        conn.commit()
+        _commit()
         return cursor.rowcount > 0
     except sqlite3.Error as e:
         print(f"Помилка reject_withdrawal_request: {e}")
         return False
 
 
-def deduct_partner_balance(user_id: int, amount: float) -> bool:
+def deduct_partner_balance(user_id: int, amount: float, note: str = None) -> bool:
     """Списує кошти з балансу партнера (оплата підписки з балансу)."""
     try:
-        balance = get_partner_balance(user_id)
-        if balance < amount:
-            return False
-        cursor.execute(
-            "UPDATE users SET partner_balance = partner_balance - ? WHERE user_id = ?",
-            (amount, user_id),
-        )
-        conn.commit()
-        return True
+        with transaction():
+            return _debit_partner(user_id, amount, "purchase", note=note)
     except sqlite3.Error as e:
         print(f"Помилка deduct_partner_balance: {e}")
         return False
@@ -954,21 +1530,42 @@ def deduct_partner_balance(user_id: int, amount: float) -> bool:
 # Створюємо таблиці та виконуємо міграції
 def create_tables():
     create_table()
+    create_users_index()
     create_products_table()
     create_catalog_images_table()
     migrate_products_table()  # Додаємо поле payment_type до існуючої таблиці
     create_contest_table()
     create_payments_table()
     migrate_payments_table()  # Додаємо поле payment_type до таблиці payments
+    migrate_payments_invoice_reuse()
+    migrate_payments_polling_schedule()
     create_subscriptions_table()
     create_user_tokens_table()
     create_recurring_subscriptions_table()
+    migrate_recurring_next_payment_ts()
+    migrate_recurring_charge_slot()
     create_subscription_payments_table()
+    create_reconciliation_indexes()
     create_payments_temp_data_table()
+    create_profile_indexes()
     migrate_payments_temp_data_table()  # Додаємо поле local_payment_id
-    migrate_users_partner_balance()
     create_partner_settings_table()
+    from database.settings_db import create_settings_version_table
+    create_settings_version_table()
+    from database.leases_db import create_job_leases_table
+    create_job_leases_table()
+    from database.outbox_db import create_outbox_table
+    create_outbox_table()
+    from database.archive_db import create_archive_tables
+    create_archive_tables()
+    from database.token_health_db import create_token_health_table
+    create_token_health_table()
+    from database.admin_digest_db import create_admin_digest_table
+    create_admin_digest_table()
+    from database.reconciliation_db import create_reported_discrepancies_table
+    create_reported_discrepancies_table()
     create_partner_earnings_table()
+    create_partner_ledger_tables()
     create_partner_withdrawal_requests_table()
     migrate_partner_withdrawal_payout_details()
     migrate_users_marketing_link()
@@ -0,0 +1,89 @@
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from config import DB_PATH
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+# Унікальний власник для цього процесу: хост, pid і випадковий суфікс (pid може повторитись після рестарту)
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def create_job_leases_table():
+    """Оренди фонових задач: лише власник дійсної оренди виконує задачу"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS job_leases (
+                job_name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                acquired_at INTEGER NOT NULL,
+                heartbeat_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                released_at INTEGER
+            )
+        """)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці job_leases: {e}")
+
+
+def acquire_lease(job_name: str, ttl: int, owner: str = INSTANCE_ID, force: bool = False) -> bool:
+    """
+    Бере оренду, якщо її немає або попередня закінчилась (у т.ч. період охолодження).
+    force=True ігнорує охолодження завершеного запуску, але не перебиває активний.
+    """
+    now = int(time.time())
+    condition = "job_leases.expires_at <= excluded.acquired_at"
+    if force:
+        condition += " OR job_leases.released_at IS NOT NULL"
+    try:
+        cursor.execute(f"""
+            INSERT INTO job_leases (job_name, owner, acquired_at, heartbeat_at, expires_at, released_at)
+            VALUES (?, ?, ?, ?, ?, NULL)
+            ON CONFLICT(job_name) DO UPDATE SET
+                owner = excluded.owner,
+                acquired_at = excluded.acquired_at,
+                heartbeat_at = excluded.heartbeat_at,
+                expires_at = excluded.expires_at,
+                released_at = NULL
+            WHERE {condition}
+        """, (job_name, owner, now, now, now + ttl))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Помилка при отриманні оренди {job_name}: {e}")
+        return False
+
+
+def renew_lease(job_name: str, ttl: int, owner: str = INSTANCE_ID) -> bool:
+    """Продовжує оренду (heartbeat); False — оренду втрачено"""
+    now = int(time.time())
+    try:
+        cursor.execute("""
+            UPDATE job_leases SET heartbeat_at = ?, expires_at = ?
+            WHERE job_name = ? AND owner = ? AND released_at IS NULL
+        """, (now, now + ttl, job_name, owner))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Помилка при продовженні оренди {job_name}: {e}")
+        return False
+
+
+def release_lease(job_name: str, cooldown: int = 0, owner: str = INSTANCE_ID) -> bool:
+    """Звільняє оренду; cooldown залишає її зайнятою ще на стільки секунд, щоб інші інстанси не повторили роботу"""
+    now = int(time.time())
+    try:
+        cursor.execute("""
+            UPDATE job_leases SET released_at = ?, expires_at = ?
+            WHERE job_name = ? AND owner = ? AND released_at IS NULL
+        """, (now, now + cooldown, job_name, owner))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Помилка при звільненні оренди {job_name}: {e}")
+        return False
@@ -1,4 +1,8 @@
 import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytz
 
 from config import DB_PATH
 
@@ -7,6 +11,19 @@ cursor = conn.cursor()
 
 LINK_START_PREFIX = "linktowatch_"
 
+# Лічильники посилань накопичуються в пам'яті і записуються разом — раз на інтервал або при досягненні порогу
+LINK_FLUSH_INTERVAL = 10
+LINK_FLUSH_THRESHOLD = 500
+
+# Події з'являються в погодинних/денних зрізах після запису буфера; денні зрізи — за київською датою
+LINK_EVENT_TYPES = ("click", "registration", "purchase")
+KYIV_TZ = pytz.timezone("Europe/Kiev")
+
+# link_id -> [переходи, реєстрації, покупки], ще не записані в БД
+_pending_counters: dict = {}
+# (link_id, тип події, user_id, сума, час) — ще не записані події
+_pending_events: list = []
+
 
 def build_link_start_payload(link_id: int) -> str:
     return f"{LINK_START_PREFIX}{link_id}"
@@ -25,6 +42,7 @@ def create_table_links():
     ''')
     conn.commit()
     migrate_links_table()
+    create_link_analytics_tables()
 
 
 def migrate_links_table():
@@ -41,6 +59,50 @@ def migrate_links_table():
     conn.commit()
 
 
+def create_link_analytics_tables():
+    """Потік подій посилань і погодинні/денні зрізи, які оновлюються під час запису буфера"""
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'link_stats_daily'")
+        first_run = cursor.fetchone() is None
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS link_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                link_id INTEGER NOT NULL,
+                event_type TEXT NOT NULL,
+                user_id INTEGER,
+                amount REAL NOT NULL DEFAULT 0,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_link_events_link ON link_events(link_id, created_at)")
+        for table, bucket in (("link_stats_hourly", "bucket_ts INTEGER"), ("link_stats_daily", "day TEXT")):
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    link_id INTEGER NOT NULL,
+                    {bucket} NOT NULL,
+                    clicks INTEGER NOT NULL DEFAULT 0,
+                    registrations INTEGER NOT NULL DEFAULT 0,
+                    purchases INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (link_id, {bucket.split()[0]})
+                ) WITHOUT ROWID
+            """)
+        if first_run:
+            # Денна історія реєстрацій відновлюється з users (переходи рахувались лише разом з реєстрацією)
+            cursor.execute("""
+                INSERT INTO link_stats_daily (link_id, day, clicks, registrations)
+                SELECT u.marketing_link_id, substr(u.join_date, 1, 10), COUNT(*), COUNT(*)
+                FROM users u
+                JOIN links l ON l.id = u.marketing_link_id
+                WHERE u.join_date IS NOT NULL
+                GROUP BY u.marketing_link_id, substr(u.join_date, 1, 10)
+            """)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Помилка при створенні таблиць аналітики посилань: {e}")
+
+
 def add_link(link_name: str, link_url: str = None):
     cursor.execute(
         "INSERT INTO links (link_name, link_url, link_count, registrations_count, purchases_count) "
@@ -52,8 +114,10 @@ def add_link(link_name: str, link_url: str = None):
 
 
 def get_all_links():
-    cursor.execute("SELECT * FROM links")
-    return cursor.fetchall()
+    cursor.execute(
+        "SELECT id, link_name, link_url, link_count, registrations_count, purchases_count FROM links"
+    )
+    return [_with_pending(row, 3) for row in cursor.fetchall()]
 
 
 def link_exists(link_id: int) -> bool:
@@ -61,48 +125,119 @@ def link_exists(link_id: int) -> bool:
     return cursor.fetchone() is not None
 
 
-def increment_link_count(link_id: int):
-    cursor.execute(
-        "UPDATE links SET link_count = link_count + 1 WHERE id = ?",
-        (link_id,),
-    )
-    conn.commit()
-
-
-def increment_link_registrations(link_id: int):
-    cursor.execute(
-        "UPDATE links SET registrations_count = registrations_count + 1 WHERE id = ?",
-        (link_id,),
-    )
-    conn.commit()
-
-
-def increment_link_purchases(link_id: int):
-    cursor.execute(
-        "UPDATE links SET purchases_count = purchases_count + 1 WHERE id = ?",
-        (link_id,),
-    )
-    conn.commit()
-
-
-def track_link_purchase(user_id: int):
+def _record_link_event(link_id: int, event_type: str, user_id: int = None, amount: float = 0.0):
+    deltas = _pending_counters.setdefault(link_id, [0, 0, 0])
+    deltas[LINK_EVENT_TYPES.index(event_type)] += 1
+    _pending_events.append((link_id, event_type, user_id, float(amount or 0), int(time.time())))
+    if len(_pending_events) >= LINK_FLUSH_THRESHOLD:
+        flush_link_counters()
+
+
+def increment_link_count(link_id: int, user_id: int = None):
+    _record_link_event(link_id, "click", user_id)
+
+
+def increment_link_registrations(link_id: int, user_id: int = None):
+    _record_link_event(link_id, "registration", user_id)
+
+
+def increment_link_purchases(link_id: int, user_id: int = None, amount: float = 0.0):
+    _record_link_event(link_id, "purchase", user_id, amount)
+
+
+def track_link_registration(link_id: int, user_id: int = None):
+    """Перехід, який закінчився реєстрацією нового користувача"""
+    increment_link_count(link_id, user_id)
+    increment_link_registrations(link_id, user_id)
+
+
+def _kyiv_day(ts: int) -> str:
+    return datetime.fromtimestamp(ts, KYIV_TZ).strftime("%Y-%m-%d")
+
+
+def _rollup(events: list) -> tuple:
+    """Згортає події в прирости погодинних і денних зрізів: ключ -> [переходи, реєстрації, покупки, виторг]"""
+    hourly, daily = {}, {}
+    for link_id, event_type, _user_id, amount, created_at in events:
+        index = LINK_EVENT_TYPES.index(event_type)
+        for buckets, key in ((hourly, (link_id, created_at - created_at % 3600)), (daily, (link_id, _kyiv_day(created_at)))):
+            row = buckets.setdefault(key, [0, 0, 0, 0.0])
+            row[index] += 1
+            if event_type == "purchase":
+                row[3] += amount
+    return hourly, daily
+
+
+def flush_link_counters() -> int:
+    """Записує накопичені прирости, події та їхні зрізи однією транзакцією; повертає кількість оновлених посилань"""
+    if not _pending_counters:
+        return 0
+    batch = [(clicks, registrations, purchases, link_id)
+             for link_id, (clicks, registrations, purchases) in _pending_counters.items()]
+    hourly, daily = _rollup(_pending_events)
+    try:
+        cursor.executemany("""
+            UPDATE links
+            SET link_count = link_count + ?,
+                registrations_count = registrations_count + ?,
+                purchases_count = purchases_count + ?
+            WHERE id = ?
+        """, batch)
+        cursor.executemany("""
+            INSERT INTO link_events (link_id, event_type, user_id, amount, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, _pending_events)
+        for table, bucket, rows in (("link_stats_hourly", "bucket_ts", hourly), ("link_stats_daily", "day", daily)):
+            cursor.executemany(f"""
+                INSERT INTO {table} (link_id, {bucket}, clicks, registrations, purchases, revenue)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(link_id, {bucket}) DO UPDATE SET
+                    clicks = clicks + excluded.clicks,
+                    registrations = registrations + excluded.registrations,
+                    purchases = purchases + excluded.purchases,
+                    revenue = revenue + excluded.revenue
+            """, [key + tuple(values) for key, values in rows.items()])
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Помилка при збереженні лічильників посилань: {e}")
+        return 0
+    _pending_counters.clear()
+    _pending_events.clear()
+    return len(batch)
+
+
+def _with_pending(row, offset: int):
+    """Додає до рядка статистики ще не записані прирости (link_count, registrations, purchases з позиції offset)"""
+    if row is None:
+        return None
+    deltas = _pending_counters.get(row[0])
+    if not deltas:
+        return row
+    row = list(row)
+    for index, delta in enumerate(deltas):
+        row[offset + index] = (row[offset + index] or 0) + delta
+    return tuple(row)
+
+
+def track_link_purchase(user_id: int, amount: float = 0.0):
     from database.client_db import get_marketing_link_id_by_user
 
     link_id = get_marketing_link_id_by_user(user_id)
     if link_id and link_exists(link_id):
-        increment_link_purchases(link_id)
+        increment_link_purchases(link_id, user_id, amount)
 
 
 def get_link_stats():
-    cursor.execute("SELECT link_name, link_count FROM links")
-    return cursor.fetchall()
+    cursor.execute("SELECT id, link_name, link_count FROM links")
+    return [(name, count + _pending_counters.get(link_id, (0,))[0]) for link_id, name, count in cursor.fetchall()]
 
 
 def get_link_detailed_stats():
     cursor.execute(
         "SELECT id, link_name, link_count, registrations_count, purchases_count FROM links"
     )
-    return cursor.fetchall()
+    return [_with_pending(row, 2) for row in cursor.fetchall()]
 
 
 def get_link_stats_row(link_id: int):
@@ -111,7 +246,7 @@ def get_link_stats_row(link_id: int):
         "FROM links WHERE id = ?",
         (link_id,),
     )
-    return cursor.fetchone()
+    return _with_pending(cursor.fetchone(), 2)
 
 
 def get_link_by_id(link_id: int):
@@ -125,10 +260,56 @@ def update_link_name(link_id: int, new_name: str):
 
 
 def delete_link(link_id: int):
+    _pending_counters.pop(link_id, None)
+    _pending_events[:] = [event for event in _pending_events if event[0] != link_id]
     cursor.execute("DELETE FROM links WHERE id = ?", (link_id,))
+    for table in ("link_events", "link_stats_hourly", "link_stats_daily"):
+        cursor.execute(f"DELETE FROM {table} WHERE link_id = ?", (link_id,))
     conn.commit()
 
 
+def get_link_funnel(link_id: int, days: int = None) -> tuple:
+    """
+    Воронка посилання (переходи, реєстрації, покупки, виторг) зі зрізів:
+    None — останні 24 год з погодинних, інакше останні days днів з денних (включно з сьогодні).
+    """
+    flush_link_counters()
+    if days is None:
+        cursor.execute("""
+            SELECT COALESCE(SUM(clicks), 0), COALESCE(SUM(registrations), 0),
+                   COALESCE(SUM(purchases), 0), COALESCE(SUM(revenue), 0)
+            FROM link_stats_hourly
+            WHERE link_id = ? AND bucket_ts > ?
+        """, (link_id, int(time.time()) - 24 * 3600))
+    else:
+        since = (datetime.now(KYIV_TZ) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        cursor.execute("""
+            SELECT COALESCE(SUM(clicks), 0), COALESCE(SUM(registrations), 0),
+                   COALESCE(SUM(purchases), 0), COALESCE(SUM(revenue), 0)
+            FROM link_stats_daily
+            WHERE link_id = ? AND day >= ?
+        """, (link_id, since))
+    return cursor.fetchone()
+
+
+def get_link_daily_trend(link_id: int, days: int = 14) -> list:
+    """Денні зрізи за останні days днів, включно з днями без подій: (день, переходи, реєстрації, покупки, виторг)"""
+    flush_link_counters()
+    today = datetime.now(KYIV_TZ).date()
+    since = (today - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+    cursor.execute("""
+        SELECT day, clicks, registrations, purchases, revenue
+        FROM link_stats_daily
+        WHERE link_id = ? AND day >= ?
+    """, (link_id, since))
+    rows = {row[0]: row for row in cursor.fetchall()}
+    trend = []
+    for offset in range(days - 1, -1, -1):
+        day = (today - timedelta(days=offset)).strftime("%Y-%m-%d")
+        trend.append(rows.get(day, (day, 0, 0, 0, 0.0)))
+    return trend
+
+
 def get_users_by_language():
     cursor.execute("SELECT language, COUNT(*) FROM users GROUP BY language")
     return cursor.fetchall()
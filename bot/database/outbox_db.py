@@ -0,0 +1,98 @@
+import json
+import sqlite3
+import time
+
+from database.client_db import conn, cursor, _commit
+
+
+def create_outbox_table():
+    """Черга вихідних повідомлень і дій, які записуються в одній транзакції зі зміною стану"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                dedupe_key TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at INTEGER NOT NULL,
+                last_error TEXT,
+                created_at INTEGER NOT NULL,
+                sent_at INTEGER
+            )
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_outbox_dedupe
+            ON outbox(dedupe_key) WHERE dedupe_key IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_outbox_due
+            ON outbox(next_attempt_at) WHERE status IN ('pending', 'sending')
+        """)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці outbox: {e}")
+
+
+def enqueue_outbox(kind: str, payload: dict, dedupe_key: str = None, delay: int = 0) -> bool:
+    """Додає запис у чергу; всередині transaction() фіксується разом зі зміною стану. False — дублікат за dedupe_key."""
+    now_ts = int(time.time())
+    cursor.execute("""
+        INSERT OR IGNORE INTO outbox (kind, payload, dedupe_key, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (kind, json.dumps(payload, ensure_ascii=False), dedupe_key, now_ts + delay, now_ts))
+    added = cursor.rowcount > 0
+    _commit()
+    return added
+
+
+def claim_outbox_batch(limit: int, claim_seconds: int) -> list:
+    """
+    Забирає до limit записів, час яких настав, і позначає їх 'sending' на claim_seconds.
+    Записи, які залишились у 'sending' після падіння процесу, повертаються в роботу після спливу claim.
+    """
+    now_ts = int(time.time())
+    try:
+        cursor.execute("""
+            UPDATE outbox
+            SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?
+            WHERE id IN (
+                SELECT id FROM outbox
+                WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            )
+            RETURNING id, kind, payload, attempts
+        """, (now_ts + claim_seconds, now_ts, limit))
+        rows = cursor.fetchall()
+        _commit()
+        return [(row_id, kind, json.loads(payload), attempts) for row_id, kind, payload, attempts in rows]
+    except sqlite3.Error as e:
+        print(f"Помилка при вибірці черги outbox: {e}")
+        return []
+
+
+def mark_outbox_sent(outbox_id: int):
+    cursor.execute("""
+        UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL
+        WHERE id = ? AND status != 'sent'
+    """, (int(time.time()), outbox_id))
+    _commit()
+
+
+def mark_outbox_retry(outbox_id: int, delay: float, error: str = None):
+    cursor.execute("""
+        UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ?
+        WHERE id = ? AND status = 'sending'
+    """, (int(time.time() + delay), (error or "")[:500], outbox_id))
+    _commit()
+
+
+def mark_outbox_dead(outbox_id: int, error: str = None):
+    cursor.execute("""
+        UPDATE outbox SET status = 'dead', last_error = ?
+        WHERE id = ? AND status = 'sending'
+    """, ((error or "")[:500], outbox_id))
+    _commit()
+
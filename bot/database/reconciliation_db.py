@@ -0,0 +1,52 @@
+import sqlite3
+import time
+
+from database.client_db import cursor, _commit
+
+
+def create_reported_discrepancies_table():
+    """Розбіжності звірки, про які вже повідомили адміна (щоб звіт не повторювався після перезапуску)"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reported_discrepancies (
+                kind TEXT NOT NULL,
+                invoice_id TEXT NOT NULL,
+                reported_at INTEGER NOT NULL,
+                PRIMARY KEY (kind, invoice_id)
+            )
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці reported_discrepancies: {e}")
+
+
+def get_reported_discrepancies(keys: list) -> set:
+    """Які з пар (вид, invoice_id) уже були у звіті"""
+    reported = set()
+    keys = list(keys)
+    try:
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            cursor.execute(
+                "SELECT kind, invoice_id FROM reported_discrepancies WHERE "
+                + " OR ".join(["(kind = ? AND invoice_id = ?)"] * len(chunk)),
+                [value for key in chunk for value in key],
+            )
+            reported.update(cursor.fetchall())
+    except sqlite3.Error as e:
+        print(f"Помилка при вибірці повідомлених розбіжностей: {e}")
+    return reported
+
+
+def mark_discrepancies_reported(keys: list, keep_seconds: int):
+    """
+    Позначає розбіжності як повідомлені (всередині transaction() — разом зі звітом у черзі) і забуває
+    старші за keep_seconds: такі операції вже вийшли з вікна виписки і знову не з'являться.
+    """
+    now = int(time.time())
+    cursor.executemany(
+        "INSERT OR REPLACE INTO reported_discrepancies (kind, invoice_id, reported_at) VALUES (?, ?, ?)",
+        [(kind, invoice_id, now) for kind, invoice_id in keys],
+    )
+    cursor.execute("DELETE FROM reported_discrepancies WHERE reported_at < ?", (now - keep_seconds,))
+    _commit()
@@ -0,0 +1,128 @@
+import sqlite3
+import time
+from typing import NamedTuple
+
+from config import DB_PATH
+
+conn = sqlite3.connect(DB_PATH)
+cursor = conn.cursor()
+
+# Як часто (секунд) звіряти версію налаштувань з БД — ловить зміни з вебдодатку чи вручну
+SETTINGS_CHECK_INTERVAL = 5
+
+
+class Setting(NamedTuple):
+    table: str
+    type: type
+    default: object
+
+
+# Реєстр відомих налаштувань: ключ -> таблиця, тип значення, значення за замовчуванням
+SETTINGS = {
+    "referral_percent": Setting("partner_settings", float, 20.0),
+}
+
+_values: dict = {}
+_version = None
+_checked_at = 0.0
+
+
+def create_settings_version_table():
+    """Лічильник версії налаштувань, який тригери збільшують при будь-якій зміні partner_settings"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS settings_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO settings_version (id, version) VALUES (1, 0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_partner_settings_version_{event.lower()}
+                AFTER {event} ON partner_settings
+                BEGIN
+                    UPDATE settings_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці settings_version: {e}")
+
+
+def _parse(key: str, raw):
+    setting = SETTINGS[key]
+    if raw is None:
+        return setting.default
+    try:
+        return setting.type(raw)
+    except (ValueError, TypeError):
+        return setting.default
+
+
+def _read_version():
+    cursor.execute("SELECT version FROM settings_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def refresh_settings():
+    """Перечитує всі зареєстровані налаштування в пам'ять одним запитом на таблицю"""
+    global _version, _checked_at
+    try:
+        version = _read_version()
+        values = {key: setting.default for key, setting in SETTINGS.items()}
+        for table in {setting.table for setting in SETTINGS.values()}:
+            cursor.execute(f"SELECT key, value FROM {table}")
+            for key, raw in cursor.fetchall():
+                if key in SETTINGS and SETTINGS[key].table == table:
+                    values[key] = _parse(key, raw)
+        _values.clear()
+        _values.update(values)
+        _version = version
+    except sqlite3.Error as e:
+        print(f"Помилка при завантаженні налаштувань: {e}")
+    _checked_at = time.monotonic()
+
+
+def _ensure_fresh():
+    global _checked_at
+    now = time.monotonic()
+    if _values and now - _checked_at < SETTINGS_CHECK_INTERVAL:
+        return
+    try:
+        version = _read_version()
+    except sqlite3.Error as e:
+        print(f"Помилка при перевірці версії налаштувань: {e}")
+        version = None
+    if not _values or version is None or version != _version:
+        refresh_settings()
+    else:
+        _checked_at = now
+
+
+def get_setting(key: str):
+    """Значення налаштування з пам'яті; до БД звертаємось не частіше ніж раз на SETTINGS_CHECK_INTERVAL"""
+    _ensure_fresh()
+    return _values.get(key, SETTINGS[key].default)
+
+
+def set_setting(key: str, value) -> bool:
+    """Зберігає налаштування і одразу оновлює кеш"""
+    setting = SETTINGS[key]
+    try:
+        typed = setting.type(value)
+    except (ValueError, TypeError):
+        print(f"Некоректне значення для налаштування {key}: {value}")
+        return False
+    try:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {setting.table} (key, value) VALUES (?, ?)",
+            (key, str(typed)),
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при збереженні налаштування {key}: {e}")
+        return False
+    refresh_settings()
+    return True
@@ -0,0 +1,101 @@
+import sqlite3
+import time
+
+from database.client_db import cursor, _commit, _payment_ts
+
+# Результат перевірки токена чинний стільки часу: повторний запуск не ходить у Monobank, а старіший
+# вердикт «недійсний» не скасовує підписку — вона йде на звичайне списання
+TOKEN_HEALTH_TTL = 20 * 3600
+
+
+def create_token_health_table():
+    """Результати попередньої перевірки токенів карток перед днем списання (один рядок на користувача)"""
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS token_health (
+                user_id INTEGER PRIMARY KEY,
+                card_token TEXT NOT NULL,
+                status TEXT NOT NULL,
+                reason TEXT,
+                checked_at INTEGER NOT NULL,
+                notified_at INTEGER
+            )
+        """)
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при створенні таблиці token_health: {e}")
+
+
+def get_tokens_to_check(until: str, fresh_after: int) -> list:
+    """
+    Активні токени користувачів з підписками до списання до until (київський 'YYYY-MM-DD HH:MM:SS'),
+    для яких немає результату перевірки того ж токена, свіжішого за fresh_after (unix-час).
+    """
+    try:
+        cursor.execute("""
+            SELECT t.user_id, t.wallet_id, t.card_token
+            FROM recurring_subscriptions r
+            JOIN user_tokens t ON t.user_id = r.user_id AND t.is_active = 1
+            LEFT JOIN token_health h ON h.user_id = t.user_id AND h.card_token = t.card_token
+            WHERE r.status = 'active' AND r.next_payment_ts <= ?
+            AND (h.checked_at IS NULL OR h.checked_at < ?)
+            GROUP BY t.user_id
+        """, (_payment_ts(until), fresh_after))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка при вибірці токенів для перевірки: {e}")
+        return []
+
+
+def save_token_health(results: list):
+    """
+    Зберігає результати перевірки [(user_id, card_token, status, reason)].
+    Позначка про надіслане попередження лишається, поки токен той самий.
+    """
+    now = int(time.time())
+    try:
+        cursor.executemany("""
+            INSERT INTO token_health (user_id, card_token, status, reason, checked_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                notified_at = CASE WHEN token_health.card_token = excluded.card_token THEN token_health.notified_at END,
+                card_token = excluded.card_token,
+                status = excluded.status,
+                reason = excluded.reason,
+                checked_at = excluded.checked_at
+        """, [(user_id, card_token, status, reason, now) for user_id, card_token, status, reason in results])
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при збереженні перевірки токенів: {e}")
+
+
+def get_invalid_token_subscriptions(until: str, unnotified_only: bool = False) -> list:
+    """
+    Активні підписки зі слотом списання до until, чий поточний токен перевірка визнала недійсним
+    не раніше ніж TOKEN_HEALTH_TTL тому: (id, user_id, product_name, price, next_payment_date, masked_card, reason).
+    """
+    try:
+        cursor.execute(f"""
+            SELECT r.id, r.user_id, r.product_name, r.price, r.next_payment_date, t.masked_card, h.reason
+            FROM recurring_subscriptions r
+            JOIN user_tokens t ON t.user_id = r.user_id AND t.is_active = 1
+            JOIN token_health h ON h.user_id = t.user_id AND h.card_token = t.card_token
+            WHERE r.status = 'active' AND r.charge_slot_ts <= ? AND h.status = 'invalid' AND h.checked_at >= ?
+            {"AND h.notified_at IS NULL" if unnotified_only else ""}
+            ORDER BY r.charge_slot_ts, r.id
+        """, (_payment_ts(until), int(time.time()) - TOKEN_HEALTH_TTL))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Помилка при вибірці підписок з недійсним токеном: {e}")
+        return []
+
+
+def mark_token_health_notified(user_ids: list):
+    try:
+        cursor.executemany(
+            "UPDATE token_health SET notified_at = ? WHERE user_id = ?",
+            [(int(time.time()), user_id) for user_id in user_ids],
+        )
+        _commit()
+    except sqlite3.Error as e:
+        print(f"Помилка при позначенні попереджень про токен: {e}")
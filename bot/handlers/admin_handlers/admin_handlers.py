@@ -6,6 +6,8 @@ from keyboards.client_keyboards import get_start_keyboard
 from keyboards.admin_keyboards import admin_keyboard
 from Content.texts import get_greeting_message, get_calendar_emoji_html, get_premium_emoji
 from database.admin_db import get_admin_subscriptions_stats
+from database.analytics_db import get_analytics_snapshot_time
+from ulits.middlewares import throttle_counters
 
 router = Router()
 
@@ -73,6 +75,13 @@ async def statistic_handler(message: types.Message):
         f"<b>{get_calendar_emoji_html()} Деталі за сьогодні</b>\n"
         f"• Одноразові: {stats.get('today_payments_count', 0)} шт. / {stats.get('today_revenue', 0):.2f} ₴\n"
         f"• Автосписання: {stats.get('today_auto_payments_count', 0)} шт. / {stats.get('today_auto_revenue', 0):.2f} ₴\n"
-        f"• Невдалих авто: <b>{stats.get('today_failed_payments', 0)}</b>\n"
+        f"• Невдалих авто: <b>{stats.get('today_failed_payments', 0)}</b>\n\n"
+        f"<b>🛡 Антифлуд</b> (з моменту запуску)\n"
+        f"• Дублікатів натискань: {throttle_counters['duplicate_callbacks']}\n"
+        f"• Відкинуто натискань: {throttle_counters['throttled_callbacks']}\n"
+        f"• Відкинуто повідомлень: {throttle_counters['throttled_updates']}\n"
     )
+    snapshot_at = get_analytics_snapshot_time()
+    if snapshot_at:
+        response_message += f"\n<i>Дані станом на {snapshot_at.strftime('%H:%M')}</i>"
     await message.answer(response_message, parse_mode="HTML")
@@ -1,6 +1,7 @@
 from aiogram import Router, types, F
 from ulits.filters import IsAdmin
 from main import bot
+from ulits.callbacks import PartnerPercentCallback, PartnerListCallback, PartnerUserCallback, WithdrawCallback
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from Content.texts import get_person_emoji_html, get_premium_emoji, format_date, format_datetime
 from database.client_db import (
@@ -36,7 +37,7 @@ async def admin_partner_program(message: types.Message):
         f"<i>Натисніть «Список учасників», щоб переглянути всіх та деталі по кожному.</i>"
     )
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👥 Список учасників", callback_data="admin_partner_list_0")],
+        [InlineKeyboardButton(text="👥 Список учасників", callback_data=PartnerListCallback(page=0).pack())],
         [InlineKeyboardButton(text="✏️ Змінити відсоток", callback_data="admin_partner_set_percent")],
         [InlineKeyboardButton(text="📋 Запити на вивід", callback_data="admin_partner_withdrawals")],
     ])
@@ -48,13 +49,13 @@ async def admin_partner_set_percent(callback: types.CallbackQuery):
     current = get_partner_referral_percent()
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="7%", callback_data="admin_partner_percent_7"),
-            InlineKeyboardButton(text="10%", callback_data="admin_partner_percent_10"),
-            InlineKeyboardButton(text="15%", callback_data="admin_partner_percent_15"),
+            InlineKeyboardButton(text="7%", callback_data=PartnerPercentCallback(value=7).pack()),
+            InlineKeyboardButton(text="10%", callback_data=PartnerPercentCallback(value=10).pack()),
+            InlineKeyboardButton(text="15%", callback_data=PartnerPercentCallback(value=15).pack()),
         ],
         [
-            InlineKeyboardButton(text="20%", callback_data="admin_partner_percent_20"),
-            InlineKeyboardButton(text="25%", callback_data="admin_partner_percent_25"),
+            InlineKeyboardButton(text="20%", callback_data=PartnerPercentCallback(value=20).pack()),
+            InlineKeyboardButton(text="25%", callback_data=PartnerPercentCallback(value=25).pack()),
         ],
         [InlineKeyboardButton(text="← Назад", callback_data="admin_partner_back")],
     ])
@@ -66,9 +67,9 @@ async def admin_partner_set_percent(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("admin_partner_percent_"))
-async def admin_partner_percent_set(callback: types.CallbackQuery):
-    value = int(callback.data.split("_")[-1])
+@router.callback_query(IsAdmin(), PartnerPercentCallback.filter())
+async def admin_partner_percent_set(callback: types.CallbackQuery, callback_data: PartnerPercentCallback):
+    value = callback_data.value
     if set_partner_referral_percent(float(value)):
         await callback.answer(f"Відсоток змінено на {value}%", show_alert=True)
     else:
@@ -76,13 +77,13 @@ async def admin_partner_percent_set(callback: types.CallbackQuery):
     current = get_partner_referral_percent()
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="7%", callback_data="admin_partner_percent_7"),
-            InlineKeyboardButton(text="10%", callback_data="admin_partner_percent_10"),
-            InlineKeyboardButton(text="15%", callback_data="admin_partner_percent_15"),
+            InlineKeyboardButton(text="7%", callback_data=PartnerPercentCallback(value=7).pack()),
+            InlineKeyboardButton(text="10%", callback_data=PartnerPercentCallback(value=10).pack()),
+            InlineKeyboardButton(text="15%", callback_data=PartnerPercentCallback(value=15).pack()),
         ],
         [
-            InlineKeyboardButton(text="20%", callback_data="admin_partner_percent_20"),
-            InlineKeyboardButton(text="25%", callback_data="admin_partner_percent_25"),
+            InlineKeyboardButton(text="20%", callback_data=PartnerPercentCallback(value=20).pack()),
+            InlineKeyboardButton(text="25%", callback_data=PartnerPercentCallback(value=25).pack()),
         ],
         [InlineKeyboardButton(text="← Назад", callback_data="admin_partner_back")],
     ])
@@ -121,7 +122,7 @@ async def admin_partner_back(callback: types.CallbackQuery):
         f"<i>Натисніть «Список учасників», щоб переглянути всіх та деталі по кожному.</i>"
     )
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="👥 Список учасників", callback_data="admin_partner_list_0")],
+        [InlineKeyboardButton(text="👥 Список учасників", callback_data=PartnerListCallback(page=0).pack())],
         [InlineKeyboardButton(text="✏️ Змінити відсоток", callback_data="admin_partner_set_percent")],
         [InlineKeyboardButton(text="📋 Запити на вивід", callback_data="admin_partner_withdrawals")],
     ])
@@ -129,9 +130,9 @@ async def admin_partner_back(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("admin_partner_list_"))
-async def admin_partner_list_page(callback: types.CallbackQuery):
-    page = int(callback.data.split("_")[-1])
+@router.callback_query(IsAdmin(), PartnerListCallback.filter())
+async def admin_partner_list_page(callback: types.CallbackQuery, callback_data: PartnerListCallback):
+    page = callback_data.page
     total_count = get_partner_participants_count()
     if total_count == 0:
         await callback.message.edit_text(
@@ -158,12 +159,12 @@ async def admin_partner_list_page(callback: types.CallbackQuery):
         label = f"{name} | {balance:.0f} ₴ | реф: {ref_count}"
         if len(label) > 35:
             label = (name or str(uid))[:20] + f" | {uid}"
-        kb_rows.append([InlineKeyboardButton(text=label, callback_data=f"admin_partner_user_{page}_{uid}")])
+        kb_rows.append([InlineKeyboardButton(text=label, callback_data=PartnerUserCallback(page=page, user_id=uid).pack())])
     nav = []
     if page > 0:
-        nav.append(InlineKeyboardButton(text="← Назад", callback_data=f"admin_partner_list_{page - 1}"))
+        nav.append(InlineKeyboardButton(text="← Назад", callback_data=PartnerListCallback(page=page - 1).pack()))
     if page < total_pages - 1:
-        nav.append(InlineKeyboardButton(text="Вперед →", callback_data=f"admin_partner_list_{page + 1}"))
+        nav.append(InlineKeyboardButton(text="Вперед →", callback_data=PartnerListCallback(page=page + 1).pack()))
     if nav:
         kb_rows.append(nav)
     kb_rows.append([InlineKeyboardButton(text="← До меню партнерки", callback_data="admin_partner_back")])
@@ -180,11 +181,10 @@ def _format_partner_detail(user_id: int, user_name: str, balance: float, ref_cou
     return text
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("admin_partner_user_"))
-async def admin_partner_user_detail(callback: types.CallbackQuery):
-    parts = callback.data.split("_")
-    user_id = int(parts[-1])
-    from_list_page = int(parts[-2]) if len(parts) >= 5 and parts[-2].isdigit() else 0
+@router.callback_query(IsAdmin(), PartnerUserCallback.filter())
+async def admin_partner_user_detail(callback: types.CallbackQuery, callback_data: PartnerUserCallback):
+    user_id = callback_data.user_id
+    from_list_page = callback_data.page
     participants = get_all_partner_participants(9999, 0)
     partner_row = next((r for r in participants if r[0] == user_id), None)
     if not partner_row:
@@ -231,7 +231,7 @@ async def admin_partner_user_detail(callback: types.CallbackQuery):
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="👤 Написати", url=f"tg://user?id={user_id}")],
-        [InlineKeyboardButton(text="← До списку учасників", callback_data=f"admin_partner_list_{from_list_page}")],
+        [InlineKeyboardButton(text="← До списку учасників", callback_data=PartnerListCallback(page=from_list_page).pack())],
         [InlineKeyboardButton(text="← До меню партнерки", callback_data="admin_partner_back")],
     ])
     if len(text) > 4000:
@@ -240,9 +240,9 @@ async def admin_partner_user_detail(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("admin_withdraw_done_"))
-async def admin_withdraw_done(callback: types.CallbackQuery):
-    req_id = int(callback.data.split("_")[-1])
+@router.callback_query(IsAdmin(), WithdrawCallback.filter(F.action == "done"))
+async def admin_withdraw_done(callback: types.CallbackQuery, callback_data: WithdrawCallback):
+    req_id = callback_data.request_id
     row = get_withdrawal_request_by_id(req_id)
     if not row:
         await callback.answer("Запит не знайдено.", show_alert=True)
@@ -270,9 +270,9 @@ async def admin_withdraw_done(callback: types.CallbackQuery):
         await callback.answer("Помилка при списанні балансу.", show_alert=True)
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("admin_withdraw_reject_"))
-async def admin_withdraw_reject(callback: types.CallbackQuery):
-    req_id = int(callback.data.split("_")[-1])
+@router.callback_query(IsAdmin(), WithdrawCallback.filter(F.action == "reject"))
+async def admin_withdraw_reject(callback: types.CallbackQuery, callback_data: WithdrawCallback):
+    req_id = callback_data.request_id
     row = get_withdrawal_request_by_id(req_id)
     if not row:
         await callback.answer("Запит не знайдено.", show_alert=True)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+
+from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.types import FSInputFile
+
+from keyboards.admin_keyboards import admin_keyboard, cancel_button, get_export_period_keyboard, get_export_format_keyboard
+from ulits.admin_states import ExportStates
+from ulits.callbacks import ExportPeriodCallback, ExportRunCallback
+from ulits.exporter import EXPORT_FORMATS, EXPORT_MAX_BYTES, build_export, export_file_name
+from ulits.filters import IsAdmin
+
+router = Router()
+
+# Один експорт на процес: кожен тримає відкрите читання та тимчасовий файл
+_export_lock = asyncio.Lock()
+
+_DATE_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2}|\d{2}\.\d{2}\.\d{4})")
+EXPORT_HELP = (
+    "📤 <b>Експорт</b>\n\n"
+    "Платежі, автоплатежі, підписки, повторювані підписки та партнерські нарахування за період.\n"
+    "Оберіть період або надішліть команду: <code>/export 2026-01-01 2026-01-31 xlsx</code>"
+)
+
+
+def _parse_date(value: str) -> date:
+    if "." in value:
+        return datetime.strptime(value, "%d.%m.%Y").date()
+    return date.fromisoformat(value)
+
+
+def parse_export_period(text: str):
+    """Два дати у форматі РРРР-ММ-ДД або ДД.ММ.РРРР; None, якщо період не розібрано."""
+    found = _DATE_PATTERN.findall(text or "")
+    if len(found) != 2:
+        return None
+    try:
+        date_from, date_to = _parse_date(found[0]), _parse_date(found[1])
+    except ValueError:
+        return None
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return date_from, date_to
+
+
+def _preset_period(preset: str):
+    today = date.today()
+    if preset == "month":
+        return today.replace(day=1), today
+    if preset == "prev":
+        last_day = today.replace(day=1) - timedelta(days=1)
+        return last_day.replace(day=1), last_day
+    if preset == "30":
+        return today - timedelta(days=29), today
+    return date(2000, 1, 1), today
+
+
+def _period_text(date_from: date, date_to: date) -> str:
+    return f"{date_from:%d.%m.%Y} — {date_to:%d.%m.%Y}"
+
+
+async def send_export(message: types.Message, export_format: str, date_from: date, date_to: date):
+    if _export_lock.locked():
+        await message.answer("⏳ Попередній експорт ще формується, спробуйте за хвилину.")
+        return
+    async with _export_lock:
+        progress = await message.answer(f"⏳ Формую {export_format.upper()} за {_period_text(date_from, date_to)}...")
+        path = None
+        try:
+            path, counts = await asyncio.to_thread(build_export, export_format, date_from, date_to)
+            if os.path.getsize(path) > EXPORT_MAX_BYTES:
+                await progress.edit_text("❌ Файл більший за 50 МБ — оберіть коротший період.")
+                return
+            caption = f"📤 <b>Експорт за {_period_text(date_from, date_to)}</b>\n\n" + "\n".join(
+                f"• {table}: {count}" for table, count in counts.items()
+            )
+            await message.answer_document(
+                FSInputFile(path, filename=export_file_name(export_format, date_from, date_to)),
+                caption=caption,
+                parse_mode="HTML",
+            )
+            await progress.delete()
+        except Exception as e:
+            logging.error(f"Помилка експорту: {e}", exc_info=True)
+            await progress.edit_text("❌ Не вдалося сформувати експорт.")
+        finally:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+@router.message(IsAdmin(), F.text == "📤 Експорт")
+async def export_menu(message: types.Message):
+    await message.answer(EXPORT_HELP, parse_mode="HTML", reply_markup=get_export_period_keyboard())
+
+
+@router.message(IsAdmin(), Command("export"))
+async def export_command(message: types.Message, command: CommandObject):
+    args = command.args or ""
+    period = parse_export_period(args)
+    if not period:
+        await message.answer(EXPORT_HELP, parse_mode="HTML", reply_markup=get_export_period_keyboard())
+        return
+    export_format = "xlsx" if "xlsx" in args.lower() else "csv"
+    await send_export(message, export_format, *period)
+
+
+@router.callback_query(IsAdmin(), F.data == "export_back")
+async def export_back(callback: types.CallbackQuery):
+    await callback.message.edit_text(EXPORT_HELP, parse_mode="HTML", reply_markup=get_export_period_keyboard())
+    await callback.answer()
+
+
+@router.callback_query(IsAdmin(), ExportPeriodCallback.filter(F.preset == "custom"))
+async def export_custom_period(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.answer(
+        "Введіть період двома датами, наприклад: <code>01.01.2026 31.01.2026</code>",
+        parse_mode="HTML",
+        reply_markup=cancel_button(),
+    )
+    await state.set_state(ExportStates.waiting_for_period)
+    await callback.answer()
+
+
+@router.callback_query(IsAdmin(), ExportPeriodCallback.filter())
+async def export_choose_format(callback: types.CallbackQuery, callback_data: ExportPeriodCallback):
+    date_from, date_to = _preset_period(callback_data.preset)
+    await callback.message.edit_text(
+        f"📤 <b>Експорт за {_period_text(date_from, date_to)}</b>\n\nОберіть формат:",
+        parse_mode="HTML",
+        reply_markup=get_export_format_keyboard(date_from, date_to),
+    )
+    await callback.answer()
+
+
+@router.message(IsAdmin(), ExportStates.waiting_for_period)
+async def export_process_period(message: types.Message, state: FSMContext):
+    if message.text == "Скасувати":
+        await state.clear()
+        await message.answer("Відміна", reply_markup=admin_keyboard())
+        return
+    period = parse_export_period(message.text)
+    if not period:
+        await message.answer("❌ Не вдалося розібрати дати. Приклад: <code>01.01.2026 31.01.2026</code>", parse_mode="HTML")
+        return
+    await state.clear()
+    date_from, date_to = period
+    await message.answer("Період прийнято", reply_markup=admin_keyboard())
+    await message.answer(
+        f"📤 <b>Експорт за {_period_text(date_from, date_to)}</b>\n\nОберіть формат:",
+        parse_mode="HTML",
+        reply_markup=get_export_format_keyboard(date_from, date_to),
+    )
+
+
+@router.callback_query(IsAdmin(), ExportRunCallback.filter(F.export_format.in_(EXPORT_FORMATS)))
+async def export_run(callback: types.CallbackQuery, callback_data: ExportRunCallback):
+    await callback.answer("Формую файл...")
+    date_from = datetime.strptime(callback_data.date_from, "%Y%m%d").date()
+    date_to = datetime.strptime(callback_data.date_to, "%Y%m%d").date()
+    await send_export(callback.message, callback_data.export_format, date_from, date_to)
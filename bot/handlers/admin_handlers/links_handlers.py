@@ -2,35 +2,35 @@ from aiogram import Router, types, F
 from aiogram.exceptions import TelegramBadRequest
 from ulits.filters import IsAdmin
 from aiogram.fsm.context import FSMContext
-from keyboards.admin_keyboards import get_links_keyboard, cancel_button, admin_keyboard, get_link_stats_keyboard, get_delete_link_confirm_keyboard
+from keyboards.admin_keyboards import get_links_keyboard, cancel_button, admin_keyboard, get_link_stats_keyboard, get_delete_link_confirm_keyboard, get_link_trend_keyboard
 from database.links_db import (
     get_link_by_id,
     update_link_name,
     delete_link,
     add_link,
     get_link_stats_row,
+    get_link_funnel,
+    get_link_daily_trend,
     build_link_start_payload,
 )
 from main import bot
 from ulits.admin_states import LinkStates
+from ulits.callbacks import LinkCallback
+from html import escape
 
 
 router = Router()
 
 
-def _mlink_id(callback: types.CallbackQuery, prefix: str) -> int:
-    return int(callback.data.removeprefix(prefix))
-
-
 @router.message(IsAdmin(), lambda message: message.text == "Посилання")
 async def manage_links(message: types.Message):
     await message.answer("Оберіть посилання для перегляду статистики або додайте нове:", 
                         reply_markup=get_links_keyboard())
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("mlink_stats_"))
-async def show_link_stats(callback: types.CallbackQuery):
-    link_id = _mlink_id(callback, "mlink_stats_")
+@router.callback_query(IsAdmin(), LinkCallback.filter(F.action == "stats"))
+async def show_link_stats(callback: types.CallbackQuery, callback_data: LinkCallback):
+    link_id = callback_data.link_id
     link_data = get_link_by_id(link_id)
     me = await bot.get_me()
     if link_data:
@@ -61,9 +61,52 @@ async def show_link_stats(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("mlink_edit_"))
-async def edit_link_start(callback: types.CallbackQuery, state: FSMContext):
-    link_id = _mlink_id(callback, "mlink_edit_")
+def _percent(part: int, whole: int) -> str:
+    return f"{part / whole * 100:.1f}%" if whole else "—"
+
+
+def _format_funnel(title: str, funnel: tuple) -> str:
+    clicks, registrations, purchases, revenue = funnel
+    return (
+        f"<b>{title}:</b> {clicks} пер. → {registrations} реєстр. ({_percent(registrations, clicks)}) "
+        f"→ {purchases} покуп. ({_percent(purchases, registrations)}) · {revenue:.2f}₴"
+    )
+
+
+@router.callback_query(IsAdmin(), LinkCallback.filter(F.action == "trend"))
+async def show_link_trend(callback: types.CallbackQuery, callback_data: LinkCallback):
+    link_id = callback_data.link_id
+    link_data = get_link_by_id(link_id)
+    if not link_data:
+        await callback.answer("Посилання не знайдено", show_alert=True)
+        return
+
+    funnels = "\n".join(
+        _format_funnel(title, get_link_funnel(link_id, days))
+        for title, days in (("24 год", None), ("7 днів", 7), ("30 днів", 30))
+    )
+    trend_lines = [f"{'Дата':<5}{'пер.':>6}{'реєс.':>6}{'пок.':>6}{'виторг':>9}"]
+    for day, clicks, registrations, purchases, revenue in get_link_daily_trend(link_id, 14):
+        trend_lines.append(f"{day[8:10]}.{day[5:7]}{clicks:>6}{registrations:>6}{purchases:>6}{revenue:>9.0f}")
+    trend = "\n".join(trend_lines)
+
+    try:
+        await callback.message.edit_text(
+            f"<b>📈 Динаміка посилання:</b> {escape(link_data[0] or '')}\n\n"
+            f"<b>Воронка</b> (переходи → реєстрації → покупки · виторг):\n{funnels}\n\n"
+            f"<b>По днях (14 днів):</b>\n<pre>{trend}</pre>",
+            parse_mode="HTML",
+            reply_markup=get_link_trend_keyboard(link_id)
+        )
+    except TelegramBadRequest:
+        await callback.answer("✅ Статистика оновлена", show_alert=False)
+        return
+    await callback.answer()
+
+
+@router.callback_query(IsAdmin(), LinkCallback.filter(F.action == "edit"))
+async def edit_link_start(callback: types.CallbackQuery, state: FSMContext, callback_data: LinkCallback):
+    link_id = callback_data.link_id
     await state.update_data(edit_link_id=link_id)
     await callback.message.answer("Введіть нову назву для посилання:", reply_markup=cancel_button())
     await state.set_state(LinkStates.waiting_for_edit_name)
@@ -96,9 +139,9 @@ async def process_edit_link(message: types.Message, state: FSMContext):
     await state.clear()
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("mlink_delete_"))
-async def delete_link_confirm(callback: types.CallbackQuery):
-    link_id = _mlink_id(callback, "mlink_delete_")
+@router.callback_query(IsAdmin(), LinkCallback.filter(F.action == "delete"))
+async def delete_link_confirm(callback: types.CallbackQuery, callback_data: LinkCallback):
+    link_id = callback_data.link_id
     await callback.message.edit_text(
         "❗️ Ви впевнені, що хочете видалити це посилання?\n"
         "Цю дію неможливо відмінити.",
@@ -107,9 +150,9 @@ async def delete_link_confirm(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(IsAdmin(), F.data.startswith("mlink_confirm_del_"))
-async def delete_link_process(callback: types.CallbackQuery):
-    link_id = _mlink_id(callback, "mlink_confirm_del_")
+@router.callback_query(IsAdmin(), LinkCallback.filter(F.action == "confirm_del"))
+async def delete_link_process(callback: types.CallbackQuery, callback_data: LinkCallback):
+    link_id = callback_data.link_id
     delete_link(link_id)
     
     await callback.message.edit_text(
@@ -15,6 +15,8 @@ import asyncio
 router = Router()
 
 user_data = {}
+# Посилання на фонові розсилки, щоб задачі не зібрав GC до завершення
+_broadcast_tasks = set()
 
 
 @router.message(IsAdmin(), lambda message: message.text == "Розсилка")
@@ -236,6 +238,16 @@ async def handle_publish_confirmation(callback_query: types.CallbackQuery, state
 
     bell = user_data[user_id].get('bell', 0) 
     disable_notification = (bell == 0)
+    reply_markup = post_keyboard(user_data, user_id, url_buttons)
+    # Розсилка триває довго: у фоні, щоб не тримати чергу апдейтів адміна (UserSerializationMiddleware)
+    task = asyncio.create_task(run_broadcast(
+        callback_query.message, media_info, media_type, content_info, reply_markup, disable_notification
+    ))
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
+
+
+async def run_broadcast(report_message: types.Message, media_info, media_type, content_info, reply_markup, disable_notification):
     user_ids = get_all_user_ids()
 
     sent_count = 0
@@ -243,19 +255,19 @@ async def handle_publish_confirmation(callback_query: types.CallbackQuery, state
         try:
             if media_info:
                 if media_type == 'photo':
-                    await bot.send_photo(recipient_id, media_info, caption=content_info, parse_mode='HTML', reply_markup=post_keyboard(user_data, user_id, url_buttons), disable_notification=disable_notification)
+                    await bot.send_photo(recipient_id, media_info, caption=content_info, parse_mode='HTML', reply_markup=reply_markup, disable_notification=disable_notification)
                 elif media_type == 'video':
-                    await bot.send_video(recipient_id, media_info, caption=content_info, parse_mode='HTML', reply_markup=post_keyboard(user_data, user_id, url_buttons), disable_notification=disable_notification)
+                    await bot.send_video(recipient_id, media_info, caption=content_info, parse_mode='HTML', reply_markup=reply_markup, disable_notification=disable_notification)
                 elif media_type == 'document':
-                    await bot.send_document(recipient_id, media_info, caption=content_info, parse_mode='HTML', reply_markup=post_keyboard(user_data, user_id, url_buttons), disable_notification=disable_notification)
+                    await bot.send_document(recipient_id, media_info, caption=content_info, parse_mode='HTML', reply_markup=reply_markup, disable_notification=disable_notification)
             else:
-                await bot.send_message(recipient_id, content_info, parse_mode='HTML', reply_markup=post_keyboard(user_data, user_id, url_buttons), disable_notification=disable_notification)
+                await bot.send_message(recipient_id, content_info, parse_mode='HTML', reply_markup=reply_markup, disable_notification=disable_notification)
             sent_count += 1
         except Exception as e:
             print(f"Failed to send message to user {recipient_id}: {e}")
         await asyncio.sleep(2)
 
-    await callback_query.message.answer(f"Пост опубліковано для {sent_count} користувачів!")
+    await report_message.answer(f"Пост опубліковано для {sent_count} користувачів!")
 
 
 @router.callback_query(IsAdmin(), F.data == "mail_back")
@@ -28,9 +28,9 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from Content.texts import get_calendar_emoji_html, get_premium_emoji
 from ulits.admin_states import AddProduct, EditProduct
 from ulits.admin_functions import format_message_text, format_product_price_tariffs, is_tariff_price
+from ulits.image_store import store_product_image
+from ulits.callbacks import AdminCatalogCallback, AdminProductCallback, PaymentTypeCallback
 from aiogram.types import CallbackQuery
-import os
-from datetime import datetime
 import logging
 
 
@@ -46,9 +46,9 @@ async def support(message: types.Message):
     )
 
 
-@router.callback_query(F.data.startswith("admincategory_"))
-async def show_products(callback: types.CallbackQuery):
-    catalog_id = int(callback.data.split("_")[1])
+@router.callback_query(AdminCatalogCallback.filter(F.action == "view"))
+async def show_products(callback: types.CallbackQuery, callback_data: AdminCatalogCallback):
+    catalog_id = callback_data.catalog_id
     await callback.message.edit_text(
         text="<b>Оберіть товар для редагування</b>",
         parse_mode="HTML",
@@ -56,9 +56,9 @@ async def show_products(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("adminproduct_"))
-async def show_product_info(callback: types.CallbackQuery):
-    product_id = int(callback.data.split("_")[1])
+@router.callback_query(AdminProductCallback.filter(F.action == "view"))
+async def show_product_info(callback: types.CallbackQuery, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
 
     product = get_product_by_id(product_id)
     if not product:
@@ -108,7 +108,7 @@ async def add_product(message: types.Message, state: FSMContext):
             [
                 InlineKeyboardButton(
                     text=category_type,
-                    callback_data=f"addproduct_category_{category_id}",
+                    callback_data=AdminCatalogCallback(action="add", catalog_id=category_id).pack(),
                 )
             ]
         )
@@ -153,8 +153,8 @@ async def process_new_category_name(message: types.Message, state: FSMContext):
     await state.set_state(AddProduct.waiting_for_name)
 
 
-@router.callback_query(F.data.startswith("addproduct_category_"))
-async def process_category_selected(callback: types.CallbackQuery, state: FSMContext):
+@router.callback_query(AdminCatalogCallback.filter(F.action == "add"))
+async def process_category_selected(callback: types.CallbackQuery, state: FSMContext, callback_data: AdminCatalogCallback):
     if callback.data == "❌ Скасувати" or callback.data == "/start":
         await state.clear()
         await callback.message.answer(
@@ -163,7 +163,7 @@ async def process_category_selected(callback: types.CallbackQuery, state: FSMCon
         )
         return
 
-    category_id = int(callback.data.split("_")[2])
+    category_id = callback_data.catalog_id
     categories = get_all_categories()
     category_type = next((type_ for id_, type_ in categories if id_ == category_id), None)
 
@@ -254,10 +254,10 @@ async def process_photo(message: types.Message, state: FSMContext):
 
 
 @router.callback_query(
-    AddProduct.waiting_for_payment_type, F.data.startswith("payment_type_")
+    AddProduct.waiting_for_payment_type, PaymentTypeCallback.filter()
 )
-async def process_payment_type(callback: types.CallbackQuery, state: FSMContext):
-    payment_type = callback.data.split("_")[2]
+async def process_payment_type(callback: types.CallbackQuery, state: FSMContext, callback_data: PaymentTypeCallback):
+    payment_type = callback_data.payment_type
 
     await state.update_data(payment_type=payment_type)
 
@@ -336,15 +336,7 @@ async def confirm_product(callback: types.CallbackQuery, state: FSMContext):
     data = await state.get_data()
 
     try:
-        from config import CONTENT_PRODUCTS_DIR
-        if not os.path.exists(CONTENT_PRODUCTS_DIR):
-            os.makedirs(CONTENT_PRODUCTS_DIR)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        file_name_local = os.path.join(CONTENT_PRODUCTS_DIR, f"product_{timestamp}.jpg")
-        file_name_for_db = f"Content/products/product_{timestamp}.jpg"
-
-        await bot.download(data["photo_id"], destination=file_name_local)
+        file_name_for_db = await store_product_image(bot, data["photo_id"])
 
         result = add_new_product(
             category_id=data["category_id"],
@@ -366,9 +358,7 @@ async def confirm_product(callback: types.CallbackQuery, state: FSMContext):
                 "Головне меню", reply_markup=admin_keyboard()
             )
         else:
-            if os.path.exists(file_name_local):
-                os.remove(file_name_local)
-
+            # Файл не видаляємо: за хешем вмісту його можуть використовувати інші товари
             await callback.message.edit_caption(
                 caption="❌ Помилка при додаванні товару. Спробуйте ще раз.",
                 reply_markup=None,
@@ -409,19 +399,19 @@ async def cancel_product(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("delete_product_"))
-async def confirm_delete_product(callback: CallbackQuery):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "delete"))
+async def confirm_delete_product(callback: CallbackQuery, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
     keyboard = InlineKeyboardMarkup(
         inline_keyboard=[
             [
                 InlineKeyboardButton(
                     text="✅ Так, видалити",
-                    callback_data=f"confirm_delete_{product_id}",
+                    callback_data=AdminProductCallback(action="confirm_delete", product_id=product_id).pack(),
                 ),
                 InlineKeyboardButton(
                     text="❌ Ні, залишити",
-                    callback_data=f"cancel_delete_{product_id}",
+                    callback_data=AdminProductCallback(action="cancel_delete", product_id=product_id).pack(),
                 ),
             ]
         ]
@@ -433,9 +423,9 @@ async def confirm_delete_product(callback: CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("confirm_delete_"))
-async def delete_product(callback: CallbackQuery):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "confirm_delete"))
+async def delete_product(callback: CallbackQuery, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
 
     if delete_product_from_db(product_id):
         await callback.message.edit_text(
@@ -467,9 +457,9 @@ async def delete_product(callback: CallbackQuery):
         )
 
 
-@router.callback_query(F.data.startswith("cancel_delete_"))
-async def cancel_delete_product(callback: CallbackQuery):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "cancel_delete"))
+async def cancel_delete_product(callback: CallbackQuery, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
 
     product = get_product_by_id(product_id)
     if not product:
@@ -502,9 +492,9 @@ async def cancel_delete_product(callback: CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("edit_product_"))
-async def show_edit_options(callback: CallbackQuery):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "edit"))
+async def show_edit_options(callback: CallbackQuery, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
 
     product = get_product_by_id(product_id)
     if not product:
@@ -538,9 +528,9 @@ async def show_edit_options(callback: CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("back_to_product_"))
-async def back_to_product(callback: CallbackQuery):
-    product_id = int(callback.data.split("_")[3])
+@router.callback_query(AdminProductCallback.filter(F.action == "back"))
+async def back_to_product(callback: CallbackQuery, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
 
     product = get_product_by_id(product_id)
     if not product:
@@ -573,9 +563,9 @@ async def back_to_product(callback: CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("edit_name_"))
-async def start_edit_name(callback: CallbackQuery, state: FSMContext):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "edit_name"))
+async def start_edit_name(callback: CallbackQuery, state: FSMContext, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
     await state.update_data(product_id=product_id)
 
     await callback.message.answer(
@@ -585,9 +575,9 @@ async def start_edit_name(callback: CallbackQuery, state: FSMContext):
     await state.set_state(EditProduct.waiting_for_name)
 
 
-@router.callback_query(F.data.startswith("edit_description_"))
-async def start_edit_description(callback: CallbackQuery, state: FSMContext):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "edit_description"))
+async def start_edit_description(callback: CallbackQuery, state: FSMContext, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
     await state.update_data(product_id=product_id)
 
     await callback.message.answer(
@@ -597,9 +587,9 @@ async def start_edit_description(callback: CallbackQuery, state: FSMContext):
     await state.set_state(EditProduct.waiting_for_description)
 
 
-@router.callback_query(F.data.startswith("edit_price_"))
-async def start_edit_price(callback: CallbackQuery, state: FSMContext):
-    product_id = int(callback.data.split("_")[2])
+@router.callback_query(AdminProductCallback.filter(F.action == "edit_price"))
+async def start_edit_price(callback: CallbackQuery, state: FSMContext, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
     await state.update_data(product_id=product_id)
 
     await callback.message.answer(
@@ -613,9 +603,9 @@ async def start_edit_price(callback: CallbackQuery, state: FSMContext):
     await state.set_state(EditProduct.waiting_for_price)
 
 
-@router.callback_query(F.data.startswith("edit_payment_type_"))
-async def start_edit_payment_type(callback: CallbackQuery, state: FSMContext):
-    product_id = int(callback.data.split("_")[3])
+@router.callback_query(AdminProductCallback.filter(F.action == "edit_payment_type"))
+async def start_edit_payment_type(callback: CallbackQuery, state: FSMContext, callback_data: AdminProductCallback):
+    product_id = callback_data.product_id
     await state.update_data(product_id=product_id)
 
     current_payment_type = get_product_payment_type(product_id)
@@ -731,10 +721,10 @@ async def process_new_price(message: types.Message, state: FSMContext):
 
 
 @router.callback_query(
-    EditProduct.waiting_for_payment_type, F.data.startswith("payment_type_")
+    EditProduct.waiting_for_payment_type, PaymentTypeCallback.filter()
 )
-async def process_edit_payment_type(callback: types.CallbackQuery, state: FSMContext):
-    payment_type = callback.data.split("_")[2]
+async def process_edit_payment_type(callback: types.CallbackQuery, state: FSMContext, callback_data: PaymentTypeCallback):
+    payment_type = callback_data.payment_type
 
     data = await state.get_data()
     product_id = data["product_id"]
@@ -18,6 +18,8 @@ from database.admin_db import (
     cursor,
 )
 from ulits.admin_states import SearchSubscription
+from ulits.profile_cache import invalidate_profile
+from ulits.callbacks import AdminSubscriptionCallback
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from datetime import datetime
 import logging
@@ -29,6 +31,13 @@ router = Router()
 current_page = 0
 
 
+def invalidate_subscription_owner(subscription_id: int, subscription_type: str):
+    """Скидає кеш кабінету власника підписки після дій адміністратора."""
+    details = get_subscription_details(subscription_id, subscription_type)
+    if details:
+        invalidate_profile(details[1])
+
+
 @router.message(IsAdmin(), F.text.in_(["Управління підписками"]))
 async def manage_subscriptions(message: types.Message):
     stats = get_admin_subscriptions_stats()
@@ -67,10 +76,9 @@ async def view_all_subscriptions(callback: types.CallbackQuery):
     await view_all_subscriptions_with_page(callback, current_page)
 
 
-@router.callback_query(F.data.startswith("admin_view_"))
-async def admin_view_subscription(callback: types.CallbackQuery):
-    _, _, subscription_type, subscription_id = callback.data.split("_")
-    subscription_id = int(subscription_id)
+@router.callback_query(AdminSubscriptionCallback.filter(F.action == "view"))
+async def admin_view_subscription(callback: types.CallbackQuery, callback_data: AdminSubscriptionCallback):
+    subscription_type, subscription_id = callback_data.kind, callback_data.subscription_id
 
     details = get_subscription_details(subscription_id, subscription_type)
 
@@ -148,35 +156,35 @@ async def admin_view_subscription(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("admin_activate_"))
-async def admin_activate_subscription(callback: types.CallbackQuery):
-    _, _, subscription_type, subscription_id = callback.data.split("_")
-    subscription_id = int(subscription_id)
+@router.callback_query(AdminSubscriptionCallback.filter(F.action == "activate"))
+async def admin_activate_subscription(callback: types.CallbackQuery, callback_data: AdminSubscriptionCallback):
+    subscription_type, subscription_id = callback_data.kind, callback_data.subscription_id
 
     if update_subscription_status(subscription_id, subscription_type, "active"):
+        invalidate_subscription_owner(subscription_id, subscription_type)
         await callback.answer("✅ Підписка активована", show_alert=True)
-        await admin_view_subscription(callback)
+        await admin_view_subscription(callback, callback_data.model_copy(update={"action": "view"}))
     else:
         await callback.answer("❌ Помилка при активації", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("admin_deactivate_"))
-async def admin_deactivate_subscription(callback: types.CallbackQuery):
-    _, _, subscription_type, subscription_id = callback.data.split("_")
-    subscription_id = int(subscription_id)
+@router.callback_query(AdminSubscriptionCallback.filter(F.action == "deactivate"))
+async def admin_deactivate_subscription(callback: types.CallbackQuery, callback_data: AdminSubscriptionCallback):
+    subscription_type, subscription_id = callback_data.kind, callback_data.subscription_id
 
     if update_subscription_status(subscription_id, subscription_type, "inactive"):
+        invalidate_subscription_owner(subscription_id, subscription_type)
         await callback.answer("❌ Підписка деактивована", show_alert=True)
-        await admin_view_subscription(callback)
+        await admin_view_subscription(callback, callback_data.model_copy(update={"action": "view"}))
     else:
         await callback.answer("❌ Помилка при деактивації", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("admin_delete_"))
-async def admin_delete_subscription(callback: types.CallbackQuery):
-    _, _, subscription_type, subscription_id = callback.data.split("_")
-    subscription_id = int(subscription_id)
+@router.callback_query(AdminSubscriptionCallback.filter(F.action == "delete"))
+async def admin_delete_subscription(callback: types.CallbackQuery, callback_data: AdminSubscriptionCallback):
+    subscription_type, subscription_id = callback_data.kind, callback_data.subscription_id
 
+    invalidate_subscription_owner(subscription_id, subscription_type)
     if delete_subscription(subscription_id, subscription_type):
         await callback.answer("🗑️ Підписка видалена", show_alert=True)
         await view_all_subscriptions(callback)
@@ -184,10 +192,9 @@ async def admin_delete_subscription(callback: types.CallbackQuery):
         await callback.answer("❌ Помилка при видаленні", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("admin_contact_"))
-async def admin_contact_user(callback: types.CallbackQuery):
-    _, _, subscription_type, subscription_id = callback.data.split("_")
-    subscription_id = int(subscription_id)
+@router.callback_query(AdminSubscriptionCallback.filter(F.action == "contact"))
+async def admin_contact_user(callback: types.CallbackQuery, callback_data: AdminSubscriptionCallback):
+    subscription_type, subscription_id = callback_data.kind, callback_data.subscription_id
 
     details = get_subscription_details(subscription_id, subscription_type)
 
@@ -208,7 +215,7 @@ async def admin_contact_user(callback: types.CallbackQuery):
             [
                 InlineKeyboardButton(
                     text="← Назад до підписки",
-                    callback_data=f"admin_view_{subscription_type}_{subscription_id}",
+                    callback_data=AdminSubscriptionCallback(action="view", kind=subscription_type, subscription_id=subscription_id).pack(),
                 )
             ],
         ]
@@ -506,7 +513,7 @@ async def run_payments_now(callback: types.CallbackQuery):
     )
 
     try:
-        await process_recurring_payments()
+        await process_recurring_payments.run_now(limit=None)
 
         successful = 0
         failed = 0
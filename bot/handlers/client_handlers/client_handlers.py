@@ -5,29 +5,66 @@ from main import bot, scheduler
 from aiogram.filters import Command
 from keyboards.client_keyboards import get_start_keyboard, get_socials_keyboard, get_manager_keyboard, get_catalog_keyboard, get_products_keyboard, get_product_info_keyboard, get_payment_keyboard, get_payment_choice_keyboard, get_profile_keyboard, get_back_to_profile_keyboard, get_referral_keyboard, get_contest_keyboard
 from Content.texts import get_greeting_message, get_about_text, get_faq_text, get_manager_text, get_help_text, get_referral_text, get_contest_text, MENU_EMOJI_IDS, get_calendar_emoji_html, get_tv_emoji_html, get_person_emoji_html, get_premium_emoji, format_date, format_product_name_for_display
-from database.client_db import create_table, check_user, add_user, create_products_table, get_product_by_id, save_payment_info, create_payments_table, create_subscriptions_table, get_user_info, get_user_subscriptions, get_user_name, cursor, conn, create_contest_table, get_partner_balance, get_partner_referral_percent, get_partner_earnings_history, create_withdrawal_request, deduct_partner_balance, add_subscription, get_product_type
-from database.links_db import LINK_START_PREFIX, increment_link_count, link_exists
-from ulits.monopay_functions import PaymentManager, check_pending_payments
+from database.client_db import create_table, check_user, register_user, load_known_users, create_products_table, get_product_by_id, save_payment_info, create_payments_table, create_subscriptions_table, get_user_info, get_user_subscriptions, get_user_name, cursor, conn, get_partner_balance, get_partner_referral_percent, get_partner_ledger_page, create_withdrawal_request, deduct_partner_balance, add_subscription, get_product_type
+from database.links_db import LINK_START_PREFIX, LINK_FLUSH_INTERVAL, flush_link_counters
+from ulits.monopay_functions import PaymentManager, check_pending_payments, get_or_create_invoice
+from ulits.reconciliation import reconcile_payments_with_statement
+from ulits.resilience import ServiceUnavailable
+from ulits.archiver import archive_payment_history
+from ulits.token_health import check_token_health
+from ulits.outbox import start_outbox_dispatcher, stop_outbox_dispatcher, wake_outbox
+from ulits.admin_digest import admin_event, digest_line, flush_admin_digest, SEVERITY_HIGH
 import asyncio
-import os
-from ulits.cron_functions import check_expiring_subscriptions, process_recurring_payments
+from ulits.cron_functions import check_expiring_subscriptions, process_recurring_payments, RENEWAL_TICK_SECONDS
 from datetime import datetime
 from ulits.client_functions import get_profile_text, get_status_text
+from ulits.profile_cache import invalidate_profile
 from ulits.client_states import WithdrawPartner
+from ulits.callbacks import CatalogCallback, ProductCallback, TariffCallback, WithdrawCallback
 from aiogram.fsm.context import FSMContext
-from config import admin_chat_id, MIN_WITHDRAWAL, CATALOG_IMAGE_PATH
-from ulits.path_utils import resolve_media_path
+from config import admin_chat_id, MIN_WITHDRAWAL, CATALOG_IMAGE_PATH, ADMIN_DIGEST_WINDOW
+from ulits.image_store import resolve_product_image, get_cached_file_id, remember_file_id, load_image_index, schedule_missing_renditions, shutdown_image_store
 from html import escape
 from database.links_db import create_table_links
+from database.analytics_db import ANALYTICS_REFRESH_INTERVAL, build_analytics_snapshot, open_analytics_snapshot, close_analytics_snapshot
 
 router = Router()
 
 payment_manager = PaymentManager()
+# Відповідь на натискання, коли Monobank недоступний (запобіжник розімкнено або вичерпано повтори)
+PAYMENT_UNAVAILABLE_TEXT = "Платіжний сервіс тимчасово недоступний, спробуйте за хвилину"
+
+async def flush_link_counters_job():
+    # Корутина, а не sync-функція: інакше APScheduler виконає її в пулі потоків, а з'єднання SQLite прив'язане до потоку
+    flush_link_counters()
+
+
+async def refresh_analytics_snapshot():
+    # Копіювання — в окремому потоці зі своїми з'єднаннями; перевідкриття копії — в потоці бота, де її читають звіти
+    try:
+        await asyncio.to_thread(build_analytics_snapshot)
+    except Exception as e:
+        print(f"Не вдалося оновити аналітичну копію бази: {e}")
+    open_analytics_snapshot()
+
 
 async def scheduler_jobs():
-    scheduler.add_job(check_pending_payments, "interval", minutes=0.5)
-    scheduler.add_job(check_expiring_subscriptions, "cron", hour=16, minute=0)
-    scheduler.add_job(process_recurring_payments, "interval", hours=6)
+    # Фіксовані id: повторний on_startup (перезапуск polling) не дублює задачі.
+    # coalesce — пропущені запуски зливаються в один; max_instances=1 — без накладань у процесі,
+    # між інстансами — оренди leased_job
+    jobs = (
+        (check_pending_payments, {"trigger": "interval", "seconds": 10, "misfire_grace_time": 10}),
+        (check_expiring_subscriptions, {"trigger": "cron", "hour": 16, "minute": 0, "misfire_grace_time": 3600}),
+        (process_recurring_payments, {"trigger": "interval", "seconds": RENEWAL_TICK_SECONDS, "misfire_grace_time": RENEWAL_TICK_SECONDS}),
+        (check_token_health, {"trigger": "cron", "hour": 3, "minute": 15, "misfire_grace_time": 3600}),
+        (reconcile_payments_with_statement, {"trigger": "interval", "minutes": 5, "misfire_grace_time": 120}),
+        (archive_payment_history, {"trigger": "cron", "hour": 4, "minute": 30, "misfire_grace_time": 3600}),
+        (flush_link_counters_job, {"trigger": "interval", "seconds": LINK_FLUSH_INTERVAL, "misfire_grace_time": LINK_FLUSH_INTERVAL}),
+        (refresh_analytics_snapshot, {"trigger": "interval", "seconds": ANALYTICS_REFRESH_INTERVAL, "misfire_grace_time": ANALYTICS_REFRESH_INTERVAL}),
+        (flush_admin_digest, {"trigger": "interval", "seconds": max(ADMIN_DIGEST_WINDOW, 60), "misfire_grace_time": 60}),
+    )
+    for job, options in jobs:
+        scheduler.add_job(job, id=job.__name__, replace_existing=True, coalesce=True, max_instances=1, **options)
 
 
 
@@ -36,10 +73,7 @@ async def scheduler_jobs():
 async def start(message: types.Message):
     user_id = message.from_user.id
 
-    create_contest_table()
-
-    user_exists = check_user(user_id)
-    if user_exists:
+    if check_user(user_id):
         await message.answer(get_greeting_message(), parse_mode="HTML", reply_markup=get_start_keyboard(user_id))
         return
 
@@ -47,18 +81,14 @@ async def start(message: types.Message):
     payload = parts[1] if len(parts) > 1 else None
     ref_id = None
     marketing_link_id = None
+    contest_ref_id = None
 
     if payload:
         if payload.startswith("Eve12nt145Q_"):
             ref_id = int(payload.split("_")[1])
+            contest_ref_id = ref_id
             user_name = get_user_name(ref_id)
 
-            cursor.execute("""
-                INSERT INTO contest (user_id, invite_id, invite_date)
-                VALUES (?, ?, datetime('now'))
-            """, (user_id, ref_id))
-            conn.commit()
-
             await bot.send_message(
                 user_id,
                 "🎉 <b>Вітаємо! Ви берете участь у розіграші призів!</b>\n\n"
@@ -83,10 +113,8 @@ async def start(message: types.Message):
             )
         elif payload.startswith(LINK_START_PREFIX):
             try:
-                link_id = int(payload.split("_")[1])
-                if link_exists(link_id):
-                    marketing_link_id = link_id
-                    increment_link_count(link_id)
+                # Існування посилання перевіряє register_user, лічильники рахує буфер links_db
+                marketing_link_id = int(payload.split("_")[1])
             except (ValueError, IndexError):
                 pass
         elif payload.isdigit():
@@ -110,7 +138,7 @@ async def start(message: types.Message):
                     parse_mode="HTML",
                 )
 
-    add_user(user_id, message.from_user.username, ref_id, marketing_link_id)
+    register_user(user_id, message.from_user.username, ref_id, marketing_link_id, contest_ref_id)
     await message.answer(get_greeting_message(), parse_mode="HTML", reply_markup=get_start_keyboard(user_id))
 
 
@@ -179,9 +207,9 @@ async def faq(message: types.Message):
     )
     
     
-@router.callback_query(F.data.startswith("category_"))
-async def show_products(callback: types.CallbackQuery):
-    catalog_id = int(callback.data.split("_")[1])
+@router.callback_query(CatalogCallback.filter())
+async def show_products(callback: types.CallbackQuery, callback_data: CatalogCallback):
+    catalog_id = callback_data.catalog_id
     await callback.message.edit_caption(
         caption=f"<b>{get_tv_emoji_html()} Оберіть підписку:</b>",
         parse_mode="HTML",
@@ -229,28 +257,38 @@ async def referral(message: types.Message):
 async def partner_history(callback: types.CallbackQuery):
     from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
     user_id = callback.from_user.id
-    history = get_partner_earnings_history(user_id, limit=20)
+    history = get_partner_ledger_page(user_id, limit=20)
     back_kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="← Назад", callback_data="back_to_referral")],
     ])
     if not history:
         await callback.message.edit_text(
-            f"{get_premium_emoji('box')} <b>Історія нарахувань</b>\n\nПоки немає нарахувань.",
+            f"{get_premium_emoji('box')} <b>Історія балансу</b>\n\nПоки немає операцій.",
             parse_mode="HTML",
             reply_markup=back_kb,
         )
         await callback.answer()
         return
     lines = []
-    for buyer_id, purchase_amount, credit_amount, product_name, payment_type, created_at in history:
-        pt = "підписка" if payment_type == "subscription" else "разова"
-        name = format_product_name_for_display(product_name, max_text_len=30)
-        buyer_un = get_user_name(buyer_id)
-        buyer_display = escape(f"@{buyer_un}") if buyer_un and not str(buyer_un).isdigit() else escape(f"ID {buyer_id}")
+    for _, entry_type, amount, balance_after, note, created_at, buyer_id, purchase_amount, payment_type in history:
+        name = format_product_name_for_display(note, max_text_len=30) if note else ""
+        if entry_type == "credit" and buyer_id is not None:
+            pt = "підписка" if payment_type == "subscription" else "разова"
+            buyer_un = get_user_name(buyer_id)
+            buyer_display = escape(f"@{buyer_un}") if buyer_un and not str(buyer_un).isdigit() else escape(f"ID {buyer_id}")
+            details = f"з {purchase_amount:.2f}₴, {name} — реферал {buyer_display} [{pt}]"
+        elif entry_type == "withdrawal":
+            details = "вивід коштів"
+        elif entry_type == "purchase":
+            details = f"оплата з балансу: {name}"
+        elif entry_type == "opening":
+            details = "початковий залишок"
+        else:
+            details = name
         lines.append(
-            f"• {format_date(created_at)} | +{credit_amount:.2f}₴ (з {purchase_amount:.2f}₴, {name}) — реферал {buyer_display} [{pt}]"
+            f"• {format_date(created_at)} | {amount:+.2f}₴ ({details}) → {balance_after or 0:.2f}₴"
         )
-    text = f"{get_premium_emoji('box')} <b>Історія нарахувань</b>\n\n" + "\n".join(lines)
+    text = f"{get_premium_emoji('box')} <b>Історія балансу</b>\n\n" + "\n".join(lines)
     await callback.message.edit_text(text, parse_mode="HTML", reply_markup=back_kb)
     await callback.answer()
 
@@ -352,21 +390,25 @@ async def partner_withdraw_destination(message: types.Message, state: FSMContext
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="👤 Написати користувачу", url=f"tg://user?id={user_id}")],
             [
-                InlineKeyboardButton(text="✅ Підтвердити", callback_data=f"admin_withdraw_done_{req_id}"),
-                InlineKeyboardButton(text="❌ Відхилити", callback_data=f"admin_withdraw_reject_{req_id}"),
+                InlineKeyboardButton(text="✅ Підтвердити", callback_data=WithdrawCallback(action="done", request_id=req_id).pack()),
+                InlineKeyboardButton(text="❌ Відхилити", callback_data=WithdrawCallback(action="reject", request_id=req_id).pack()),
             ],
         ])
-        await bot.send_message(
-            admin_chat_id,
+        admin_event(
+            "withdraw_request",
             f"💸 <b>Запит на вивід</b>\n\n"
             f"{get_person_emoji_html()} {user_line}\n"
             f"{get_premium_emoji('money')} Сума: <b>{amount:.2f} ₴</b>\n"
             f"📋 Куди вивести: <b>{escape(destination)}</b>\n"
             f"📋 ID запиту: <code>{req_id}</code>\n\n"
             f"<i>При підтвердженні баланс партнера буде списано.</i>",
-            parse_mode="HTML",
+            digest_line(user_id, un, f"{amount:.2f} ₴", destination),
+            amount,
+            dedupe_key=f"withdraw:{req_id}:admin",
             reply_markup=kb,
+            severity=SEVERITY_HIGH,
         )
+        wake_outbox()
     except Exception:
         pass
     await message.answer(
@@ -374,9 +416,9 @@ async def partner_withdraw_destination(message: types.Message, state: FSMContext
         parse_mode="HTML",
     )
 
-@router.callback_query(F.data.startswith("product_"))
-async def show_product_info(callback: types.CallbackQuery):
-    product_id = int(callback.data.split("_")[1])
+@router.callback_query(ProductCallback.filter())
+async def show_product_info(callback: types.CallbackQuery, callback_data: ProductCallback):
+    product_id = callback_data.product_id
     
     product = get_product_by_id(product_id)
     if not product:
@@ -398,11 +440,9 @@ async def show_product_info(callback: types.CallbackQuery):
         price_str=price
     )
     
-    media_path = resolve_media_path(photo_path)
-    if not media_path or not os.path.exists(media_path):
-        media_path = CATALOG_IMAGE_PATH
-    photo = FSInputFile(media_path)
-    await callback.message.edit_media(
+    media_path = resolve_product_image(photo_path) or CATALOG_IMAGE_PATH
+    photo = get_cached_file_id(media_path) or FSInputFile(media_path)
+    result = await callback.message.edit_media(
         media=InputMediaPhoto(
             media=photo,
             caption=message_text,
@@ -410,14 +450,15 @@ async def show_product_info(callback: types.CallbackQuery):
         ),
         reply_markup=keyboard
     )
+    if isinstance(result, types.Message) and result.photo:
+        remember_file_id(media_path, result.photo[-1].file_id)
     
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("buy_"))
-async def process_buy(callback: types.CallbackQuery):
-    _, product_id, months, price = callback.data.split("_")
-    product_id, months, price = int(product_id), int(months), float(price)
+@router.callback_query(TariffCallback.filter(F.action == "buy"))
+async def process_buy(callback: types.CallbackQuery, callback_data: TariffCallback):
+    product_id, months, price = callback_data.product_id, callback_data.months, callback_data.price
     
     product = get_product_by_id(product_id)
     if not product:
@@ -487,22 +528,19 @@ async def process_buy(callback: types.CallbackQuery):
                 parse_mode="HTML",
             )
         else:
-            local_payment_id, invoice_id, payment_link = payment_manager.create_payment(
-                user_id=user_id,
-                product_name=product_name,
-                months=months,
-                price=discounted_price,
-            )
-            save_payment_info(
-                payment_id=local_payment_id,
-                invoice_id=invoice_id,
-                user_id=user_id,
-                product_id=product_id,
-                months=months,
-                amount=discounted_price,
-                status="pending",
-                payment_type=payment_type,
-            )
+            try:
+                local_payment_id, invoice_id, payment_link = await get_or_create_invoice(
+                    payment_manager,
+                    user_id=user_id,
+                    product_id=product_id,
+                    product_name=product_name,
+                    months=months,
+                    price=discounted_price,
+                    payment_type=payment_type,
+                )
+            except ServiceUnavailable:
+                await callback.answer(PAYMENT_UNAVAILABLE_TEXT, show_alert=True)
+                return
             await callback.message.edit_caption(
                 caption=payment_text,
                 reply_markup=get_payment_keyboard(payment_link, product_id),
@@ -512,32 +550,28 @@ async def process_buy(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("one_time_card_"))
-async def one_time_pay_card(callback: types.CallbackQuery):
-    parts = callback.data.split("_")
-    product_id, months, price = int(parts[3]), int(parts[4]), float(parts[5])
+@router.callback_query(TariffCallback.filter(F.action == "card"))
+async def one_time_pay_card(callback: types.CallbackQuery, callback_data: TariffCallback):
+    product_id, months, price = callback_data.product_id, callback_data.months, callback_data.price
     product = get_product_by_id(product_id)
     if not product:
         await callback.answer("Продукт не знайдено!", show_alert=True)
         return
     product_name, description, _, photo = product
     user_id = callback.from_user.id
-    local_payment_id, invoice_id, payment_link = payment_manager.create_payment(
-        user_id=user_id,
-        product_name=product_name,
-        months=months,
-        price=price,
-    )
-    save_payment_info(
-        payment_id=local_payment_id,
-        invoice_id=invoice_id,
-        user_id=user_id,
-        product_id=product_id,
-        months=months,
-        amount=price,
-        status="pending",
-        payment_type="one_time",
-    )
+    try:
+        local_payment_id, invoice_id, payment_link = await get_or_create_invoice(
+            payment_manager,
+            user_id=user_id,
+            product_id=product_id,
+            product_name=product_name,
+            months=months,
+            price=price,
+            payment_type="one_time",
+        )
+    except ServiceUnavailable:
+        await callback.answer(PAYMENT_UNAVAILABLE_TEXT, show_alert=True)
+        return
     payment_text = (
         f"<b>Оформлення замовлення</b>\n\n"
         f"Товар: <b>{product_name}</b>\n"
@@ -553,10 +587,9 @@ async def one_time_pay_card(callback: types.CallbackQuery):
     await callback.answer()
 
 
-@router.callback_query(F.data.startswith("pay_balance_"))
-async def pay_with_balance(callback: types.CallbackQuery):
-    parts = callback.data.split("_")
-    product_id, months, price = int(parts[2]), int(parts[3]), float(parts[4])
+@router.callback_query(TariffCallback.filter(F.action == "balance"))
+async def pay_with_balance(callback: types.CallbackQuery, callback_data: TariffCallback):
+    product_id, months, price = callback_data.product_id, callback_data.months, callback_data.price
     product = get_product_by_id(product_id)
     if not product:
         await callback.answer("Продукт не знайдено!", show_alert=True)
@@ -566,7 +599,7 @@ async def pay_with_balance(callback: types.CallbackQuery):
     if get_partner_balance(user_id) < price:
         await callback.answer("Недостатньо коштів на балансі.", show_alert=True)
         return
-    if not deduct_partner_balance(user_id, price):
+    if not deduct_partner_balance(user_id, price, note=product_name):
         await callback.answer("Помилка списання.", show_alert=True)
         return
     from datetime import timedelta
@@ -583,6 +616,7 @@ async def pay_with_balance(callback: types.CallbackQuery):
         end_date=end_date.strftime("%Y-%m-%d"),
         status="active",
     )
+    invalidate_profile(user_id)
     await callback.message.edit_caption(
         caption=(
             f"{get_premium_emoji('check')} <b>Оплата з балансу успішна!</b>\n\n"
@@ -602,24 +636,25 @@ async def pay_with_balance(callback: types.CallbackQuery):
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="👤 Написати", url=f"tg://user?id={user_id}")],
         ])
-        await bot.send_message(
-            admin_chat_id,
+        admin_event(
+            "balance_purchase",
             f"{get_premium_emoji('money')} <b>Оплата з балансу</b>\n\n"
             f"{pay_user_line}\n"
             f"Товар: {product_name}\n"
             f"Сума: {price} ₴\n"
             f"До: {end_date.strftime('%d.%m.%Y')}",
-            parse_mode="HTML",
+            digest_line(user_id, un, product_name, f"{price} ₴", f"{months} міс."),
+            price,
             reply_markup=kb,
         )
+        wake_outbox()
     except Exception:
         pass
 
 
-@router.callback_query(F.data.startswith("agree_subscription_"))
-async def agree_subscription_terms(callback: types.CallbackQuery):
-    _, _, product_id, months, price = callback.data.split("_")
-    product_id, months, price = int(product_id), int(months), float(price)
+@router.callback_query(TariffCallback.filter(F.action == "agree"))
+async def agree_subscription_terms(callback: types.CallbackQuery, callback_data: TariffCallback):
+    product_id, months, price = callback_data.product_id, callback_data.months, callback_data.price
     
     product = get_product_by_id(product_id)
     if not product:
@@ -628,35 +663,23 @@ async def agree_subscription_terms(callback: types.CallbackQuery):
     
     product_name, description, _, photo = product
     
-    # Створюємо платіж підписки
-    local_payment_id, invoice_id, payment_link, wallet_id = payment_manager.create_payment_with_tokenization(
-        user_id=callback.from_user.id,
-        product_name=product_name,
-        months=months,
-        price=price
-    )
-    
-    print(f"Створено платіж підписки: local_payment_id={local_payment_id}, invoice_id={invoice_id}, wallet_id={wallet_id}")
-    
-    # Зберігаємо wallet_id для подальшого використання
-    cursor.execute("""
-        INSERT OR REPLACE INTO payments_temp_data (invoice_id, wallet_id, payment_type, local_payment_id)
-        VALUES (?, ?, ?, ?)
-    """, (invoice_id, wallet_id, "subscription", local_payment_id))
-    conn.commit()
-    
-    print(f"Збережено тимчасові дані для платежу {local_payment_id}")
+    # Створюємо платіж підписки (wallet_id зберігається в payments_temp_data) або беремо ще дійсний
+    try:
+        local_payment_id, invoice_id, payment_link = await get_or_create_invoice(
+            payment_manager,
+            user_id=callback.from_user.id,
+            product_id=product_id,
+            product_name=product_name,
+            months=months,
+            price=price,
+            payment_type="subscription",
+            tokenize=True,
+        )
+    except ServiceUnavailable:
+        await callback.answer(PAYMENT_UNAVAILABLE_TEXT, show_alert=True)
+        return
     
-    save_payment_info(
-        payment_id=local_payment_id,
-        invoice_id=invoice_id,
-        user_id=callback.from_user.id,
-        product_id=product_id,
-        months=months,
-        amount=price,
-        status="pending",
-        payment_type="subscription"
-    )
+    print(f"Платіж підписки: local_payment_id={local_payment_id}, invoice_id={invoice_id}")
     
     payment_text = (
         f"<b>Оформлення підписки</b>\n\n"
@@ -679,6 +702,11 @@ async def agree_subscription_terms(callback: types.CallbackQuery):
 async def on_startup(router):
     me = await bot.get_me()
     create_table_links()        
+    load_known_users()
+    load_image_index()
+    schedule_missing_renditions()
+    start_outbox_dispatcher()
+    await refresh_analytics_snapshot()
     await scheduler_jobs()
     if admin_chat_id:
         try:
@@ -695,5 +723,9 @@ async def on_startup(router):
 
 
 async def on_shutdown(router):
+    await stop_outbox_dispatcher()
+    flush_link_counters()
+    shutdown_image_store()
+    close_analytics_snapshot()
     me = await bot.get_me()
     print(f'Bot: @{me.username} зупинений!')
@@ -1,71 +1,30 @@
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
-from database.client_db import get_user_info, get_user_subscriptions, get_user_recurring_subscriptions
 from keyboards.client_keyboards import get_start_keyboard
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
 from Content.texts import get_calendar_emoji_html, get_person_emoji_html, get_premium_emoji
+from ulits.client_functions import format_profile_subscriptions, format_snapshot_date
+from ulits.profile_cache import get_profile_snapshot, invalidate_profile
+from ulits.callbacks import SubscriptionCallback
 
 router = Router()
 
-@router.message(F.text.in_(["Мій кабінет", "/profile"]))
-async def profile_handler(message: types.Message):
-    user_id = message.from_user.id
-    user_info = get_user_info(user_id)
-    
-    if not user_info:
-        await message.answer("❌ Профіль не знайдено")
-        return
-    
-    # Отримуємо звичайні підписки
-    subscriptions = get_user_subscriptions(user_id)
-    
-    # Отримуємо повторювані підписки
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
-    
-    join_date = datetime.strptime(user_info['join_date'], '%Y-%m-%d %H:%M:%S')
+def build_profile_view(user_id: int):
+    """Текст і клавіатура «Ваш профіль» зі знімка кабінету (спільне для /profile та «Оновити»)."""
+    snapshot = get_profile_snapshot(user_id)
+    if not snapshot:
+        return None, None
 
     profile_text = (
         f"{get_person_emoji_html()} <b>Ваш профіль</b>\n\n"
         f"🆔 <b>ID:</b> <code>{user_id}</code>\n"
-        f"{get_calendar_emoji_html()} <b>Дата реєстрації:</b> {join_date.strftime('%d.%m.%Y')}\n\n"
+        f"{get_calendar_emoji_html()} <b>Дата реєстрації:</b> {format_snapshot_date(snapshot['join_date'])}\n\n"
     )
 
-    if subscriptions or recurring_subscriptions:
+    if snapshot['subscriptions'] or snapshot['recurring']:
         profile_text += "📋 <b>Ваші підписки</b>\n\n"
-        
-        # Звичайні підписки
-        for sub in subscriptions:
-            product_name = sub['product_name']
-            price = sub['price']
-            end_date = datetime.strptime(sub['end_date'], '%Y-%m-%d')
-            status = sub['status']
-            
-            status_emoji = get_premium_emoji("check") if status == "active" else "❌"
-            
-            profile_text += (
-                f"{status_emoji} <b>{product_name}</b>\n"
-                f"   {get_premium_emoji('money')} {price}₴ (одноразова оплата)\n"
-                f"   {get_calendar_emoji_html()} До: {end_date.strftime('%d.%m.%Y')}\n\n"
-            )
-        
-        # Повторювані підписки
-        for sub in recurring_subscriptions:
-            sub_id, product_name, months, price, next_payment_date, status, payment_failures = sub
-            
-            status_emoji = get_premium_emoji("check") if status == "active" else "❌"
-            next_payment = datetime.strptime(next_payment_date, '%Y-%m-%d %H:%M:%S')
-            
-            profile_text += (
-                f"{status_emoji} <b>{product_name}</b> (підписка)\n"
-                f"   {get_premium_emoji('money')} {price}₴ кожні {months} {'місяць' if months == 1 else 'місяці' if months in [2,3,4] else 'місяців'}\n"
-                f"   {get_calendar_emoji_html()} Наступний платіж: {next_payment.strftime('%d.%m.%Y')}\n"
-            )
-            
-            if payment_failures > 0:
-                profile_text += f"   ⚠️ Невдалих спроб: {payment_failures}\n"
-            
-            profile_text += "\n"
+        profile_text += format_profile_subscriptions(snapshot)
     else:
         profile_text += (
             "📋 <b>Підписки</b>\n\n"
@@ -87,84 +46,37 @@ async def profile_handler(message: types.Message):
             )
         ]
     ])
+    return profile_text, keyboard
+
+
+def find_recurring_subscription(user_id: int, subscription_id: int):
+    snapshot = get_profile_snapshot(user_id)
+    if not snapshot:
+        return None
+    for sub in snapshot['recurring']:
+        if sub['id'] == subscription_id:
+            return sub
+    return None
+
+
+@router.message(F.text.in_(["Мій кабінет", "/profile"]))
+async def profile_handler(message: types.Message):
+    profile_text, keyboard = build_profile_view(message.from_user.id)
+    
+    if not profile_text:
+        await message.answer("❌ Профіль не знайдено")
+        return
 
     await message.answer(profile_text, parse_mode="HTML", reply_markup=keyboard)
 
 
 @router.callback_query(F.data == "refresh_profile")
 async def refresh_profile(callback: types.CallbackQuery):
-    user_id = callback.from_user.id
-    user_info = get_user_info(user_id)
+    profile_text, keyboard = build_profile_view(callback.from_user.id)
     
-    if not user_info:
+    if not profile_text:
         await callback.answer("❌ Профіль не знайдено")
         return
-    
-    subscriptions = get_user_subscriptions(user_id)
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
-    
-    join_date = datetime.strptime(user_info['join_date'], '%Y-%m-%d %H:%M:%S')
-
-    profile_text = (
-        f"{get_person_emoji_html()} <b>Ваш профіль</b>\n\n"
-        f"🆔 <b>ID:</b> <code>{user_id}</code>\n"
-        f"{get_calendar_emoji_html()} <b>Дата реєстрації:</b> {join_date.strftime('%d.%m.%Y')}\n\n"
-    )
-
-    if subscriptions or recurring_subscriptions:
-        profile_text += "📋 <b>Ваші підписки</b>\n\n"
-
-        for sub in subscriptions:
-            product_name = sub['product_name']
-            price = sub['price']
-            end_date = datetime.strptime(sub['end_date'], '%Y-%m-%d')
-            status = sub['status']
-            
-            status_emoji = get_premium_emoji("check") if status == "active" else "❌"
-            
-            profile_text += (
-                f"{status_emoji} <b>{product_name}</b>\n"
-                f"   {get_premium_emoji('money')} {price}₴ (одноразова оплата)\n"
-                f"   {get_calendar_emoji_html()} До: {end_date.strftime('%d.%m.%Y')}\n\n"
-            )
-        
-        for sub in recurring_subscriptions:
-            sub_id, product_name, months, price, next_payment_date, status, payment_failures = sub
-            
-            status_emoji = get_premium_emoji("check") if status == "active" else "❌"
-            next_payment = datetime.strptime(next_payment_date, '%Y-%m-%d %H:%M:%S')
-            
-            profile_text += (
-                f"{status_emoji} <b>{product_name}</b> (підписка)\n"
-                f"   {get_premium_emoji('money')} {price}₴ кожні {months} {'місяць' if months == 1 else 'місяці' if months in [2,3,4] else 'місяців'}\n"
-                f"   {get_calendar_emoji_html()} Наступний платіж: {next_payment.strftime('%d.%m.%Y')}\n"
-            )
-            
-            if payment_failures > 0:
-                profile_text += f"   ⚠️ Невдалих спроб: {payment_failures}\n"
-            
-            profile_text += "\n"
-    else:
-        profile_text += (
-            "📋 <b>Підписки</b>\n\n"
-            "<i>У вас поки немає активних підписок.</i>\n"
-            "Обирайте сервіси у каталозі — кіно, музика, VPN та інше зі зручною оплатою."
-        )
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(
-                text="📋 Управління підписками",
-                callback_data="manage_subscriptions"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                text="🔄 Оновити",
-                callback_data="refresh_profile"
-            )
-        ]
-    ])
 
     await callback.message.edit_text(profile_text, parse_mode="HTML", reply_markup=keyboard)
     await callback.answer("✅ Профіль оновлено")
@@ -172,9 +84,9 @@ async def refresh_profile(callback: types.CallbackQuery):
 
 @router.callback_query(F.data == "manage_subscriptions")
 async def manage_subscriptions(callback: types.CallbackQuery):
-    user_id = callback.from_user.id
-    subscriptions = get_user_subscriptions(user_id)
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
+    snapshot = get_profile_snapshot(callback.from_user.id)
+    subscriptions = snapshot['subscriptions'] if snapshot else []
+    recurring_subscriptions = snapshot['recurring'] if snapshot else []
     
     if not subscriptions and not recurring_subscriptions:
         await callback.message.edit_text(
@@ -207,17 +119,16 @@ async def manage_subscriptions(callback: types.CallbackQuery):
         keyboard.append([
             InlineKeyboardButton(
                 text=f"📄 {product_name} (одноразова)",
-                callback_data=f"view_simple_{i}"
+                callback_data=SubscriptionCallback(action="simple", subscription_id=i).pack()
             )
         ])
     
     for sub in recurring_subscriptions:
-        sub_id, product_name, months, price, next_payment_date, status, payment_failures = sub
-        status_text = get_premium_emoji("check") if status == "active" else "❌"
+        status_text = get_premium_emoji("check") if sub['status'] == "active" else "❌"
         keyboard.append([
             InlineKeyboardButton(
-                text=f"📄 {status_text} {product_name} (підписка)",
-                callback_data=f"view_recurring_{sub_id}"
+                text=f"📄 {status_text} {sub['product_name']} (підписка)",
+                callback_data=SubscriptionCallback(action="recurring", subscription_id=sub['id']).pack()
             )
         ])
     
@@ -236,13 +147,14 @@ async def manage_subscriptions(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("view_simple_"))
-async def view_simple_subscription(callback: types.CallbackQuery):
-    subscription_index = int(callback.data.split("_")[2])
+@router.callback_query(SubscriptionCallback.filter(F.action == "simple"))
+async def view_simple_subscription(callback: types.CallbackQuery, callback_data: SubscriptionCallback):
+    subscription_index = callback_data.subscription_id
     user_id = callback.from_user.id
     
     # Знаходимо підписку
-    subscriptions = get_user_subscriptions(user_id)
+    snapshot = get_profile_snapshot(user_id)
+    subscriptions = snapshot['subscriptions'] if snapshot else []
     
     if subscription_index >= len(subscriptions):
         await callback.answer("Підписка не знайдена", show_alert=True)
@@ -251,9 +163,8 @@ async def view_simple_subscription(callback: types.CallbackQuery):
     subscription = subscriptions[subscription_index]
     product_name = subscription['product_name']
     
-    start_date = datetime.strptime(subscription['start_date'], '%Y-%m-%d')
-    end_date = datetime.strptime(subscription['end_date'], '%Y-%m-%d')
-    days_left = (end_date.date() - datetime.now().date()).days
+    end_date = subscription['end_date']
+    days_left = (end_date.date() - datetime.now().date()).days if end_date else 0
     status = subscription['status']
     
     status_emoji = get_premium_emoji("check") if status == "active" else "❌"
@@ -264,8 +175,8 @@ async def view_simple_subscription(callback: types.CallbackQuery):
         f"🏷️ <b>Назва:</b> {product_name}\n"
         f"{get_premium_emoji('chart')} <b>Статус:</b> {status_emoji} {status_text}\n"
         f"{get_premium_emoji('money')} <b>Сума:</b> {subscription['price']}₴ (одноразова оплата)\n"
-        f"{get_calendar_emoji_html()} <b>Дата початку:</b> {start_date.strftime('%d.%m.%Y')}\n"
-        f"{get_calendar_emoji_html()} <b>Дата закінчення:</b> {end_date.strftime('%d.%m.%Y')}\n"
+        f"{get_calendar_emoji_html()} <b>Дата початку:</b> {format_snapshot_date(subscription['start_date'])}\n"
+        f"{get_calendar_emoji_html()} <b>Дата закінчення:</b> {format_snapshot_date(end_date)}\n"
     )
     
     if status == "active":
@@ -289,25 +200,20 @@ async def view_simple_subscription(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("view_recurring_"))
-async def view_recurring_subscription(callback: types.CallbackQuery):
-    subscription_id = int(callback.data.split("_")[2])
+@router.callback_query(SubscriptionCallback.filter(F.action == "recurring"))
+async def view_recurring_subscription(callback: types.CallbackQuery, callback_data: SubscriptionCallback):
+    subscription_id = callback_data.subscription_id
     user_id = callback.from_user.id
     
     # Знаходимо підписку
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
-    subscription = None
-    for sub in recurring_subscriptions:
-        if sub[0] == subscription_id:  # sub[0] - це id
-            subscription = sub
-            break
+    subscription = find_recurring_subscription(user_id, subscription_id)
     
     if not subscription:
         await callback.answer("Підписка не знайдена", show_alert=True)
         return
     
-    sub_id, product_name, months, price, next_payment_date, status, payment_failures = subscription
-    next_payment = datetime.strptime(next_payment_date, '%Y-%m-%d %H:%M:%S')
+    product_name, months, price = subscription['product_name'], subscription['months'], subscription['price']
+    status, payment_failures = subscription['status'], subscription['payment_failures']
     
     status_emoji = get_premium_emoji("check") if status == "active" else "❌"
     status_text = "Активна" if status == "active" else "Неактивна"
@@ -318,7 +224,7 @@ async def view_recurring_subscription(callback: types.CallbackQuery):
         f"{get_premium_emoji('chart')} <b>Статус:</b> {status_emoji} {status_text}\n"
         f"{get_premium_emoji('money')} <b>Сума:</b> {price}₴\n"
         f"🔄 <b>Періодичність:</b> Кожні {months} {'місяць' if months == 1 else 'місяці' if months in [2,3,4] else 'місяців'}\n"
-        f"{get_calendar_emoji_html()} <b>Наступна оплата:</b> {next_payment.strftime('%d.%m.%Y о %H:%M')}\n"
+        f"{get_calendar_emoji_html()} <b>Наступна оплата:</b> {format_snapshot_date(subscription['next_payment'], '%d.%m.%Y о %H:%M')}\n"
     )
     
     if payment_failures > 0:
@@ -341,19 +247,19 @@ async def view_recurring_subscription(callback: types.CallbackQuery):
             [
                 InlineKeyboardButton(
                     text="🚫 Відключити автосплату",
-                    callback_data=f"confirm_cancel_{subscription_id}"
+                    callback_data=SubscriptionCallback(action="confirm_cancel", subscription_id=subscription_id).pack()
                 )
             ],
             [
                 InlineKeyboardButton(
                     text="🔄 Змінити тариф",
-                    callback_data=f"change_tariff_{subscription_id}"
+                    callback_data=SubscriptionCallback(action="tariff", subscription_id=subscription_id).pack()
                 )
             ],
             [
                 InlineKeyboardButton(
                     text="💳 Змінити карту",
-                    callback_data=f"change_card_{subscription_id}"
+                    callback_data=SubscriptionCallback(action="card", subscription_id=subscription_id).pack()
                 )
             ]
         ])
@@ -374,32 +280,26 @@ async def view_recurring_subscription(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("confirm_cancel_"))
-async def confirm_cancel_subscription(callback: types.CallbackQuery):
-    subscription_id = int(callback.data.split("_")[2])
+@router.callback_query(SubscriptionCallback.filter(F.action == "confirm_cancel"))
+async def confirm_cancel_subscription(callback: types.CallbackQuery, callback_data: SubscriptionCallback):
+    subscription_id = callback_data.subscription_id
     
     # Отримуємо інформацію про підписку
     user_id = callback.from_user.id
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
-    subscription = None
-    for sub in recurring_subscriptions:
-        if sub[0] == subscription_id:
-            subscription = sub
-            break
+    subscription = find_recurring_subscription(user_id, subscription_id)
     
     if not subscription:
         await callback.answer("Підписка не знайдена", show_alert=True)
         return
     
-    _, product_name, months, price, next_payment_date, status, _ = subscription
-    next_payment = datetime.strptime(next_payment_date, '%Y-%m-%d %H:%M:%S')
+    product_name, months, price = subscription['product_name'], subscription['months'], subscription['price']
     
     confirmation_text = (
         f"⚠️ <b>Підтвердження скасування</b>\n\n"
         f"Ви дійсно хочете скасувати підписку?\n\n"
         f"📋 <b>Підписка:</b> {product_name}\n"
         f"{get_premium_emoji('money')} <b>Сума:</b> {price}₴ кожні {months} {'місяць' if months == 1 else 'місяці' if months in [2,3,4] else 'місяців'}\n"
-        f"{get_calendar_emoji_html()} <b>Наступна оплата:</b> {next_payment.strftime('%d.%m.%Y')}\n\n"
+        f"{get_calendar_emoji_html()} <b>Наступна оплата:</b> {format_snapshot_date(subscription['next_payment'])}\n\n"
         f"<b>Важливо:</b>\n"
         f"• Автоматичні платежі будуть зупинені\n"
         f"• Доступ до сервісу зберігається до кінця поточного оплаченого періоду\n"
@@ -410,13 +310,13 @@ async def confirm_cancel_subscription(callback: types.CallbackQuery):
         [
             InlineKeyboardButton(
                 text="✅ Так, скасувати",
-                callback_data=f"cancel_subscription_{subscription_id}"
+                callback_data=SubscriptionCallback(action="cancel", subscription_id=subscription_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="❌ Ні, залишити",
-                callback_data=f"view_recurring_{subscription_id}"
+                callback_data=SubscriptionCallback(action="recurring", subscription_id=subscription_id).pack()
             )
         ]
     ])
@@ -428,29 +328,25 @@ async def confirm_cancel_subscription(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("cancel_subscription_"))
-async def cancel_subscription(callback: types.CallbackQuery):
-    subscription_id = int(callback.data.split("_")[2])
+@router.callback_query(SubscriptionCallback.filter(F.action == "cancel"))
+async def cancel_subscription(callback: types.CallbackQuery, callback_data: SubscriptionCallback):
+    subscription_id = callback_data.subscription_id
     user_id = callback.from_user.id
     
     # Отримуємо інформацію про підписку перед скасуванням
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
-    subscription = None
-    for sub in recurring_subscriptions:
-        if sub[0] == subscription_id:
-            subscription = sub
-            break
+    subscription = find_recurring_subscription(user_id, subscription_id)
     
     if not subscription:
         await callback.answer("Підписка не знайдена", show_alert=True)
         return
     
-    _, product_name, months, price, next_payment_date, status, _ = subscription
+    product_name = subscription['product_name']
     
     # Імпортуємо функцію деактивації
     from database.client_db import deactivate_subscription
     
     if deactivate_subscription(subscription_id):
+        invalidate_profile(user_id)
         # Повідомляємо адміністраторів про скасування
         await notify_admins_user_cancelled_subscription(user_id, product_name, "користувач")
         
@@ -491,9 +387,9 @@ async def cancel_subscription(callback: types.CallbackQuery):
         await callback.answer("❌ Помилка при скасуванні підписки", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("change_tariff_"))
-async def change_tariff_info(callback: types.CallbackQuery):
-    subscription_id = int(callback.data.split("_")[2])
+@router.callback_query(SubscriptionCallback.filter(F.action == "tariff"))
+async def change_tariff_info(callback: types.CallbackQuery, callback_data: SubscriptionCallback):
+    subscription_id = callback_data.subscription_id
     
     info_text = (
         f"🔄 <b>Зміна тарифу</b>\n\n"
@@ -510,13 +406,13 @@ async def change_tariff_info(callback: types.CallbackQuery):
         [
             InlineKeyboardButton(
                 text="🚫 Скасувати поточну підписку",
-                callback_data=f"confirm_cancel_{subscription_id}"
+                callback_data=SubscriptionCallback(action="confirm_cancel", subscription_id=subscription_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="← Назад",
-                callback_data=f"view_recurring_{subscription_id}"
+                callback_data=SubscriptionCallback(action="recurring", subscription_id=subscription_id).pack()
             )
         ]
     ])
@@ -528,9 +424,9 @@ async def change_tariff_info(callback: types.CallbackQuery):
     )
 
 
-@router.callback_query(F.data.startswith("change_card_"))
-async def change_card_info(callback: types.CallbackQuery):
-    subscription_id = int(callback.data.split("_")[2])
+@router.callback_query(SubscriptionCallback.filter(F.action == "card"))
+async def change_card_info(callback: types.CallbackQuery, callback_data: SubscriptionCallback):
+    subscription_id = callback_data.subscription_id
     
     info_text = (
         f"{get_premium_emoji('card')} <b>Зміна платіжної картки</b>\n\n"
@@ -547,13 +443,13 @@ async def change_card_info(callback: types.CallbackQuery):
         [
             InlineKeyboardButton(
                 text="🚫 Скасувати поточну підписку",
-                callback_data=f"confirm_cancel_{subscription_id}"
+                callback_data=SubscriptionCallback(action="confirm_cancel", subscription_id=subscription_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="← Назад",
-                callback_data=f"view_recurring_{subscription_id}"
+                callback_data=SubscriptionCallback(action="recurring", subscription_id=subscription_id).pack()
             )
         ]
     ])
@@ -568,9 +464,9 @@ async def change_card_info(callback: types.CallbackQuery):
 async def notify_admins_user_cancelled_subscription(user_id: int, product_name: str, cancellation_reason: str):
     """Повідомляє адміністраторів про скасування підписки користувачем"""
     try:
-        from config import admin_chat_id
         from database.client_db import get_username_by_id
-        from main import bot
+        from ulits.admin_digest import admin_event, digest_line
+        from ulits.outbox import wake_outbox
         
         username = get_username_by_id(user_id)
         user_line = f"Користувач: @{username} (ID: <code>{user_id}</code>)" if (username and str(username).strip()) else f"Користувач: ID <code>{user_id}</code> (прихований профіль)"
@@ -591,7 +487,13 @@ async def notify_admins_user_cancelled_subscription(user_id: int, product_name:
             ]
         ])
         
-        await bot.send_message(admin_chat_id, admin_message, parse_mode="HTML", reply_markup=keyboard)
+        admin_event(
+            "user_cancelled",
+            admin_message,
+            digest_line(user_id, username, product_name, cancellation_reason),
+            reply_markup=keyboard,
+        )
+        wake_outbox()
         
     except Exception as e:
         print(f"Помилка при надсиланні повідомлення адміну про скасування: {e}") 
\ No newline at end of file
@@ -1,6 +1,7 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, KeyboardButton, ReplyKeyboardMarkup
 from database.client_db import get_product_types, get_products_by_catalog
 from database.links_db import get_all_links
+from ulits.callbacks import AdminCatalogCallback, AdminProductCallback, PaymentTypeCallback, AdminSubscriptionCallback, LinkCallback, ExportPeriodCallback, ExportRunCallback
 
 def get_write_to_user_keyboard(user_id: int) -> InlineKeyboardMarkup:
     """Клавіатура з кнопкою «Написати користувачу» (для адмін-повідомлень)."""
@@ -12,7 +13,7 @@ def get_write_to_user_keyboard(user_id: int) -> InlineKeyboardMarkup:
 def admin_keyboard():
     keyboard = [
         [KeyboardButton(text="Розсилка") ,KeyboardButton(text="Статистика")],
-        [KeyboardButton(text="Управління підписками")],
+        [KeyboardButton(text="Управління підписками"), KeyboardButton(text="📤 Експорт")],
         [KeyboardButton(text="Управління товарами"), KeyboardButton(text="➕ Додати товар")],
         [KeyboardButton(text="👥 Партнерська програма") , KeyboardButton(text="Посилання")],
         [KeyboardButton(text="Головне меню")],
@@ -91,7 +92,7 @@ def get_admin_catalog_keyboard():
         row.append(
             InlineKeyboardButton(
                 text=f"{product_type} [{count}]",
-                callback_data=f"admincategory_{catalog_id}"
+                callback_data=AdminCatalogCallback(action="view", catalog_id=catalog_id).pack()
             )
         )
         if len(row) == 2:
@@ -112,7 +113,7 @@ def get_admin_products_keyboard(catalog_id: int):
         row.append(
             InlineKeyboardButton(
                 text=f"{product_name}",
-                callback_data=f"adminproduct_{product_id}"
+                callback_data=AdminProductCallback(action="view", product_id=product_id).pack()
             )
         )
         if len(row) == 2:
@@ -137,11 +138,11 @@ def edit_product_keyboard(product_id: int):
         [
             InlineKeyboardButton(
                 text="✏️ Редагувати",
-                callback_data=f"edit_product_{product_id}"
+                callback_data=AdminProductCallback(action="edit", product_id=product_id).pack()
             ),
             InlineKeyboardButton(
                 text="🗑 Видалити",
-                callback_data=f"delete_product_{product_id}"
+                callback_data=AdminProductCallback(action="delete", product_id=product_id).pack()
             )
         ],
         [
@@ -159,31 +160,31 @@ def edit_options_keyboard(product_id: int):
         [
             InlineKeyboardButton(
                 text="✏️ Редагувати назву",
-                callback_data=f"edit_name_{product_id}"
+                callback_data=AdminProductCallback(action="edit_name", product_id=product_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="✏️ Редагувати опис",
-                callback_data=f"edit_description_{product_id}"
+                callback_data=AdminProductCallback(action="edit_description", product_id=product_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="✏️ Редагувати тарифи",
-                callback_data=f"edit_price_{product_id}"
+                callback_data=AdminProductCallback(action="edit_price", product_id=product_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="✏️ Редагувати тип оплати",
-                callback_data=f"edit_payment_type_{product_id}"
+                callback_data=AdminProductCallback(action="edit_payment_type", product_id=product_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="← Назад",
-                callback_data=f"back_to_product_{product_id}"
+                callback_data=AdminProductCallback(action="back", product_id=product_id).pack()
             )
         ]
     ])
@@ -201,13 +202,13 @@ def payment_type_keyboard():
         [
             InlineKeyboardButton(
                 text="📅 Модель підписки",
-                callback_data="payment_type_subscription"
+                callback_data=PaymentTypeCallback(payment_type="subscription").pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="💳 Одноразова оплата",
-                callback_data="payment_type_one_time"
+                callback_data=PaymentTypeCallback(payment_type="one").pack()
             )
         ],
         [
@@ -255,23 +256,23 @@ def get_admin_subscription_actions_keyboard(subscription_id: int, subscription_t
         [
             InlineKeyboardButton(
                 text="✅ Активувати",
-                callback_data=f"admin_activate_{subscription_type}_{subscription_id}"
+                callback_data=AdminSubscriptionCallback(action="activate", kind=subscription_type, subscription_id=subscription_id).pack()
             ),
             InlineKeyboardButton(
                 text="❌ Деактивувати",
-                callback_data=f"admin_deactivate_{subscription_type}_{subscription_id}"
+                callback_data=AdminSubscriptionCallback(action="deactivate", kind=subscription_type, subscription_id=subscription_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="🗑️ Видалити підписку",
-                callback_data=f"admin_delete_{subscription_type}_{subscription_id}"
+                callback_data=AdminSubscriptionCallback(action="delete", kind=subscription_type, subscription_id=subscription_id).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="👤 Написати користувачу",
-                callback_data=f"admin_contact_{subscription_type}_{subscription_id}"
+                callback_data=AdminSubscriptionCallback(action="contact", kind=subscription_type, subscription_id=subscription_id).pack()
             )
         ],
         [
@@ -294,7 +295,7 @@ def get_admin_subscription_list_keyboard(subscriptions: list) -> InlineKeyboardM
         keyboard.append([
             InlineKeyboardButton(
                 text=f"{status_emoji} {type_emoji} {sub['product_name']} - @{sub['username']}",
-                callback_data=f"admin_view_{sub['type']}_{sub['id']}"
+                callback_data=AdminSubscriptionCallback(action="view", kind=sub['type'], subscription_id=sub['id']).pack()
             )
         ])
     
@@ -330,7 +331,7 @@ def get_admin_subscription_list_keyboard_with_pagination(subscriptions: list, cu
         keyboard.append([
             InlineKeyboardButton(
                 text=f"{status_emoji} {type_emoji} {sub['product_name']} - @{sub['username']}",
-                callback_data=f"admin_view_{sub['type']}_{sub['id']}"
+                callback_data=AdminSubscriptionCallback(action="view", kind=sub['type'], subscription_id=sub['id']).pack()
             )
         ])
     
@@ -388,7 +389,7 @@ def get_links_keyboard() -> InlineKeyboardMarkup:
         keyboard.append([
             InlineKeyboardButton(
                 text=f"{link[1]} ({visits} пер. / {registrations} реєстр. / {purchases} покуп.)",
-                callback_data=f"mlink_stats_{link[0]}"
+                callback_data=LinkCallback(action="stats", link_id=link[0]).pack()
             )
         ])
     
@@ -413,20 +414,56 @@ def cancel_button() -> ReplyKeyboardMarkup:
 def get_link_stats_keyboard(link_id: int) -> InlineKeyboardMarkup:
     keyboard = [
         [
-            InlineKeyboardButton(text="✏️ Редагувати", callback_data=f"mlink_edit_{link_id}"),
-            InlineKeyboardButton(text="🗑 Видалити", callback_data=f"mlink_delete_{link_id}")
+            InlineKeyboardButton(text="✏️ Редагувати", callback_data=LinkCallback(action="edit", link_id=link_id).pack()),
+            InlineKeyboardButton(text="🗑 Видалити", callback_data=LinkCallback(action="delete", link_id=link_id).pack())
         ],
-        [InlineKeyboardButton(text="🔄 Оновити", callback_data=f"mlink_stats_{link_id}")],
+        [InlineKeyboardButton(text="📈 Динаміка", callback_data=LinkCallback(action="trend", link_id=link_id).pack())],
+        [InlineKeyboardButton(text="🔄 Оновити", callback_data=LinkCallback(action="stats", link_id=link_id).pack())],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="mlink_back")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+def get_link_trend_keyboard(link_id: int) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(text="🔄 Оновити", callback_data=LinkCallback(action="trend", link_id=link_id).pack())],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data=LinkCallback(action="stats", link_id=link_id).pack())]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
 def get_delete_link_confirm_keyboard(link_id: int) -> InlineKeyboardMarkup:
     keyboard = [
         [
-            InlineKeyboardButton(text="✅ Так", callback_data=f"mlink_confirm_del_{link_id}"),
+            InlineKeyboardButton(text="✅ Так", callback_data=LinkCallback(action="confirm_del", link_id=link_id).pack()),
             InlineKeyboardButton(text="❌ Ні", callback_data="mlink_back")
         ]
     ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def get_export_period_keyboard() -> InlineKeyboardMarkup:
+    keyboard = [
+        [
+            InlineKeyboardButton(text="Поточний місяць", callback_data=ExportPeriodCallback(preset="month").pack()),
+            InlineKeyboardButton(text="Минулий місяць", callback_data=ExportPeriodCallback(preset="prev").pack())
+        ],
+        [
+            InlineKeyboardButton(text="30 днів", callback_data=ExportPeriodCallback(preset="30").pack()),
+            InlineKeyboardButton(text="Весь час", callback_data=ExportPeriodCallback(preset="all").pack())
+        ],
+        [InlineKeyboardButton(text="✏️ Свій період", callback_data=ExportPeriodCallback(preset="custom").pack())]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def get_export_format_keyboard(date_from, date_to) -> InlineKeyboardMarkup:
+    period = {"date_from": f"{date_from:%Y%m%d}", "date_to": f"{date_to:%Y%m%d}"}
+    keyboard = [
+        [
+            InlineKeyboardButton(text="📄 CSV (ZIP)", callback_data=ExportRunCallback(export_format="csv", **period).pack()),
+            InlineKeyboardButton(text="📊 XLSX", callback_data=ExportRunCallback(export_format="xlsx", **period).pack())
+        ],
+        [InlineKeyboardButton(text="◀️ Назад", callback_data="export_back")]
+    ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
\ No newline at end of file
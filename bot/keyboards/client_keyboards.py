@@ -2,6 +2,7 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMar
 from config import administrators, WEB_APP_URL
 from database.client_db import get_product_types, get_products_by_catalog
 from ulits.admin_functions import strip_html_for_button
+from ulits.callbacks import CatalogCallback, ProductCallback, TariffCallback
 
 def get_start_keyboard(user_id: int):
     keyboard = [
@@ -43,7 +44,7 @@ def get_catalog_keyboard():
         row.append(
             InlineKeyboardButton(
                 text=f"{product_type} [{count}]",
-                callback_data=f"category_{catalog_id}"
+                callback_data=CatalogCallback(catalog_id=catalog_id).pack()
             )
         )
         if len(row) == 2:
@@ -67,7 +68,7 @@ def get_products_keyboard(catalog_id: int):
         row.append(
             InlineKeyboardButton(
                 text=label,
-                callback_data=f"product_{product_id}"
+                callback_data=ProductCallback(product_id=product_id).pack()
             )
         )
         if len(row) == 2:
@@ -101,14 +102,14 @@ def get_product_info_keyboard(product_id: int, product_name: str, description: s
             tariff = f"1-{tariff}"
         months, price = tariff.split('-', 1)
         months = months.strip()
-        price = price.strip()
+        price = price.replace('₴', '').strip()
         
         month_word = "місяць" if months == "1" else "місяці" if months in ["2", "3", "4"] else "місяців"
         
         keyboard.append([
             InlineKeyboardButton(
                 text=f"{months} {month_word} - {price}₴",
-                callback_data=f"buy_{product_id}_{months}_{price}"
+                callback_data=TariffCallback(action="buy", product_id=product_id, months=months, price=price).pack()
             )
         ])
     
@@ -132,7 +133,7 @@ def get_payment_keyboard(payment_link: str, product_id: int) -> InlineKeyboardMa
         [
             InlineKeyboardButton(
                 text="← Назад",
-                callback_data=f"product_{product_id}"
+                callback_data=ProductCallback(product_id=product_id).pack()
             )
         ]
     ])
@@ -145,17 +146,17 @@ def get_payment_choice_keyboard(product_id: int, months: int, price: float) -> I
         [
             InlineKeyboardButton(
                 text="💳 Оплатити карткою",
-                callback_data=f"one_time_card_{product_id}_{months}_{price}"
+                callback_data=TariffCallback(action="card", product_id=product_id, months=months, price=price).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="💰 Сплатити з балансу",
-                callback_data=f"pay_balance_{product_id}_{months}_{price}"
+                callback_data=TariffCallback(action="balance", product_id=product_id, months=months, price=price).pack()
             )
         ],
         [
-            InlineKeyboardButton(text="← Назад", callback_data=f"product_{product_id}")
+            InlineKeyboardButton(text="← Назад", callback_data=ProductCallback(product_id=product_id).pack())
         ],
     ])
 
@@ -197,13 +198,13 @@ def get_subscription_terms_keyboard(product_id: int, months: int, price: float)
         [
             InlineKeyboardButton(
                 text="✅ Погоджуюся з умовами",
-                callback_data=f"agree_subscription_{product_id}_{months}_{price}"
+                callback_data=TariffCallback(action="agree", product_id=product_id, months=months, price=price).pack()
             )
         ],
         [
             InlineKeyboardButton(
                 text="❌ Відмінити",
-                callback_data=f"product_{product_id}"
+                callback_data=ProductCallback(product_id=product_id).pack()
             )
         ]
     ])
@@ -227,7 +228,7 @@ def get_referral_keyboard(bot_name: str, user_id: int) -> InlineKeyboardMarkup:
             )
         ],
         [
-            InlineKeyboardButton(text="📋 Історія нарахувань", callback_data="partner_history"),
+            InlineKeyboardButton(text="📋 Історія балансу", callback_data="partner_history"),
             InlineKeyboardButton(text="💸 Запитати вивід", callback_data="partner_withdraw"),
         ],
     ])
@@ -0,0 +1,294 @@
+"""
+Навантажувальний прогін бота: синтезує потік Telegram-апдейтів (/start з реферальними
+та маркетинговими payload, каталог, product_/buy_ колбеки, кабінет) і проганяє їх
+через справжній Dispatcher (feed_update). Вихідні виклики Bot API не надсилаються,
+а записуються фейковою сесією. Звіт: апдейтів/сек та латентність по хендлерах.
+
+Запуск (з директорії bot):
+    python load_replay.py --shoppers 200 --concurrency 50 --api-latency 40
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Union, get_args, get_origin
+
+# Ізольована БД і фейковий токен — до імпорту config/main
+_workdir = tempfile.mkdtemp(prefix="flix_load_")
+os.environ["DATABASE_PATH"] = os.path.join(_workdir, "data.db")
+os.environ["BOT_TOKEN"] = "123456789:AAFakeLoadReplayTokenForLocalRunsOnly00"
+os.environ.setdefault("ADMIN_CHAT_ID", "-1000000000001")
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+BOT_ID = 123456789
+BOT_USERNAME = "FlixMarketLoadBot"
+
+
+class RecordingSession(BaseSession):
+    """Сесія Bot API, яка нічого не надсилає, а лише рахує виклики і повертає синтетичні відповіді."""
+
+    def __init__(self, api_latency: float = 0.0):
+        super().__init__()
+        self.api_latency = api_latency
+        self.calls = defaultdict(int)
+        self._message_id = 0
+
+    def _fake_message(self, method) -> Message:
+        self._message_id += 1
+        chat_id = getattr(method, "chat_id", None) or 0
+        return Message(
+            message_id=self._message_id,
+            date=datetime.now(),
+            chat=Chat(id=int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, type="private"),
+            text=getattr(method, "text", None) or getattr(method, "caption", None) or "",
+        )
+
+    def _fake_result(self, method):
+        returning = method.__returning__
+        options = get_args(returning) if get_origin(returning) is Union else (returning,)
+        if Message in options:
+            return self._fake_message(method)
+        if User in options:
+            return User(id=BOT_ID, is_bot=True, first_name="FlixMarket", username=BOT_USERNAME)
+        if bool in options:
+            return True
+        if get_origin(returning) is list:
+            return []
+        # getChat та інші рідкісні методи — перевіряються лише на старті, у прогоні не потрібні
+        return None
+
+    async def make_request(self, bot: Bot, method, timeout=None):
+        self.calls[method.__api_method__] += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        return self._fake_result(method)
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Внутрішня middleware: міряє час виконання кожного хендлера."""
+
+    def __init__(self, timings: dict):
+        self.timings = timings
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            self.timings[name].append(time.perf_counter() - started)
+
+
+def seed_database(categories: int, products_per_category: int, links: int, existing_users: int):
+    """Заповнює тимчасову БД товарами, маркетинговими посиланнями та частиною «старих» користувачів."""
+    from database.client_db import conn, create_tables
+    from database.links_db import create_table_links
+
+    create_tables()
+    create_table_links()
+    cur = conn.cursor()
+    product_ids = []
+    for catalog_id in range(1, categories + 1):
+        for i in range(products_per_category):
+            payment_type = "subscription" if i % 3 == 0 else "one"
+            cur.execute(
+                """
+                INSERT INTO products (catalog_id, product_type, product_name, product_description,
+                                      product_price, product_photo, payment_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (catalog_id, f"Сервіс {catalog_id}", f"Підписка {catalog_id}.{i}", "Опис товару",
+                 "1 - 150, 6 - 799, 12 - 1490", None, payment_type),
+            )
+            product_ids.append((catalog_id, cur.lastrowid, payment_type))
+    for i in range(links):
+        cur.execute("INSERT INTO links (link_name, link_url) VALUES (?, ?)", (f"Кампанія {i}", ""))
+    for i in range(existing_users):
+        cur.execute(
+            "INSERT INTO users (user_id, user_name, ref_id, join_date) VALUES (?, ?, NULL, datetime('now'))",
+            (500_000 + i, f"old_user_{i}"),
+        )
+    conn.commit()
+    return product_ids
+
+
+class ShopperScript:
+    """Генерує послідовність апдейтів для одного покупця."""
+
+    def __init__(self, user_id: int, rng: random.Random, product_ids: list, links: int, existing_users: int):
+        self.user = User(id=user_id, is_bot=False, first_name="Shopper", username=f"shopper_{user_id}")
+        self.chat = Chat(id=user_id, type="private")
+        self.rng = rng
+        self.product_ids = product_ids
+        self.links = links
+        self.existing_users = existing_users
+        self._update_id = user_id * 1000
+        self._message_id = 0
+
+    def _next_ids(self):
+        self._update_id += 1
+        self._message_id += 1
+        return self._update_id, self._message_id
+
+    def message(self, text: str) -> Update:
+        update_id, message_id = self._next_ids()
+        return Update(
+            update_id=update_id,
+            message=Message(message_id=message_id, date=datetime.now(), chat=self.chat, from_user=self.user, text=text),
+        )
+
+    def callback(self, data: str) -> Update:
+        update_id, message_id = self._next_ids()
+        origin = Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=self.chat,
+            from_user=User(id=BOT_ID, is_bot=True, first_name="FlixMarket"),
+            caption="catalog",
+        )
+        return Update(
+            update_id=update_id,
+            callback_query=CallbackQuery(
+                id=f"{update_id}", from_user=self.user, chat_instance="load", data=data, message=origin,
+            ),
+        )
+
+    def start_payload(self) -> str:
+        roll = self.rng.random()
+        if roll < 0.3 and self.existing_users:
+            return f"/start {500_000 + self.rng.randrange(self.existing_users)}"
+        if roll < 0.6 and self.links:
+            return f"/start linktowatch_{self.rng.randint(1, self.links)}"
+        return "/start"
+
+    def updates(self):
+        from ulits.callbacks import CatalogCallback, ProductCallback, TariffCallback
+
+        yield self.message(self.start_payload())
+        yield self.message("Каталог")
+        for _ in range(self.rng.randint(1, 3)):
+            catalog_id, product_id, payment_type = self.rng.choice(self.product_ids)
+            yield self.callback(CatalogCallback(catalog_id=catalog_id).pack())
+            yield self.callback(ProductCallback(product_id=product_id).pack())
+            if self.rng.random() < 0.5:
+                months, price = self.rng.choice([(1, 150), (6, 799), (12, 1490)])
+                yield self.callback(TariffCallback(action="buy", product_id=product_id, months=months, price=price).pack())
+        yield self.message("Мій кабінет")
+        yield self.callback("refresh_profile")
+        yield self.message("/start")
+
+
+def install_fake_payments(monobank_latency: float):
+    """Підміняє PaymentManager у хендлерах, щоб не ходити в Monobank (затримка імітується синхронно, як у реальних requests)."""
+    from handlers.client_handlers import client_handlers
+    from ulits.monopay_functions import PaymentManager
+
+    class FakePaymentManager(PaymentManager):
+        def create_payment(self, user_id, product_name, months, price, **kwargs):
+            time.sleep(monobank_latency)
+            local_payment_id = f"order_{user_id}_{time.time_ns()}"
+            return local_payment_id, f"inv_{local_payment_id}", "https://pay.example/invoice"
+
+        def create_payment_with_tokenization(self, user_id, product_name, months, price, **kwargs):
+            time.sleep(monobank_latency)
+            local_payment_id = f"subscription_{user_id}_{time.time_ns()}"
+            return local_payment_id, f"inv_{local_payment_id}", "https://pay.example/invoice", f"wallet_{user_id}"
+
+        def cancel_payment(self, invoice_id):
+            time.sleep(monobank_latency)
+            return True
+
+    client_handlers.payment_manager = FakePaymentManager()
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def run(args):
+    import main
+    from main import dp, include_routers, setup_middlewares
+
+    session = RecordingSession(api_latency=args.api_latency / 1000)
+    main.bot.session = session
+    product_ids = seed_database(args.categories, args.products, args.links, args.existing_users)
+    install_fake_payments(args.monobank_latency / 1000)
+
+    timings = defaultdict(list)
+    include_routers(dp)
+    setup_middlewares(dp, throttling=args.throttle)
+    dp.message.middleware(HandlerTimingMiddleware(timings))
+    dp.callback_query.middleware(HandlerTimingMiddleware(timings))
+
+    rng = random.Random(args.seed)
+    scripts = [
+        ShopperScript(1_000_000 + i, random.Random(rng.random()), product_ids, args.links, args.existing_users)
+        for i in range(args.shoppers)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = []
+
+    async def shopper(script: ShopperScript):
+        async with semaphore:
+            for update in script.updates():
+                try:
+                    await dp.feed_update(main.bot, update)
+                except Exception as e:
+                    errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(shopper(s) for s in scripts))
+    elapsed = time.perf_counter() - started
+
+    total_updates = sum(len(v) for v in timings.values())
+    print(f"\nПокупців: {args.shoppers}, паралельно: {args.concurrency}, "
+          f"затримка Bot API: {args.api_latency} мс, Monobank: {args.monobank_latency} мс")
+    print(f"Оброблено апдейтів: {total_updates} за {elapsed:.2f} с → {total_updates / elapsed:.1f} апдейтів/с")
+    print(f"Помилок: {len(errors)}")
+    for err in sorted(set(errors))[:5]:
+        print(f"  {err}")
+
+    print(f"\n{'Хендлер':<32}{'к-сть':>8}{'p50, мс':>10}{'p95, мс':>10}{'max, мс':>10}")
+    for name, values in sorted(timings.items(), key=lambda item: -statistics.fmean(item[1])):
+        print(f"{name:<32}{len(values):>8}{percentile(values, 50) * 1000:>10.2f}"
+              f"{percentile(values, 95) * 1000:>10.2f}{max(values) * 1000:>10.2f}")
+
+    print(f"\n{'Виклик Bot API':<32}{'к-сть':>8}")
+    for method, count in sorted(session.calls.items(), key=lambda item: -item[1]):
+        print(f"{method:<32}{count:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Прогін синтетичних апдейтів через Dispatcher")
+    parser.add_argument("--shoppers", type=int, default=200, help="кількість синтетичних покупців")
+    parser.add_argument("--concurrency", type=int, default=50, help="скільки покупців активні одночасно")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="імітована затримка Bot API, мс")
+    parser.add_argument("--monobank-latency", type=float, default=0.0, help="імітована затримка Monobank, мс")
+    parser.add_argument("--categories", type=int, default=4)
+    parser.add_argument("--products", type=int, default=6, help="товарів у категорії")
+    parser.add_argument("--links", type=int, default=5, help="маркетингових посилань")
+    parser.add_argument("--existing-users", type=int, default=1000, help="користувачів у БД до прогону")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--throttle", action="store_true", help="увімкнути антифлуд (синтетичні покупці тиснуть кнопки без пауз)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(run(parse_args())))
@@ -14,8 +14,9 @@ dp = Dispatcher(bot=bot, storage=storage)
 scheduler = AsyncIOScheduler(timezone='Europe/Kyiv')
 scheduler.start()
 
-async def main():
-    from handlers.client_handlers.client_handlers import router as client_router, on_startup, on_shutdown
+def include_routers(dispatcher: Dispatcher):
+    """Підключає всі роутери бота до диспетчера."""
+    from handlers.client_handlers.client_handlers import router as client_router
     from handlers.admin_handlers.admin_handlers import router as admin_router
     from handlers.admin_handlers.products_handlers import router as products_router
     from handlers.admin_handlers.subscriptions_handlers import router as subscriptions_router
@@ -23,16 +24,40 @@ async def main():
     from handlers.admin_handlers.admin_partner_handlers import router as admin_partner_router
     from handlers.client_handlers.profile_handlers import router as profile_router
     from handlers.admin_handlers.links_handlers import router as links_router
+    from handlers.admin_handlers.export_handlers import router as export_router
+
+    dispatcher.include_router(client_router)
+    dispatcher.include_router(admin_router)
+    dispatcher.include_router(products_router)
+    dispatcher.include_router(subscriptions_router)
+    dispatcher.include_router(mailing_router)
+    dispatcher.include_router(admin_partner_router)
+    dispatcher.include_router(profile_router)
+    dispatcher.include_router(links_router)
+    dispatcher.include_router(export_router)
+
+
+def setup_middlewares(dispatcher: Dispatcher, throttling: bool = True):
+    """
+    Middleware рівня апдейту: антифлуд, потім черговість обробки в межах одного користувача;
+    для callback — одноразовий розбір callback_data і виклик хендлера його класу за індексом.
+    """
+    from config import administrators
+    from ulits.middlewares import ThrottlingMiddleware, UserSerializationMiddleware
+    from ulits.callbacks import CallbackIndexMiddleware
+
+    if throttling:
+        dispatcher.update.outer_middleware(ThrottlingMiddleware(exempt_user_ids=administrators))
+    dispatcher.update.outer_middleware(UserSerializationMiddleware())
+    dispatcher.callback_query.outer_middleware(CallbackIndexMiddleware())
+
+
+async def main():
+    from handlers.client_handlers.client_handlers import on_startup, on_shutdown
     from database.client_db import create_tables
 
-    dp.include_router(client_router)
-    dp.include_router(admin_router)
-    dp.include_router(products_router)
-    dp.include_router(subscriptions_router)
-    dp.include_router(mailing_router)
-    dp.include_router(admin_partner_router)
-    dp.include_router(profile_router)
-    dp.include_router(links_router)
+    include_routers(dp)
+    setup_middlewares(dp)
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
@@ -0,0 +1,95 @@
+import html
+import logging
+from datetime import datetime
+
+from config import admin_chat_id, ADMIN_DIGEST_WINDOW
+from database.admin_digest_db import add_admin_digest_event, get_admin_digest_events, delete_admin_digest_events
+from database.client_db import transaction
+from database.outbox_db import enqueue_outbox
+from ulits.job_locks import leased_job
+from ulits.outbox import message_payload, enqueue_message, wake_outbox
+
+# info — збирається в дайджест; high — потребує дії адміна, надсилається одразу окремим повідомленням
+SEVERITY_INFO = "info"
+SEVERITY_HIGH = "high"
+
+# Типи подій дайджесту в порядку виводу
+DIGEST_KINDS = {
+    "new_subscription": "Нові підписки",
+    "new_one_time": "Разові покупки",
+    "balance_purchase": "Оплати з балансу",
+    "auto_payment_success": "Автосписання",
+    "auto_payment_failed": "Невдалі автосписання",
+    "token_invalid": "Недійсні картки",
+    "subscription_cancelled": "Скасовані підписки",
+    "user_cancelled": "Скасовано користувачами",
+}
+# Запас до ліміту Telegram у 4096 символів на заголовок і теги
+DIGEST_MAX_LENGTH = 3800
+
+
+def digest_line(user_id: int, username: str = None, *parts) -> str:
+    """Рядок деталей дайджесту: користувач і короткі поля події (екрануються)."""
+    user = f"@{username}" if username and str(username).strip() else f"ID {user_id}"
+    return " · ".join([html.escape(user)] + [html.escape(str(part)) for part in parts if part not in (None, "")])
+
+
+def admin_event(kind: str, text: str, summary: str, amount: float = 0, reply_markup=None,
+                fallback: list = None, dedupe_key: str = None, severity: str = SEVERITY_INFO) -> bool:
+    """
+    Повідомлення в адмін-чат: високий рівень (або вимкнений дайджест) — одразу в outbox,
+    решта — у дайджест найближчого вікна. Всередині transaction() фіксується разом зі зміною стану;
+    будити outbox після фіксації — справа викликача, як і для enqueue_message.
+    """
+    if severity == SEVERITY_HIGH or ADMIN_DIGEST_WINDOW <= 0:
+        return enqueue_message(admin_chat_id, text, dedupe_key=dedupe_key, reply_markup=reply_markup, fallback=fallback)
+    payload = message_payload(admin_chat_id, text, reply_markup=reply_markup, fallback=fallback)
+    return add_admin_digest_event(kind, summary, amount, payload, dedupe_key)
+
+
+def _digest_text(events: list) -> str:
+    started = datetime.fromtimestamp(events[0][5]).strftime('%H:%M')
+    finished = datetime.fromtimestamp(events[-1][5]).strftime('%H:%M')
+    grouped = {}
+    for _, kind, summary, amount, _, _ in events:
+        grouped.setdefault(kind, []).append((summary, amount or 0))
+    kinds = [kind for kind in DIGEST_KINDS if kind in grouped] + sorted(set(grouped) - set(DIGEST_KINDS))
+
+    lines = [f"📬 <b>Події {started}–{finished}</b> ({len(events)})", ""]
+    for kind in kinds:
+        total = sum(amount for _, amount in grouped[kind])
+        lines.append(f"{DIGEST_KINDS.get(kind, kind)}: <b>{len(grouped[kind])}</b>" + (f" · {total:.2f} ₴" if total else ""))
+    header = "\n".join(lines)
+
+    # Деталі по типах у згорнутій цитаті; що не влазить у ліміт повідомлення — лише лічильником
+    details, length, shown = [], len(header), 0
+    for kind in kinds:
+        for line in [f"<b>{DIGEST_KINDS.get(kind, kind)}</b>"] + [f"• {summary}" for summary, _ in grouped[kind]]:
+            if length + len(line) + 1 > DIGEST_MAX_LENGTH:
+                details.append(f"… та ще {len(events) - shown}")
+                return header + "\n\n<blockquote expandable>" + "\n".join(details) + "</blockquote>"
+            details.append(line)
+            length += len(line) + 1
+            shown += line.startswith("•")
+    return header + "\n\n<blockquote expandable>" + "\n".join(details) + "</blockquote>"
+
+
+@leased_job("flush_admin_digest", ttl=120)
+async def flush_admin_digest() -> int:
+    """
+    Зводить накопичені адмін-події в одне повідомлення (одна подія йде як є, з кнопками).
+    Дайджест і видалення подій — в одній транзакції, тож подія не загубиться і не продублюється.
+    """
+    with transaction():
+        events = get_admin_digest_events()
+        if not events:
+            return 0
+        max_id = events[-1][0]
+        if len(events) == 1:
+            enqueue_outbox("send_message", events[0][4], dedupe_key=f"admin_digest:{max_id}")
+        else:
+            enqueue_message(admin_chat_id, _digest_text(events), dedupe_key=f"admin_digest:{max_id}")
+        delete_admin_digest_events(max_id)
+    wake_outbox()
+    logging.info(f"Адмін-дайджест: {len(events)} подій")
+    return len(events)
@@ -1,4 +1,5 @@
 import re
+from bisect import bisect_left
 
 
 def format_message_text(message) -> str:
@@ -18,143 +19,94 @@ def format_message_text(message) -> str:
 
 
 def format_entities(text: str, entities: list = None) -> str:
-    print(text)
-    print(entities)
+    """
+    Перетворює entities Telegram на HTML за один прохід: сутності сортуються один раз,
+    відкриті теги тримаються в стеку і закриваються рівно на своїй межі.
+    """
     if not text or not entities:
         return text
 
-    utf16_to_utf8_map = create_utf16_to_utf8_mapping(text)
-    
-    adjusted_entities = []
-    for entity in entities:
-        utf8_offset = utf16_to_utf8_map.get(entity.offset, None)
-        utf8_end = utf16_to_utf8_map.get(entity.offset + entity.length, None)
-        
-        if utf8_offset is None or utf8_end is None:
-            continue
-            
-        new_entity = entity.__class__(**entity.__dict__) 
-        new_entity.offset = utf8_offset
-        new_entity.length = utf8_end - utf8_offset
-        
-        if new_entity.offset < 0 or new_entity.offset >= len(text):
+    to_index = utf16_offset_translator(text)
+    text_length = len(text)
+
+    spans = []
+    for order, entity in enumerate(entities):
+        start = to_index(entity.offset)
+        end = to_index(entity.offset + entity.length)
+        if start is None or end is None or start >= text_length or end <= start:
             continue
-        if new_entity.length <= 0:
+        entity_text = text[start:end]
+        # Для custom_emoji entity_text може містити невидимий placeholder
+        if not entity_text.strip() and entity.type != "custom_emoji":
             continue
-        if new_entity.offset + new_entity.length > len(text):
+        open_tag, close_tag = get_entity_tags(entity, entity_text)
+        if not open_tag:
             continue
-            
-        adjusted_entities.append(new_entity)
-    
-    if not adjusted_entities:
+        spans.append((start, -end, get_entity_priority(entity.type), order, open_tag, close_tag))
+
+    if not spans:
         return text
-    
-    entities_sorted = sorted(adjusted_entities, key=lambda e: (e.offset, get_entity_priority(e.type), -e.length))
-    
+    spans.sort()
+
     result = []
-    current_pos = 0
-    open_tags = []
-    processed_entities = set()  
-    
-    for entity in entities_sorted:
-        if id(entity) in processed_entities:
-            continue
-            
-        entity_type = entity.type
-        offset = entity.offset
-        length = entity.length
-        
-        try:
-            if offset > current_pos:
-                result.append(text[current_pos:offset])
-            
-            while open_tags and open_tags[-1]['end'] <= offset:
-                tag_info = open_tags.pop()
-                result.append(tag_info['close_tag'])
-            
-            entity_text = text[offset:offset + length]
-            
-            # Для custom_emoji entity_text може містити невидимий placeholder
-            if not entity_text.strip() and entity_type != "custom_emoji":
-                continue
-            
-            open_tag, close_tag = get_entity_tags(entity, entity_text)
-            
-            if not open_tag:
-                continue
-            
-            nested_entities = []
-            for other_entity in entities_sorted:
-                if (other_entity != entity and 
-                    other_entity.type != entity_type and
-                    other_entity.offset >= offset and 
-                    other_entity.offset + other_entity.length <= offset + length and
-                    other_entity.length > 0 and
-                    not (other_entity.offset == offset and other_entity.length == length)):
-                    nested_entities.append(other_entity)
-            
-            if nested_entities:
-                result.append(open_tag)
-                open_tags.append({
-                    'end': offset + length,
-                    'close_tag': close_tag
-                })
-                processed_entities.add(id(entity))
-                current_pos = offset
-            else:
-                same_range_entities = [
-                    e for e in entities_sorted 
-                    if e != entity and e.offset == offset and e.length == length and id(e) not in processed_entities
-                ]
-                if same_range_entities:
-                    all_entities = [entity] + same_range_entities
-                    all_entities.sort(key=lambda e: get_entity_priority(e.type))
-                    for e in all_entities:
-                        e_open_tag, e_close_tag = get_entity_tags(e, text[offset:offset + length])
-                        result.append(e_open_tag)
-                        open_tags.append({
-                            'end': offset + length,
-                            'close_tag': e_close_tag
-                        })
-                        processed_entities.add(id(e))
-                    result.append(entity_text)
-                    current_pos = offset + length
+    stack = []  # (end, open_tag, close_tag) у порядку відкриття
+    pos = 0
+
+    def close_until(limit: int):
+        nonlocal pos
+        while stack:
+            nearest = min(item[0] for item in stack)
+            if nearest > limit:
+                return
+            result.append(text[pos:nearest])
+            pos = nearest
+            # Сутність, що перетинає межу, закривається і відкривається знову, щоб теги не перехрещувались
+            reopen = []
+            remaining = sum(1 for item in stack if item[0] == nearest)
+            while remaining:
+                item = stack.pop()
+                result.append(item[2])
+                if item[0] == nearest:
+                    remaining -= 1
                 else:
-                    result.append(open_tag)
-                    result.append(entity_text)
-                    result.append(close_tag)
-                    processed_entities.add(id(entity))
-                    current_pos = offset + length
-            
-        except (AttributeError, IndexError) as e:
-            continue
-        except Exception as e:
-            continue
-    
-    while open_tags:
-        tag_info = open_tags.pop()
-        result.append(tag_info['close_tag'])
-    
-    if current_pos < len(text):
-        result.append(text[current_pos:])
-    
+                    reopen.append(item)
+            for item in reversed(reopen):
+                result.append(item[1])
+                stack.append(item)
+
+    for start, negative_end, _priority, _order, open_tag, close_tag in spans:
+        close_until(start)
+        result.append(text[pos:start])
+        pos = start
+        result.append(open_tag)
+        stack.append((-negative_end, open_tag, close_tag))
+
+    close_until(text_length)
+    result.append(text[pos:])
     return ''.join(result)
 
 
+_ASTRAL_CHARS = re.compile('[\U00010000-\U0010FFFF]')
 
 
-def create_utf16_to_utf8_mapping(text: str) -> dict:
-    utf16_to_utf8 = {}
-    utf16_pos = 0
-    
-    for utf8_pos, char in enumerate(text):
-        utf16_to_utf8[utf16_pos] = utf8_pos
-        utf16_length = len(char.encode('utf-16-le')) // 2
-        utf16_pos += utf16_length
-    
-    utf16_to_utf8[utf16_pos] = len(text)
-    
-    return utf16_to_utf8
+def utf16_offset_translator(text: str):
+    """
+    Повертає функцію: зсув у UTF-16 (як у Telegram) -> індекс у рядку Python, None якщо зсув поза текстом
+    чи посередині сурогатної пари. Пам'ять — лише позиції символів поза BMP (емодзі), а не словник на кожен символ.
+    """
+    astral_starts = [match.start() + count for count, match in enumerate(_ASTRAL_CHARS.finditer(text))]
+    utf16_length = len(text) + len(astral_starts)
+
+    def to_index(offset: int):
+        if offset < 0 or offset > utf16_length:
+            return None
+        before = bisect_left(astral_starts, offset)
+        if before and astral_starts[before - 1] + 1 == offset:
+            return None
+        return offset - before
+
+    return to_index
+
 
 def get_entity_tags(entity, entity_text: str) -> tuple:
     entity_type = entity.type
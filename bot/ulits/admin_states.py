@@ -32,4 +32,8 @@ class SearchSubscription(StatesGroup):
 
 class LinkStates(StatesGroup):
     waiting_for_name = State()
-    waiting_for_edit_name = State()
\ No newline at end of file
+    waiting_for_edit_name = State()
+
+
+class ExportStates(StatesGroup):
+    waiting_for_period = State()
\ No newline at end of file
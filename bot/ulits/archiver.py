@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from config import ARCHIVE_AFTER_DAYS
+from database.archive_db import (
+    ARCHIVE_TABLES,
+    HISTORY_TABLES,
+    select_archive_batch,
+    write_archive_partition,
+    delete_archived_rows,
+    purge_payments_temp_data,
+    expire_abandoned_pending_payments,
+)
+from ulits.job_locks import leased_job
+from ulits.reconciliation import STATEMENT_MAX_AGE
+
+# Pending-рахунок старший за вікно виписки вже не закриє звірка — позначаємо expired
+PENDING_ABANDON_DAYS = STATEMENT_MAX_AGE // 86400 + 1
+# Запасна межа на один запуск, щоб перший прохід по великій історії не тримав оренду годинами
+ARCHIVE_MAX_BATCHES = 200
+
+
+async def _archive_table(table: str, cutoff: str) -> int:
+    date_column = HISTORY_TABLES[table]
+    archived = 0
+    for _ in range(ARCHIVE_MAX_BATCHES):
+        records = select_archive_batch(table, cutoff)
+        if not records:
+            break
+        by_month = {}
+        for record in records:
+            by_month.setdefault(str(record[date_column])[:7], []).append(record)
+        for month, month_records in by_month.items():
+            # Спершу файл (атомарно, поза потоком бота), потім видалення з БД: після збою між кроками
+            # рядок лишиться гарячим і потрапить в архів вдруге — читання історії відкидає такі дублікати
+            await asyncio.to_thread(write_archive_partition, table, month, month_records)
+            archived += delete_archived_rows(table, month, month_records)
+    return archived
+
+
+@leased_job("archive_payment_history", ttl=300)
+async def archive_payment_history() -> dict:
+    """Нічне обслуговування історії: завислі pending, тимчасові дані рахунків і перенесення старих рядків в архів."""
+    result = {
+        "expired_pending": expire_abandoned_pending_payments(PENDING_ABANDON_DAYS),
+        "purged_temp_data": purge_payments_temp_data(),
+    }
+    cutoff = (date.today() - timedelta(days=ARCHIVE_AFTER_DAYS)).isoformat()
+    for table in ARCHIVE_TABLES:
+        try:
+            result[table] = await _archive_table(table, cutoff)
+        except Exception as e:
+            logging.error(f"Архівація {table} перервана: {e}", exc_info=True)
+    logging.info(f"Архівація історії до {cutoff}: {result}")
+    return result
@@ -0,0 +1,245 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.dispatcher.middlewares.manager import MiddlewareManager
+from aiogram.filters import Filter
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, TelegramObject
+from magic_filter import MagicFilter
+
+# Префікс -> клас callback; заповнюється при оголошенні класів нижче
+CALLBACK_INDEX: Dict[str, type] = {}
+
+
+class IndexedCallback(CallbackData, prefix="idx"):
+    """
+    Типізований callback з коротким унікальним префіксом. Кнопки будуються через .pack(),
+    хендлери реєструються через .filter(...) і отримують готовий об'єкт у параметрі callback_data.
+    """
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if cls.__prefix__ in CALLBACK_INDEX:
+            raise ValueError(f"Префікс callback {cls.__prefix__!r} вже зайнятий {CALLBACK_INDEX[cls.__prefix__].__name__}")
+        CALLBACK_INDEX[cls.__prefix__] = cls
+
+    @classmethod
+    def filter(cls, rule: Optional[MagicFilter] = None) -> "IndexedCallbackFilter":
+        return IndexedCallbackFilter(cls, rule)
+
+
+# --- Клієнтські ---
+
+class CatalogCallback(IndexedCallback, prefix="cat"):
+    catalog_id: int
+
+
+class ProductCallback(IndexedCallback, prefix="prod"):
+    product_id: int
+
+
+class TariffCallback(IndexedCallback, prefix="tariff"):
+    # buy — вибір тарифу, card / balance — одноразова оплата, agree — згода з умовами автосплати
+    action: str
+    product_id: int
+    months: int
+    price: float
+
+
+class SubscriptionCallback(IndexedCallback, prefix="sub"):
+    # simple — індекс у списку разових підписок, решта дій — id повторюваної підписки
+    action: str
+    subscription_id: int
+
+
+# --- Адмінські ---
+
+class AdminCatalogCallback(IndexedCallback, prefix="acat"):
+    # view — товари категорії, add — категорія нового товару
+    action: str
+    catalog_id: int
+
+
+class AdminProductCallback(IndexedCallback, prefix="aprod"):
+    action: str
+    product_id: int
+
+
+class PaymentTypeCallback(IndexedCallback, prefix="ptype"):
+    # Значення, що зберігається в products.payment_type: subscription / one
+    payment_type: str
+
+
+class AdminSubscriptionCallback(IndexedCallback, prefix="asub"):
+    action: str
+    kind: str
+    subscription_id: int
+
+
+class PartnerPercentCallback(IndexedCallback, prefix="ppct"):
+    value: int
+
+
+class PartnerListCallback(IndexedCallback, prefix="plist"):
+    page: int
+
+
+class PartnerUserCallback(IndexedCallback, prefix="puser"):
+    page: int
+    user_id: int
+
+
+class WithdrawCallback(IndexedCallback, prefix="wdr"):
+    # done / reject
+    action: str
+    request_id: int
+
+
+class LinkCallback(IndexedCallback, prefix="mlink"):
+    action: str
+    link_id: int
+
+
+class ExportPeriodCallback(IndexedCallback, prefix="xper"):
+    preset: str
+
+
+class ExportRunCallback(IndexedCallback, prefix="xrun"):
+    export_format: str
+    date_from: str
+    date_to: str
+
+
+# Старі payload'и "prefix_a_b" з уже надісланих повідомлень: префікс -> (клас, фіксовані поля, поля з payload).
+# Перевіряються лише коли новий формат не розпізнано; довші префікси першими (one_time_card_ до card_ тощо).
+LEGACY_CALLBACKS = {
+    "category_": (CatalogCallback, {}, ("catalog_id",)),
+    "product_": (ProductCallback, {}, ("product_id",)),
+    "buy_": (TariffCallback, {"action": "buy"}, ("product_id", "months", "price")),
+    "one_time_card_": (TariffCallback, {"action": "card"}, ("product_id", "months", "price")),
+    "pay_balance_": (TariffCallback, {"action": "balance"}, ("product_id", "months", "price")),
+    "agree_subscription_": (TariffCallback, {"action": "agree"}, ("product_id", "months", "price")),
+    "view_simple_": (SubscriptionCallback, {"action": "simple"}, ("subscription_id",)),
+    "view_recurring_": (SubscriptionCallback, {"action": "recurring"}, ("subscription_id",)),
+    "confirm_cancel_": (SubscriptionCallback, {"action": "confirm_cancel"}, ("subscription_id",)),
+    "cancel_subscription_": (SubscriptionCallback, {"action": "cancel"}, ("subscription_id",)),
+    "change_tariff_": (SubscriptionCallback, {"action": "tariff"}, ("subscription_id",)),
+    "change_card_": (SubscriptionCallback, {"action": "card"}, ("subscription_id",)),
+    "admin_withdraw_done_": (WithdrawCallback, {"action": "done"}, ("request_id",)),
+    "admin_withdraw_reject_": (WithdrawCallback, {"action": "reject"}, ("request_id",)),
+}
+_LEGACY_PREFIXES = sorted(LEGACY_CALLBACKS, key=len, reverse=True)
+
+
+def _parse_legacy(raw: str) -> Optional[IndexedCallback]:
+    for legacy_prefix in _LEGACY_PREFIXES:
+        if not raw.startswith(legacy_prefix):
+            continue
+        factory, fixed, fields = LEGACY_CALLBACKS[legacy_prefix]
+        values = raw[len(legacy_prefix):].split("_")
+        if len(values) != len(fields):
+            return None
+        return factory(**fixed, **dict(zip(fields, values)))
+    return None
+
+
+def parse_callback(raw: Optional[str]) -> Optional[IndexedCallback]:
+    """Розбирає callback_data один раз: префікс до першого ':' -> клас з індексу; None — не типізований callback."""
+    if not raw:
+        return None
+    prefix, separator, _ = raw.partition(IndexedCallback.__separator__)
+    try:
+        if separator:
+            factory = CALLBACK_INDEX.get(prefix)
+            return factory.unpack(raw) if factory else None
+        return _parse_legacy(raw)
+    except (TypeError, ValueError) as e:
+        logging.debug(f"Некоректний callback {raw!r}: {e}")
+        return None
+
+
+class IndexedCallbackFilter(Filter):
+    """Перевірка типу вже розібраного об'єкта (і правила з полів) — без повторного розбору рядка."""
+
+    def __init__(self, factory: type, rule: Optional[MagicFilter] = None):
+        self.factory = factory
+        self.rule = rule
+
+    def __str__(self) -> str:
+        return f"{self.factory.__name__}.filter({self.rule!r})"
+
+    async def __call__(self, callback: CallbackQuery, callback_data: Any = None) -> bool:
+        if not isinstance(callback_data, self.factory):
+            return False
+        return self.rule is None or bool(self.rule.resolve(callback_data))
+
+
+CallbackRoute = Tuple[TelegramEventObserver, HandlerObject]
+
+
+def build_callback_routes(root: Router) -> Dict[type, List[CallbackRoute]]:
+    """
+    Клас callback -> хендлери з його .filter(...) у порядку, в якому їх перебирав би aiogram.
+    Інші хендлери (F.data == "...") такий payload не приймають, тож їх можна не перевіряти.
+    """
+    routes: Dict[type, List[CallbackRoute]] = {}
+    for router in root.chain_tail:
+        observer = router.callback_query
+        for handler_object in observer.handlers:
+            for filter_object in handler_object.filters or ():
+                if isinstance(filter_object.callback, IndexedCallbackFilter):
+                    routes.setdefault(filter_object.callback.factory, []).append((observer, handler_object))
+                    break
+    return routes
+
+
+def _inner_middlewares(observer: TelegramEventObserver) -> List[Any]:
+    # Те саме, що робить aiogram перед викликом хендлера: middleware від кореневого роутера до власного
+    middlewares: List[Any] = []
+    for router in reversed(tuple(observer.router.chain_head)):
+        middlewares.extend(router.callback_query.middleware)
+    return middlewares
+
+
+class CallbackIndexMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.callback_query: розбирає callback один раз і одразу викликає хендлер
+    свого класу з таблиці маршрутів, не перебираючи решту роутерів. Якщо жоден хендлер класу
+    не підійшов (стан, IsAdmin, поля) — звичайна маршрутизація aiogram.
+    """
+
+    def __init__(self) -> None:
+        self.routes: Optional[Dict[type, List[CallbackRoute]]] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, CallbackQuery):
+            return await handler(event, data)
+        parsed = parse_callback(event.data)
+        if parsed is None:
+            return await handler(event, data)
+        data["callback_data"] = parsed
+
+        if self.routes is None:
+            # Роутери підключаються до старту polling, тож таблицю будуємо з першим callback
+            self.routes = build_callback_routes(data["event_router"])
+        for observer, handler_object in self.routes.get(type(parsed), ()):
+            kwargs = {**data, "handler": handler_object, "event_router": observer.router}
+            passed, extra = await handler_object.check(event, **kwargs)
+            if not passed:
+                continue
+            kwargs.update(extra)
+            call = MiddlewareManager.wrap_middlewares(_inner_middlewares(observer), handler_object.call)
+            try:
+                return await call(event, kwargs)
+            except SkipHandler:
+                continue
+        return await handler(event, data)
@@ -1,65 +1,62 @@
-from database.client_db import get_user_info, get_user_subscriptions, get_user_recurring_subscriptions
 from datetime import datetime
 from Content.texts import get_calendar_emoji_html, get_person_emoji_html, get_premium_emoji
+from ulits.profile_cache import get_profile_snapshot
+
+
+def format_snapshot_date(value, fmt: str = '%d.%m.%Y') -> str:
+    return value.strftime(fmt) if value else "—"
+
+
+def format_profile_subscriptions(snapshot: dict) -> str:
+    """Блок «Ваші підписки» для кабінету — разові підписки та автосплата."""
+    profile_text = ""
+    for sub in snapshot['subscriptions']:
+        status_emoji = get_premium_emoji("check") if sub['status'] == "active" else "❌"
+
+        profile_text += (
+            f"{status_emoji} <b>{sub['product_name']}</b>\n"
+            f"   {get_premium_emoji('money')} {sub['price']}₴ (одноразова оплата)\n"
+            f"   {get_calendar_emoji_html()} До: {format_snapshot_date(sub['end_date'])}\n\n"
+        )
+
+    for sub in snapshot['recurring']:
+        months = sub['months']
+        status_emoji = get_premium_emoji("check") if sub['status'] == "active" else "❌"
+
+        profile_text += (
+            f"{status_emoji} <b>{sub['product_name']}</b> (підписка)\n"
+            f"   {get_premium_emoji('money')} {sub['price']}₴ кожні {months} {'місяць' if months == 1 else 'місяці' if months in [2,3,4] else 'місяців'}\n"
+            f"   {get_calendar_emoji_html()} Наступний платіж: {format_snapshot_date(sub['next_payment'])}\n"
+        )
+
+        if sub['payment_failures'] > 0:
+            profile_text += f"   ⚠️ Невдалих спроб: {sub['payment_failures']}\n"
+
+        profile_text += "\n"
+    return profile_text
 
 
 async def get_profile_text(user_id: int, username: str) -> str:
-    user_info = get_user_info(user_id)
+    snapshot = get_profile_snapshot(user_id)
     
-    if not user_info:
+    if not snapshot:
         return "❌ Помилка отримання даних профілю"
     
     username = username or "Не вказано"
-    joined_date = user_info['join_date']
-    
-    joined_datetime = datetime.strptime(joined_date, '%Y-%m-%d %H:%M:%S')
-    days_using = (datetime.now() - joined_datetime).days
-    
-    subscriptions = get_user_subscriptions(user_id)
-    
-    recurring_subscriptions = get_user_recurring_subscriptions(user_id)
+    joined_datetime = snapshot['join_date']
+    days_using = (datetime.now() - joined_datetime).days if joined_datetime else 0
     
     profile_text = (
         f"{get_person_emoji_html()} <b>Мій кабінет</b>\n\n"
         f"• Логін: @{username}\n"
         f"• ID: <code>{user_id}</code>\n"
-        f"• З нами з: {joined_datetime.strftime('%d.%m.%Y')}\n"
+        f"• З нами з: {format_snapshot_date(joined_datetime)}\n"
         f"• Днів користування: {days_using}\n\n"
     )
     
-    if subscriptions or recurring_subscriptions:
+    if snapshot['subscriptions'] or snapshot['recurring']:
         profile_text += "📋 <b>Ваші підписки:</b>\n\n"
-        
-        for sub in subscriptions:
-            product_name = sub['product_name']
-            price = sub['price']
-            end_date = datetime.strptime(sub['end_date'], '%Y-%m-%d')
-            status = sub['status']
-            
-            status_emoji = get_premium_emoji("check") if status == "active" else "❌"
-            
-            profile_text += (
-                f"{status_emoji} <b>{product_name}</b>\n"
-                f"   {get_premium_emoji('money')} {price}₴ (одноразова оплата)\n"
-                f"   {get_calendar_emoji_html()} До: {end_date.strftime('%d.%m.%Y')}\n\n"
-            )
-        
-        for sub in recurring_subscriptions:
-            sub_id, product_name, months, price, next_payment_date, status, payment_failures = sub
-            
-            status_emoji = get_premium_emoji("check") if status == "active" else "❌"
-            next_payment = datetime.strptime(next_payment_date, '%Y-%m-%d %H:%M:%S')
-            
-            profile_text += (
-                f"{status_emoji} <b>{product_name}</b> (підписка)\n"
-                f"   {get_premium_emoji('money')} {price}₴ кожні {months} {'місяць' if months == 1 else 'місяці' if months in [2,3,4] else 'місяців'}\n"
-                f"   {get_calendar_emoji_html()} Наступний платіж: {next_payment.strftime('%d.%m.%Y')}\n"
-            )
-            
-            if payment_failures > 0:
-                profile_text += f"   ⚠️ Невдалих спроб: {payment_failures}\n"
-            
-            profile_text += "\n"
+        profile_text += format_profile_subscriptions(snapshot)
     else:
         profile_text += "📋 <b>Підписки:</b> Немає активних підписок"
     
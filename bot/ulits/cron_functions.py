@@ -1,9 +1,15 @@
 import asyncio
 import logging
+import sqlite3
 from datetime import datetime, timedelta
-from database.client_db import get_active_subscriptions, get_active_recurring_subscriptions, get_user_token, update_subscription_next_payment, increment_payment_failures, deactivate_subscription, save_subscription_payment, get_ref_id_by_user, add_partner_credit, get_partner_referral_percent, get_username_by_id
-from database.links_db import track_link_purchase
-from ulits.monopay_functions import PaymentManager
+from database.client_db import transaction, get_active_subscriptions, iter_due_recurring_subscriptions, defer_charge_slot, reset_charge_slot, update_subscription_next_payment, increment_payment_failures, deactivate_subscription, save_subscription_payment, get_ref_id_by_user, add_partner_credit, get_username_by_id
+from database.token_health_db import get_invalid_token_subscriptions
+from ulits.monopay_functions import PaymentManager, monobank_http
+from ulits.resilience import ServiceUnavailable
+from ulits.job_locks import leased_job
+from ulits.admin_digest import admin_event, digest_line
+from ulits.outbox import enqueue_message, wake_outbox
+from database.outbox_db import enqueue_outbox
 from Content.texts import get_premium_emoji
 from Content.texts import (
     get_partner_referral_purchase_text,
@@ -20,10 +26,20 @@ from keyboards.admin_keyboards import get_write_to_user_keyboard
 from main import bot
 from keyboards.client_keyboards import get_services_keyboard
 from ulits.client_functions import get_days_word
-from config import administrators, admin_chat_id
+from ulits.profile_cache import invalidate_profile
+from config import administrators
 import time
+import pytz
 
+# Білінг іде безперервно: кожні RENEWAL_TICK_SECONDS обробляється не більше RENEWAL_BATCH_SIZE підписок,
+# чий слот списання настав (слоти розподілені по дню платежу — див. BILLING_WINDOW_* у client_db)
+RENEWAL_TICK_SECONDS = 300
+RENEWAL_BATCH_SIZE = 20
+# Наступна спроба після невдалого або незавершеного списання — як у колишньому 6-годинному циклі
+RENEWAL_RETRY_DELAY = 6 * 3600
 
+
+@leased_job("check_expiring_subscriptions", ttl=300, cooldown=20 * 3600)
 async def check_expiring_subscriptions():
     try:
         today = datetime.now().date()
@@ -67,25 +83,60 @@ async def check_expiring_subscriptions():
         print(f"Помилка при перевірці підписок: {e}")
 
 
-async def process_recurring_payments():
+async def cancel_invalid_token_subscriptions() -> int:
+    """
+    Підписки, день списання яких настав, а токен картки вже визнано недійсним (check_token_health):
+    той самий результат, що й TOKEN_NOT_FOUND при списанні, але без звернення до Monobank.
+    """
+    now = datetime.now(pytz.timezone('Europe/Kiev')).strftime('%Y-%m-%d %H:%M:%S')
+    rows = get_invalid_token_subscriptions(now)
+    for subscription_id, user_id, product_name, price, next_payment_date, masked_card, reason in rows:
+        logging.warning(f"🚫 Токен картки для підписки {subscription_id} недійсний за попередньою перевіркою ({reason}). Деактивуємо підписку.")
+        save_subscription_payment(
+            subscription_id=subscription_id,
+            user_id=user_id,
+            amount=price,
+            status='failed',
+            invoice_id=None,
+            payment_id=None,
+            error_message=f"TOKEN_PRECHECK: {reason}"
+        )
+        deactivate_subscription(subscription_id)
+        invalidate_profile(user_id)
+        await notify_user_token_invalid(user_id, product_name, masked_card, reason)
+    return len(rows)
+
+
+@leased_job("process_recurring_payments", ttl=300, cooldown=RENEWAL_TICK_SECONDS - 60)
+async def process_recurring_payments(limit: int | None = RENEWAL_BATCH_SIZE):
+    """Списує підписки, чий слот настав: не більше limit за запуск (None — усі, для ручного запуску)."""
     try:
         logging.info("🔄 Початок обробки повторюваних платежів")
+        cancelled = await cancel_invalid_token_subscriptions()
+        if cancelled:
+            logging.info(f"🚫 Скасовано підписок з недійсним токеном без спроби списання: {cancelled}")
         payment_manager = PaymentManager()
-        subscriptions = get_active_recurring_subscriptions()
-        logging.info(f"📋 Знайдено {len(subscriptions)} активних повторюваних підписок")
-        print(subscriptions)
+        processed = 0
         
-        for subscription in subscriptions:
+        # Кандидати йдуть порціями разом з токеном картки (один індексований JOIN замість запиту на кожну підписку)
+        for subscription, token_data in iter_due_recurring_subscriptions(chunk_size=limit or 200):
+            if limit is not None and processed >= limit:
+                break
+            if monobank_http.breaker.is_open:
+                # Під час збою Monobank не чіпаємо підписки: вони лишаються до наступного запуску
+                logging.warning("⏸ Monobank недоступний — обробку повторюваних платежів призупинено")
+                break
             subscription_id, user_id, product_id, product_name, months, price, wallet_id, next_payment_date = subscription
+            processed += 1
+            # Слот переноситься до спроби: після збою чи незавершеного платежу підписка не повернеться в наступну порцію
+            defer_charge_slot(subscription_id, RENEWAL_RETRY_DELAY)
+            invoice_id = local_payment_id = None
             logging.info(f"💳 Обробка підписки {subscription_id} для користувача {user_id} ({product_name})")
             
             try:
-                # Отримуємо токен картки користувача
-                logging.info(f"🔑 Отримання токену картки для користувача {user_id}")
-                token_data = get_user_token(user_id)
                 if not token_data:
                     logging.error(f"❌ Токен не знайдено для користувача {user_id}")
-                    await increment_payment_failures(subscription_id)
+                    increment_payment_failures(subscription_id)
                     continue
                 
                 wallet_id_db, card_token, masked_card, card_type = token_data
@@ -94,7 +145,8 @@ async def process_recurring_payments():
                 # Створюємо платіж по токену
                 logging.info(f"💳 Створення платежу по токену для підписки {subscription_id}")
                 try:
-                    local_payment_id, invoice_id = payment_manager.create_token_payment(
+                    local_payment_id, invoice_id = await asyncio.to_thread(
+                        payment_manager.create_token_payment,
                         wallet_id=wallet_id_db,
                         card_token=card_token,
                         product_name=product_name,
@@ -102,6 +154,8 @@ async def process_recurring_payments():
                         price=price
                     )
                     logging.info(f"✅ Платіж створено: local_payment_id={local_payment_id}, invoice_id={invoice_id}")
+                except ServiceUnavailable:
+                    raise
                 except Exception as payment_error:
                     # Обробляємо помилки створення платежу
                     error_message = str(payment_error)
@@ -203,7 +257,7 @@ async def process_recurring_payments():
                     logging.info(f"🔍 Перевірка статусу платежу {invoice_id} (спроба {attempt}/{max_attempts})")
                     
                     try:
-                        payment_status = payment_manager.get_payment_status(invoice_id)
+                        payment_status = await asyncio.to_thread(payment_manager.get_payment_status, invoice_id)
                         current_status = payment_status.get('status')
                         modified_date = payment_status.get('modifiedDate')
                         
@@ -227,6 +281,8 @@ async def process_recurring_payments():
                             final_status = current_status
                             break
                             
+                    except ServiceUnavailable:
+                        raise
                     except Exception as e:
                         logging.error(f"❌ Помилка при перевірці статусу платежу: {e}")
                         if attempt < max_attempts:
@@ -264,53 +320,21 @@ async def process_recurring_payments():
                 if current_status == 'success':
                     # Успішний платіж
                     logging.info(f"✅ Успішний платіж для підписки {subscription_id}")
-                    save_subscription_payment(
-                        subscription_id=subscription_id,
-                        user_id=user_id,
-                        amount=price,
-                        status='success',
-                        invoice_id=invoice_id,
-                        payment_id=local_payment_id
-                    )
-                    
-                    # Оновлюємо дату наступного платежу
-                    logging.info(f"📅 Оновлення дати наступного платежу для підписки {subscription_id}")
-                    update_subscription_next_payment(subscription_id, months)
-                    track_link_purchase(user_id)
-
-                    ref_id = get_ref_id_by_user(user_id)
-                    if ref_id:
-                        add_partner_credit(
-                            partner_id=ref_id,
-                            buyer_id=user_id,
-                            purchase_amount=price,
-                            product_name=product_name,
-                            payment_type="subscription",
-                        )
-                        credit_amount = round(price * (get_partner_referral_percent() / 100), 1)
-                        if credit_amount > 0:
-                            buyer_username = get_username_by_id(user_id)
-                            buyer_line = f"@{buyer_username}" if (buyer_username and str(buyer_username).strip()) else f"користувач (ID: {user_id}, прихований профіль)"
-                            try:
-                                await bot.send_message(
-                                    ref_id,
-                                    get_partner_referral_purchase_text(buyer_line, product_name, price, credit_amount),
-                                    parse_mode="HTML",
-                                )
-                            except Exception:
-                                pass
-
-                    # Повідомляємо користувача про успішний платіж з усіма даними для перевірки
-                    logging.info(f"📱 Відправка повідомлення користувачу {user_id} про успішний платіж")
-                    await notify_user_payment_success(
-                        user_id=user_id, 
-                        product_name=product_name, 
-                        amount=price, 
-                        months=months,
-                        invoice_id=invoice_id,
-                        masked_card=status_masked_card,
-                        card_token=card_token
-                    )
+                    # Запис платежу, нова дата списання, нарахування партнеру і повідомлення — одна транзакція:
+                    # після падіння не лишиться 'success' зі старою датою, яку наступний запуск списав би вдруге
+                    with transaction():
+                        if not save_subscription_payment(
+                            subscription_id=subscription_id,
+                            user_id=user_id,
+                            amount=price,
+                            status='success',
+                            invoice_id=invoice_id,
+                            payment_id=local_payment_id
+                        ):
+                            raise sqlite3.Error(f"Не вдалося записати платіж {invoice_id}")
+                        await _settle_renewal(subscription_id, user_id, invoice_id, product_name, months, price,
+                                              status_masked_card, card_token)
+                    wake_outbox()
                     
                     logging.info(f"✅ Успішний платіж для підписки {subscription_id}, користувач {user_id}, invoice_id={invoice_id}")
                 
@@ -406,6 +430,23 @@ async def process_recurring_payments():
                     )
                     increment_payment_failures(subscription_id)
                 
+            except ServiceUnavailable as e:
+                # Збій на боці Monobank не рахується клієнту як невдалий платіж
+                logging.warning(f"⏸ Monobank недоступний, обробку підписок призупинено: {e}")
+                if invoice_id:
+                    # Створене списання дозвірить reconcile_payments_with_statement
+                    save_subscription_payment(
+                        subscription_id=subscription_id,
+                        user_id=user_id,
+                        amount=price,
+                        status='processing',
+                        invoice_id=invoice_id,
+                        payment_id=local_payment_id,
+                    )
+                else:
+                    # Рахунку немає — спроби не було: без запису в історії платежів, слот повертається на місце
+                    reset_charge_slot(subscription_id)
+                break
             except Exception as e:
                 logging.error(f"💥 Помилка при обробці підписки {subscription_id}: {e}")
                 save_subscription_payment(
@@ -416,8 +457,10 @@ async def process_recurring_payments():
                     error_message=str(e)
                 )
                 increment_payment_failures(subscription_id)
+            finally:
+                invalidate_profile(user_id)
                 
-        logging.info("✅ Завершено обробку повторюваних платежів")
+        logging.info(f"✅ Завершено обробку повторюваних платежів, оброблено підписок: {processed}")
                 
     except Exception as e:
         logging.error(f"💥 Помилка при обробці повторюваних платежів: {e}")
@@ -427,10 +470,10 @@ async def notify_user_payment_success(user_id: int, product_name: str, amount: f
                                      invoice_id: str = None, masked_card: str = None, card_token: str = None):
     try:
         next_date_str = (datetime.now() + timedelta(days=30 * months)).strftime('%d.%m.%Y')
-        await bot.send_message(
+        enqueue_message(
             user_id,
             get_user_auto_payment_success_text(product_name, amount, months, next_date_str),
-            parse_mode="HTML",
+            dedupe_key=f"{invoice_id}:user_success" if invoice_id else None,
         )
         username = get_username_by_id(user_id)
         card_info = f"{get_premium_emoji('card')} <b>Картка:</b> <code>{masked_card}</code>\n" if masked_card else ""
@@ -441,15 +484,18 @@ async def notify_user_payment_success(user_id: int, product_name: str, amount: f
         invoice_info = f"📄 <b>Invoice ID:</b> <code>{invoice_id}</code>\n" if invoice_id else ""
 
         try:
-            await bot.send_message(
-                admin_chat_id,
+            admin_event(
+                "auto_payment_success",
                 get_admin_auto_payment_success_text(
                     user_id, username, product_name, amount, months, next_date_str,
                     invoice_info, card_info, token_info,
                 ),
-                parse_mode="HTML",
+                digest_line(user_id, username, product_name, f"{amount} ₴", masked_card),
+                amount,
+                dedupe_key=f"{invoice_id}:admin_auto" if invoice_id else None,
                 reply_markup=get_write_to_user_keyboard(user_id),
             )
+            wake_outbox()
         except Exception as e:
             logging.error(f"Помилка при відправці повідомлення адміну про автоматичний платіж: {e}")
             
@@ -461,10 +507,10 @@ async def notify_user_payment_failed(user_id: int, product_name: str, masked_car
                                      invoice_id: str = None, card_token: str = None,
                                      failure_reason: str = None):
     try:
-        await bot.send_message(
+        enqueue_message(
             user_id,
             get_user_auto_payment_failed_text(product_name, masked_card),
-            parse_mode="HTML",
+            dedupe_key=f"{invoice_id}:user_failed" if invoice_id else None,
         )
         username = get_username_by_id(user_id)
         invoice_info = f"📄 <b>Invoice ID:</b> <code>{invoice_id}</code>\n" if invoice_id else ""
@@ -475,15 +521,17 @@ async def notify_user_payment_failed(user_id: int, product_name: str, masked_car
         reason_info = f"⚠️ <b>Причина:</b> {failure_reason}\n" if failure_reason else ""
 
         try:
-            await bot.send_message(
-                admin_chat_id,
+            admin_event(
+                "auto_payment_failed",
                 get_admin_auto_payment_failed_text(
                     user_id, username, product_name, masked_card,
                     invoice_info, token_info, reason_info,
                 ),
-                parse_mode="HTML",
+                digest_line(user_id, username, product_name, masked_card, failure_reason),
+                dedupe_key=f"{invoice_id}:admin_failed" if invoice_id else None,
                 reply_markup=get_write_to_user_keyboard(user_id),
             )
+            wake_outbox()
         except Exception as e:
             logging.error(f"Помилка при відправці повідомлення адміну про невдалий платіж: {e}")
             
@@ -494,19 +542,16 @@ async def notify_user_payment_failed(user_id: int, product_name: str, masked_car
 async def notify_user_token_invalid(user_id: int, product_name: str, masked_card: str, error_text: str):
     """Повідомляє користувача про невалідний токен картки"""
     try:
-        await bot.send_message(
-            user_id,
-            get_user_token_invalid_text(product_name, masked_card),
-            parse_mode="HTML",
-        )
+        enqueue_message(user_id, get_user_token_invalid_text(product_name, masked_card))
         username = get_username_by_id(user_id)
         try:
-            await bot.send_message(
-                admin_chat_id,
+            admin_event(
+                "token_invalid",
                 get_admin_token_invalid_text(user_id, username, product_name, masked_card, error_text),
-                parse_mode="HTML",
+                digest_line(user_id, username, product_name, masked_card),
                 reply_markup=get_write_to_user_keyboard(user_id),
             )
+            wake_outbox()
         except Exception as e:
             logging.error(f"Помилка при відправці повідомлення адміну про невалідний токен: {e}")
             
@@ -516,19 +561,16 @@ async def notify_user_token_invalid(user_id: int, product_name: str, masked_card
 
 async def notify_user_subscription_cancelled(user_id: int, product_name: str):
     try:
-        await bot.send_message(
-            user_id,
-            get_user_subscription_cancelled_text(product_name),
-            parse_mode="HTML",
-        )
+        enqueue_message(user_id, get_user_subscription_cancelled_text(product_name))
         username = get_username_by_id(user_id)
         try:
-            await bot.send_message(
-                admin_chat_id,
+            admin_event(
+                "subscription_cancelled",
                 get_admin_subscription_cancelled_text(user_id, username, product_name),
-                parse_mode="HTML",
+                digest_line(user_id, username, product_name),
                 reply_markup=get_write_to_user_keyboard(user_id),
             )
+            wake_outbox()
         except Exception as e:
             logging.error(f"Помилка при відправці повідомлення адміну про скасування підписки: {e}")
             
@@ -570,11 +612,110 @@ async def notify_admins_subscription_stats():
         logging.error(f"Помилка при формуванні статистики підписок: {e}")
 
 
+async def _settle_renewal(subscription_id: int, user_id: int, invoice_id: str, product_name: str, months: int,
+                          price: float, masked_card: str, card_token: str):
+    """
+    Наслідки успішного автосписання всередині transaction(): нова дата списання і партнерське нарахування,
+    лічильник посилання і повідомлення — записами outbox, які доставить диспетчер після фіксації.
+    """
+    if not update_subscription_next_payment(subscription_id, months):
+        raise sqlite3.Error(f"Не вдалося оновити дату наступного платежу підписки {subscription_id}")
+    enqueue_outbox("link_purchase", {"user_id": user_id, "amount": price}, dedupe_key=f"{invoice_id}:link_purchase")
+
+    ref_id = get_ref_id_by_user(user_id)
+    if ref_id:
+        credit_amount = add_partner_credit(
+            partner_id=ref_id,
+            buyer_id=user_id,
+            purchase_amount=price,
+            product_name=product_name,
+            payment_type="subscription",
+            source_ref=invoice_id,
+        )
+        if credit_amount > 0:
+            buyer_username = get_username_by_id(user_id)
+            buyer_line = f"@{buyer_username}" if (buyer_username and str(buyer_username).strip()) else f"користувач (ID: {user_id}, прихований профіль)"
+            enqueue_message(
+                ref_id,
+                get_partner_referral_purchase_text(buyer_line, product_name, price, credit_amount),
+                dedupe_key=f"{invoice_id}:partner",
+            )
+
+    await notify_user_payment_success(
+        user_id=user_id,
+        product_name=product_name,
+        amount=price,
+        months=months,
+        invoice_id=invoice_id,
+        masked_card=masked_card,
+        card_token=card_token
+    )
+
+
+async def settle_recurring_charge(payment_db_id: int, subscription_id: int, user_id: int, invoice_id: str,
+                                  product_name: str, months: int, price: float) -> bool:
+    """Проводить успішне списання по токену, що було в processing. Повторний виклик нічого не робить."""
+    from database.client_db import cursor, get_user_token
+
+    token_data = get_user_token(user_id)
+    masked_card = token_data[2] if token_data else "**** **** **** ****"
+    card_token = token_data[1] if token_data else None
+
+    # Статус, нова дата списання, нарахування партнеру і повідомлення фіксуються разом
+    with transaction():
+        cursor.execute("""
+            UPDATE subscription_payments 
+            SET status = 'success', payment_date = datetime('now')
+            WHERE id = ? AND status = 'processing'
+        """, (payment_db_id,))
+        if cursor.rowcount == 0:
+            logging.info(f"Платіж {invoice_id} уже оброблено")
+            return False
+        await _settle_renewal(subscription_id, user_id, invoice_id, product_name, months, price, masked_card, card_token)
+    wake_outbox()
+    logging.info(f"✅ Платіж {invoice_id} тепер успішний!")
+    invalidate_profile(user_id)
+    return True
+
+
+async def fail_recurring_charge(payment_db_id: int, subscription_id: int, user_id: int, invoice_id: str,
+                                product_name: str, failure_reason: str, notify: bool = True) -> bool:
+    """Закриває списання в processing як невдале і рахує помилку підписки."""
+    from database.client_db import cursor, conn, get_user_token, increment_payment_failures
+    
+    cursor.execute("""
+        UPDATE subscription_payments 
+        SET status = 'failed', error_message = ?
+        WHERE id = ? AND status = 'processing'
+    """, (failure_reason, payment_db_id))
+    conn.commit()
+    if cursor.rowcount == 0:
+        return False
+    
+    increment_payment_failures(subscription_id)
+    invalidate_profile(user_id)
+    
+    if notify:
+        token_data = get_user_token(user_id)
+        masked_card = token_data[2] if token_data else "**** **** **** ****"
+        card_token = token_data[1] if token_data else None
+        
+        await notify_user_payment_failed(
+            user_id=user_id,
+            product_name=product_name,
+            masked_card=masked_card,
+            invoice_id=invoice_id,
+            card_token=card_token,
+            failure_reason=failure_reason
+        )
+    return True
+
+
+@leased_job("check_processing_payments", ttl=120)
 async def check_processing_payments():
     """Перевіряє платежі, які залишилися в статусі processing"""
     try:
-        from database.client_db import cursor, conn, get_user_token, update_subscription_next_payment, increment_payment_failures
-        from ulits.monopay_functions import PaymentManager
+        from database.client_db import cursor
         
         logging.info("🔍 Перевірка платежів в статусі processing...")
         
@@ -600,108 +741,28 @@ async def check_processing_payments():
             
             try:
                 logging.info(f"🔍 Перевірка платежу {invoice_id} для підписки {subscription_id}")
-                payment_status = payment_manager.get_payment_status(invoice_id)
+                payment_status = await asyncio.to_thread(payment_manager.get_payment_status, invoice_id)
                 current_status = payment_status.get('status')
                 
                 logging.info(f"📊 Статус платежу {invoice_id}: {current_status}")
                 
                 if current_status == 'success':
-                    # Платіж успішний - оновлюємо статус
-                    logging.info(f"✅ Платіж {invoice_id} тепер успішний!")
-                    
-                    # Оновлюємо статус платежу в БД
-                    cursor.execute("""
-                        UPDATE subscription_payments 
-                        SET status = 'success', payment_date = datetime('now')
-                        WHERE id = ?
-                    """, (payment_db_id,))
-                    conn.commit()
-                    
-                    # Оновлюємо дату наступного платежу
-                    update_subscription_next_payment(subscription_id, months)
-                    track_link_purchase(user_id)
-
-                    ref_id = get_ref_id_by_user(user_id)
-                    if ref_id:
-                        add_partner_credit(
-                            partner_id=ref_id,
-                            buyer_id=user_id,
-                            purchase_amount=price,
-                            product_name=product_name,
-                            payment_type="subscription",
-                        )
-                        credit_amount = round(price * (get_partner_referral_percent() / 100), 1)
-                        if credit_amount > 0:
-                            buyer_username = get_username_by_id(user_id)
-                            buyer_line = f"@{buyer_username}" if (buyer_username and str(buyer_username).strip()) else f"користувач (ID: {user_id}, прихований профіль)"
-                            try:
-                                await bot.send_message(
-                                    ref_id,
-                                    get_partner_referral_purchase_text(buyer_line, product_name, price, credit_amount),
-                                    parse_mode="HTML",
-                                )
-                            except Exception:
-                                pass
-
-                    # Отримуємо дані про картку
-                    token_data = get_user_token(user_id)
-                    masked_card = token_data[2] if token_data else "**** **** **** ****"
-                    card_token = token_data[1] if token_data else None
-
-                    # Повідомляємо користувача та адміна
-                    await notify_user_payment_success(
-                        user_id=user_id,
-                        product_name=product_name,
-                        amount=price,
-                        months=months,
-                        invoice_id=invoice_id,
-                        masked_card=masked_card,
-                        card_token=card_token
-                    )
+                    await settle_recurring_charge(payment_db_id, subscription_id, user_id, invoice_id, product_name, months, price)
                     
                 elif current_status == 'failure':
-                    # Платіж невдалий - оновлюємо статус
                     logging.warning(f"❌ Платіж {invoice_id} невдалий")
-                    
                     failure_reason = payment_status.get('failureReason', 'Невідома помилка')
-                    
-                    cursor.execute("""
-                        UPDATE subscription_payments 
-                        SET status = 'failed', error_message = ?
-                        WHERE id = ?
-                    """, (failure_reason, payment_db_id))
-                    conn.commit()
-                    
-                    increment_payment_failures(subscription_id)
-                    
-                    token_data = get_user_token(user_id)
-                    masked_card = token_data[2] if token_data else "**** **** **** ****"
-                    card_token = token_data[1] if token_data else None
-                    
-                    await notify_user_payment_failed(
-                        user_id=user_id,
-                        product_name=product_name,
-                        masked_card=masked_card,
-                        invoice_id=invoice_id,
-                        card_token=card_token,
-                        failure_reason=failure_reason
-                    )
+                    await fail_recurring_charge(payment_db_id, subscription_id, user_id, invoice_id, product_name, failure_reason)
                     
                 elif current_status == 'expired':
-                    # Рахунок застарів
                     logging.warning(f"⏰ Рахунок {invoice_id} застарів")
-                    
-                    cursor.execute("""
-                        UPDATE subscription_payments 
-                        SET status = 'failed', error_message = 'Рахунок застарів'
-                        WHERE id = ?
-                    """, (payment_db_id,))
-                    conn.commit()
-                    
-                    increment_payment_failures(subscription_id)
+                    await fail_recurring_charge(payment_db_id, subscription_id, user_id, invoice_id, product_name, 'Рахунок застарів', notify=False)
                     
                 # Якщо все ще processing - залишаємо як є, перевіримо пізніше
                 
+            except ServiceUnavailable as e:
+                logging.warning(f"⏸ Перевірку processing платежів перервано: {e}")
+                break
             except Exception as e:
                 logging.error(f"❌ Помилка при перевірці платежу {invoice_id}: {e}")
                 continue
@@ -0,0 +1,89 @@
+import csv
+import io
+import logging
+import os
+import tempfile
+import zipfile
+from datetime import date
+
+from database.analytics_db import connect_analytics_reader
+from database.archive_db import HISTORY_TABLES, iter_history
+
+EXPORT_FORMATS = ("csv", "xlsx")
+# Ліміт Telegram на документ, який надсилає бот
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+EXPORT_FETCH_SIZE = 500
+
+
+def iter_export_rows(table: str, date_from: date, date_to: date):
+    """
+    Назви колонок, далі рядки таблиці за період — гарячі з аналітичної копії (довгий експорт не тримає
+    блокування основної бази) та з архіву. Власне з'єднання: генератор споживається в потоці експорту.
+    """
+    reader = connect_analytics_reader()
+    try:
+        yield from iter_history(table, date_from, date_to, reader, EXPORT_FETCH_SIZE)
+    finally:
+        reader.close()
+
+
+def _write_csv_zip(path: str, date_from: date, date_to: date) -> dict:
+    """Кожна таблиця — окремий CSV у ZIP; рядки пишуться в архів потоково, без буфера на весь файл."""
+    counts = {}
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for table in HISTORY_TABLES:
+            rows = iter_export_rows(table, date_from, date_to)
+            # utf-8-sig — щоб Excel одразу відкрив кирилицю
+            with archive.open(f"{table}.csv", "w") as raw, io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as text:
+                writer = csv.writer(text)
+                writer.writerow(next(rows))
+                count = 0
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            counts[table] = count
+    return counts
+
+
+def _write_xlsx(path: str, date_from: date, date_to: date) -> dict:
+    """Аркуш на таблицю; write_only-режим openpyxl скидає рядки на диск, а не тримає всю книгу в пам'яті."""
+    from openpyxl import Workbook
+
+    counts = {}
+    workbook = Workbook(write_only=True)
+    for table in HISTORY_TABLES:
+        sheet = workbook.create_sheet(title=table[:31])
+        rows = iter_export_rows(table, date_from, date_to)
+        sheet.append(next(rows))
+        count = 0
+        for row in rows:
+            sheet.append(row)
+            count += 1
+        counts[table] = count
+    workbook.save(path)
+    return counts
+
+
+def build_export(export_format: str, date_from: date, date_to: date) -> tuple[str, dict]:
+    """
+    Формує файл експорту у тимчасовій директорії; повертає (шлях, кількість рядків по таблицях).
+    Блокуюча функція — викликати через asyncio.to_thread; файл видаляє той, хто його надіслав.
+    """
+    suffix = ".xlsx" if export_format == "xlsx" else ".zip"
+    fd, path = tempfile.mkstemp(prefix="flixmarket_export_", suffix=suffix)
+    os.close(fd)
+    try:
+        if export_format == "xlsx":
+            counts = _write_xlsx(path, date_from, date_to)
+        else:
+            counts = _write_csv_zip(path, date_from, date_to)
+    except Exception:
+        os.remove(path)
+        raise
+    logging.info(f"Експорт {export_format} за {date_from}..{date_to}: {sum(counts.values())} рядків, {os.path.getsize(path)} байт")
+    return path, counts
+
+
+def export_file_name(export_format: str, date_from: date, date_to: date) -> str:
+    suffix = "xlsx" if export_format == "xlsx" else "zip"
+    return f"flixmarket_{date_from:%Y%m%d}_{date_to:%Y%m%d}.{suffix}"
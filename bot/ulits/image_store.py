@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from config import CONTENT_PRODUCTS_DIR
+from ulits.path_utils import resolve_media_path
+
+# Шлях, у якому фото товарів зберігаються в БД (його ж розбирає вебдодаток)
+PRODUCTS_PREFIX = "Content/products/"
+# Рендиції: варіант -> (найбільша сторона, якість JPEG). caption — фото в картці товару в боті, web — каталог у вебдодатку
+RENDITIONS = {
+    "caption": (1280, 85),
+    "web": (640, 80),
+}
+# Скільки секунд пам'ятати, що файлу немає (шлях з БД, якого не знайшли на диску)
+MISSING_TTL = 60
+
+_SIGNATURES = (
+    (b"\x89PNG", ".png"),
+    (b"RIFF", ".webp"),
+    (b"GIF8", ".gif"),
+)
+
+# Відносний шлях оригіналу -> {варіант: абсолютний шлях}; "original" є завжди
+_index: dict = {}
+_missing: dict = {}
+# Telegram file_id вже завантажених файлів: повторний показ картки не вивантажує фото знову
+_file_ids: dict = {}
+_pool: ProcessPoolExecutor = None
+_renditions_enabled = True
+_rendering: set = set()
+
+
+def _rendition_name(file_name: str, variant: str) -> str:
+    return f"{os.path.splitext(file_name)[0]}_{variant}.jpg"
+
+
+def _split_rendition(file_name: str):
+    for variant in RENDITIONS:
+        suffix = f"_{variant}.jpg"
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)], variant
+    return None, None
+
+
+def load_image_index():
+    """Один прохід по Content/products на старті: оригінали та їхні рендиції."""
+    _index.clear()
+    _missing.clear()
+    if not os.path.isdir(CONTENT_PRODUCTS_DIR):
+        return
+    renditions = []
+    with os.scandir(CONTENT_PRODUCTS_DIR) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            stem, variant = _split_rendition(entry.name)
+            if variant:
+                renditions.append((stem, variant, entry.path))
+            else:
+                _index[PRODUCTS_PREFIX + entry.name] = {"original": entry.path}
+    stems = {os.path.splitext(key)[0]: key for key in _index}
+    for stem, variant, path in renditions:
+        key = stems.get(PRODUCTS_PREFIX + stem)
+        if key:
+            _index[key][variant] = path
+    logging.info(f"Індекс фото товарів: {len(_index)} файлів")
+
+
+def _index_key(photo_path: str) -> str | None:
+    path = str(photo_path).strip().replace("\\", "/")
+    if path.startswith(PRODUCTS_PREFIX):
+        return path
+    if os.path.isabs(path) and os.path.dirname(path) == CONTENT_PRODUCTS_DIR.replace("\\", "/"):
+        return PRODUCTS_PREFIX + os.path.basename(path)
+    return None
+
+
+def resolve_product_image(photo_path: str | None, variant: str = "caption") -> str | None:
+    """Абсолютний шлях до рендиції (або оригіналу) з індексу; диск перевіряється лише для шляхів, яких індекс ще не бачив."""
+    if not photo_path or not str(photo_path).strip():
+        return None
+    key = _index_key(photo_path) or str(photo_path).strip()
+    entry = _index.get(key)
+    if entry is None:
+        missing_since = _missing.get(key)
+        if missing_since and time.monotonic() - missing_since < MISSING_TTL:
+            return None
+        # Файл міг з'явитися поза ботом (завантаження через вебадмінку) — одна перевірка і запам'ятовуємо
+        path = resolve_media_path(photo_path)
+        if not path or not os.path.isfile(path):
+            _missing[key] = time.monotonic()
+            return None
+        _missing.pop(key, None)
+        entry = _index[key] = {"original": path}
+        for name, rendition_path in _existing_renditions(path).items():
+            entry[name] = rendition_path
+        schedule_renditions(key)
+    return entry.get(variant) or entry["original"]
+
+
+def _existing_renditions(path: str) -> dict:
+    directory, file_name = os.path.split(path)
+    found = {}
+    for variant in RENDITIONS:
+        candidate = os.path.join(directory, _rendition_name(file_name, variant))
+        if os.path.isfile(candidate):
+            found[variant] = candidate
+    return found
+
+
+def get_cached_file_id(path: str) -> str | None:
+    return _file_ids.get(path)
+
+
+def remember_file_id(path: str, file_id: str):
+    if path and file_id:
+        _file_ids[path] = file_id
+
+
+def _detect_extension(data: bytes) -> str:
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return ".jpg"
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+async def store_product_image(bot, file_id: str) -> str:
+    """
+    Завантажує фото з Telegram і зберігає під іменем за SHA-256 вмісту: однакові фото — один файл.
+    Повертає відносний шлях для БД; рендиції будуються у фоновому процесі.
+    """
+    buffer = await bot.download(file_id, destination=BytesIO())
+    data = buffer.getvalue()
+    file_name = hashlib.sha256(data).hexdigest()[:32] + _detect_extension(data)
+    key = PRODUCTS_PREFIX + file_name
+    if key not in _index:
+        path = os.path.join(CONTENT_PRODUCTS_DIR, file_name)
+        if not os.path.isfile(path):
+            await asyncio.to_thread(_write_atomic, path, data)
+        else:
+            logging.info(f"Фото {file_name} вже є у сховищі")
+        _index[key] = {"original": path}
+        _missing.pop(key, None)
+    schedule_renditions(key)
+    return key
+
+
+def _render(source: str, targets: list) -> dict:
+    """Виконується в окремому процесі: масштабує оригінал у рендиції (без збільшення), JPEG."""
+    from PIL import Image, ImageOps
+
+    written = {}
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        for variant, destination, max_side, quality in targets:
+            copy = image.copy()
+            copy.thumbnail((max_side, max_side), Image.LANCZOS)
+            temp_path = f"{destination}.{os.getpid()}.tmp"
+            copy.save(temp_path, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(temp_path, destination)
+            written[variant] = destination
+    return written
+
+
+def schedule_renditions(key: str):
+    """Ставить у фоновий процес побудову рендицій, яких ще немає для цього оригіналу."""
+    entry = _index.get(key)
+    if not _renditions_enabled or not entry or key in _rendering:
+        return
+    source = entry["original"]
+    directory, file_name = os.path.split(source)
+    targets = [
+        (variant, os.path.join(directory, _rendition_name(file_name, variant)), max_side, quality)
+        for variant, (max_side, quality) in RENDITIONS.items()
+        if variant not in entry
+    ]
+    if not targets:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    _rendering.add(key)
+    loop.create_task(_build_renditions(key, source, targets))
+
+
+async def _build_renditions(key: str, source: str, targets: list):
+    global _pool, _renditions_enabled
+    try:
+        if not _renditions_enabled:
+            return
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=1)
+        written = await asyncio.get_running_loop().run_in_executor(_pool, _render, source, targets)
+    except ImportError:
+        if _renditions_enabled:
+            logging.warning("Pillow не встановлено — рендиції фото вимкнено, використовуються оригінали")
+        _renditions_enabled = False
+        return
+    except Exception as e:
+        logging.error(f"Не вдалося побудувати рендиції для {source}: {e}")
+        return
+    finally:
+        _rendering.discard(key)
+    entry = _index.get(key)
+    if entry is not None:
+        entry.update(written)
+
+
+def schedule_missing_renditions():
+    """Ставить у чергу відсутні рендиції для всіх фото з індексу (після load_image_index на старті)."""
+    for key in list(_index):
+        schedule_renditions(key)
+
+
+def shutdown_image_store():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import logging
+
+from database.leases_db import acquire_lease, renew_lease, release_lease
+
+# Задачі, що зараз виконуються в цьому процесі
+_running = set()
+
+
+def leased_job(name: str, ttl: int = 120, cooldown: int = 0):
+    """
+    Обгортка фонової задачі: не більше одного запуску в процесі (single-flight) і серед
+    усіх інстансів бота (оренда в job_leases з heartbeat). Запуск без оренди пропускається.
+    cooldown тримає оренду після завершення, щоб інстанси з іншим зсувом розкладу не повторили роботу;
+    run_now() (ручний запуск з адмінки) охолодження ігнорує.
+    """
+    def decorator(func):
+        async def run(force: bool, args, kwargs):
+            if name in _running:
+                logging.info(f"Задача {name} ще виконується — пропускаємо запуск")
+                return None
+            _running.add(name)
+            try:
+                if not acquire_lease(name, ttl, force=force):
+                    logging.info(f"Задача {name} виконується або нещодавно виконана іншим інстансом — пропускаємо запуск")
+                    return None
+                heartbeat = asyncio.create_task(_keep_lease(name, ttl))
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    heartbeat.cancel()
+                    release_lease(name, cooldown)
+            finally:
+                _running.discard(name)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await run(False, args, kwargs)
+
+        async def run_now(*args, **kwargs):
+            return await run(True, args, kwargs)
+
+        wrapper.run_now = run_now
+        return wrapper
+    return decorator
+
+
+async def _keep_lease(name: str, ttl: int):
+    while True:
+        await asyncio.sleep(max(1, ttl // 3))
+        if not renew_lease(name, ttl):
+            logging.error(f"Оренду задачі {name} втрачено — можливий паралельний запуск на іншому інстансі")
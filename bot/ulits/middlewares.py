@@ -0,0 +1,150 @@
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import logging
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update, User
+
+# Відро токенів на користувача: до THROTTLE_BURST апдейтів поспіль, далі THROTTLE_RATE на секунду
+THROTTLE_RATE = 2
+THROTTLE_BURST = 12
+# Повторне натискання тієї ж кнопки на тому ж повідомленні в межах вікна зливається з першим
+CALLBACK_DEDUPE_WINDOW = 1.5
+THROTTLE_SWEEP_INTERVAL = 60
+# Готові тексти відповідей: відкинутий callback закривається одразу, без звернень до БД
+THROTTLED_TOAST = "⏳ Забагато натискань, зачекайте секунду"
+DUPLICATE_TOAST = "⏳ Вже обробляється..."
+
+# Лічильники з моменту запуску процесу (показуються в адмінській статистиці)
+throttle_counters = Counter()
+
+
+class _UserLock:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Скільки апдейтів користувача тримають або чекають замок
+        self.holders = 0
+
+
+class UserSerializationMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update: апдейти одного користувача виконуються по черзі в порядку надходження
+    (подвійний тап не спише баланс двічі), апдейти різних користувачів — паралельно.
+    Замок живе, поки його тримає або чекає хоча б один апдейт, тож словник не росте з кількістю користувачів.
+    """
+
+    def __init__(self):
+        self._locks: Dict[int, _UserLock] = {}
+
+    @property
+    def active_users(self) -> int:
+        return len(self._locks)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = _UserLock()
+        entry.holders += 1
+        try:
+            async with entry.lock:
+                return await handler(event, data)
+        finally:
+            entry.holders -= 1
+            if not entry.holders:
+                del self._locks[user.id]
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer-middleware на dp.update (реєструється перед UserSerializationMiddleware, щоб зайві апдейти
+    відкидались одразу, а не чекали в черзі користувача): дублікати callback і потік понад відро токенів.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST,
+                 dedupe_window: float = CALLBACK_DEDUPE_WINDOW, exempt_user_ids=()):
+        self.rate = rate
+        self.burst = burst
+        self.dedupe_window = dedupe_window
+        self.exempt_user_ids = set(exempt_user_ids)
+        # user_id -> [токени, час останнього поповнення]
+        self._buckets: Dict[int, list] = {}
+        # (user_id, data, message_id) -> час прийнятого натискання
+        self._recent_callbacks: Dict[tuple, float] = {}
+        self._next_sweep = 0.0
+
+    def _take_token(self, user_id: int, now: float) -> bool:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            self._buckets[user_id] = [self.burst - 1, now]
+            return True
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+    def _sweep(self, now: float):
+        # Повне відро нічим не відрізняється від відсутнього — такі записи прибираємо
+        refill_time = self.burst / self.rate
+        self._buckets = {user_id: bucket for user_id, bucket in self._buckets.items() if now - bucket[1] < refill_time}
+        self._recent_callbacks = {
+            key: accepted_at for key, accepted_at in self._recent_callbacks.items()
+            if now - accepted_at < self.dedupe_window
+        }
+        self._next_sweep = now + THROTTLE_SWEEP_INTERVAL
+
+    async def _drop_callback(self, update: Update, counter: str, toast: str):
+        throttle_counters[counter] += 1
+        try:
+            await update.callback_query.answer(toast)
+        except TelegramAPIError as e:
+            logging.debug(f"Не вдалося відповісти на відкинутий callback: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+        if user is None or user.id in self.exempt_user_ids or not isinstance(event, Update):
+            return await handler(event, data)
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        callback = event.callback_query
+        if callback is not None:
+            key = (user.id, callback.data, callback.message.message_id if callback.message else None)
+            accepted_at = self._recent_callbacks.get(key)
+            if accepted_at is not None and now - accepted_at < self.dedupe_window:
+                await self._drop_callback(event, "duplicate_callbacks", DUPLICATE_TOAST)
+                return None
+
+        if not self._take_token(user.id, now):
+            if callback is not None:
+                await self._drop_callback(event, "throttled_callbacks", THROTTLED_TOAST)
+            else:
+                throttle_counters["throttled_updates"] += 1
+            return None
+
+        if callback is not None:
+            self._recent_callbacks[key] = now
+        return await handler(event, data)
@@ -6,18 +6,42 @@ import requests
 from typing import Tuple
 from database.client_db import (
     update_payment_status,
+    claim_payment_success,
     get_pending_payments,
     add_subscription,
     get_product_by_id,
     get_product_type,
     cursor,
-    conn,
     get_username_by_id,
     get_ref_id_by_user,
     add_partner_credit,
     get_partner_referral_percent,
+    save_payment_info,
+    save_payment_temp_data,
+    find_reusable_payment,
+    get_superseded_payments,
+    get_due_pending_payments,
+    schedule_payment_check,
+    save_user_token,
+    create_recurring_subscription,
+    transaction,
 )
+from database.outbox_db import enqueue_outbox, mark_outbox_sent
 from database.links_db import track_link_purchase
+from ulits.profile_cache import invalidate_profile
+from ulits.job_locks import leased_job
+from ulits.outbox import outbox_handler, OutboxRetry, enqueue_message, message_payload, wake_outbox
+from ulits.admin_digest import admin_event, digest_line
+from ulits.resilience import (
+    ResilientHTTP,
+    CircuitBreaker,
+    RetryPolicy,
+    ServiceUnavailable,
+    ERROR_CONNECT,
+    ERROR_TIMEOUT,
+    ERROR_THROTTLED,
+    ERROR_SERVER,
+)
 from main import bot
 from config import admin_chat_id, XTOKEN
 from keyboards.client_keyboards import get_channel_keyboard, get_manager_keyboard
@@ -34,14 +58,30 @@ from Content.texts import (
 )
 import logging
 import sqlite3
+import time
 import uuid
 
 
+# Спільний для всіх PaymentManager захист викликів Monobank: до 8 паралельних запитів,
+# запобіжник після 5 збоїв поспіль на 60 с, повтори лише тимчасових помилок
+monobank_http = ResilientHTTP(
+    "Monobank",
+    breaker=CircuitBreaker("monobank", failure_threshold=5, recovery_timeout=60),
+    retry=RetryPolicy({ERROR_CONNECT: 3, ERROR_TIMEOUT: 2, ERROR_THROTTLED: 3, ERROR_SERVER: 2}),
+    max_concurrency=8,
+    timeout=(5, 20),
+)
+
+
 class PaymentManager:
     def __init__(self):
         self.token = XTOKEN  # Заміни на реальний токен
         self.host = "https://api.monobank.ua/"
 
+    def _request(self, method: str, path: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """Запит до Monobank через спільний запобіжник; при недоступності кидає ServiceUnavailable"""
+        return monobank_http.request(method, f"{self.host}{path}", idempotent=idempotent, **kwargs)
+
     def create_payment(self, user_id: int, product_name: str, months: int, price: float) -> tuple[str, str, str]:
         local_payment_id = f"order_{user_id}_{int(datetime.now().timestamp())}"
         
@@ -67,7 +107,7 @@ class PaymentManager:
         }
         
         headers = {"X-Token": self.token, "Content-Type": "application/json"}
-        response = requests.post(f"{self.host}api/merchant/invoice/create", json=payload, headers=headers)
+        response = self._request("POST", "api/merchant/invoice/create", idempotent=False, json=payload, headers=headers)
         
         if response.status_code == 200:
             result = response.json()
@@ -122,7 +162,7 @@ class PaymentManager:
         headers = {"X-Token": self.token, "Content-Type": "application/json"}
         logging.info(f"Створення платежу з токенізацією. Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
         
-        response = requests.post(f"{self.host}api/merchant/invoice/create", json=payload, headers=headers)
+        response = self._request("POST", "api/merchant/invoice/create", idempotent=False, json=payload, headers=headers)
         
         logging.info(f"Статус відповіді створення платежу: {response.status_code}")
         logging.info(f"Заголовки відповіді: {dict(response.headers)}")
@@ -179,7 +219,7 @@ class PaymentManager:
         headers = {"X-Token": self.token, "Content-Type": "application/json"}
         logging.info(f"Створення токен-платежу. Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
         
-        response = requests.post(f"{self.host}api/merchant/wallet/payment", json=payload, headers=headers)
+        response = self._request("POST", "api/merchant/wallet/payment", idempotent=False, json=payload, headers=headers)
         
         logging.info(f"Статус відповіді токен-платежу: {response.status_code}")
         
@@ -195,7 +235,7 @@ class PaymentManager:
     def get_payment_status(self, invoice_id: str) -> dict:
         """Отримує статус платежу по invoice_id"""
         headers = {"X-Token": self.token}
-        response = requests.get(f"{self.host}api/merchant/invoice/status?invoiceId={invoice_id}", headers=headers)
+        response = self._request("GET", "api/merchant/invoice/status", params={"invoiceId": invoice_id}, headers=headers)
         
         logging.info(f"Запит статусу платежу {invoice_id}: {response.status_code}")
         
@@ -208,17 +248,35 @@ class PaymentManager:
             raise Exception(f"Помилка отримання статусу: {response.text}")
 
     def cancel_payment(self, invoice_id: str) -> bool:
-        """Скасовує платіж"""
+        """Скасовує неоплачений рахунок (invalidation: invoice/remove — invoice/cancel працює лише для оплачених)"""
         payload = {"invoiceId": invoice_id}
         headers = {"X-Token": self.token, "Content-Type": "application/json"}
-        response = requests.post(f"{self.host}api/merchant/invoice/cancel", json=payload, headers=headers)
+        response = self._request("POST", "api/merchant/invoice/remove", json=payload, headers=headers)
         
+        if response.status_code != 200:
+            logging.warning(f"Не вдалося скасувати рахунок {invoice_id}: {response.status_code} - {response.text}")
         return response.status_code == 200
         
+    def get_statement(self, from_ts: int, to_ts: int = None) -> list:
+        """Виписка мерчанта за період (unix-час): список операцій з invoiceId, status, amount"""
+        headers = {"X-Token": self.token}
+        params = {"from": int(from_ts)}
+        if to_ts is not None:
+            params["to"] = int(to_ts)
+        response = self._request("GET", "api/merchant/statement", params=params, headers=headers)
+        
+        logging.info(f"Запит виписки {params}: {response.status_code}")
+        
+        if response.status_code == 200:
+            return response.json().get("list", [])
+        else:
+            logging.error(f"Помилка отримання виписки: {response.status_code} - {response.text}")
+            raise Exception(f"Помилка отримання виписки: {response.text}")
+
     def get_wallet_info(self, wallet_id: str) -> dict:
         """Отримує інформацію про wallet, включаючи токени карток"""
         headers = {"X-Token": self.token}
-        response = requests.get(f"{self.host}api/merchant/wallet", headers=headers)
+        response = self._request("GET", "api/merchant/wallet", headers=headers)
         
         logging.info(f"Запит інформації про wallet: {response.status_code}")
         
@@ -233,8 +291,7 @@ class PaymentManager:
     def get_wallet_by_id(self, wallet_id: str) -> dict:
         """Отримує інформацію про конкретний wallet по ID"""
         headers = {"X-Token": self.token}
-        url = f"{self.host}api/merchant/wallet/{wallet_id}"
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", f"api/merchant/wallet/{wallet_id}", headers=headers)
         
         logging.info(f"Запит wallet по ID {wallet_id}: {response.status_code}")
         
@@ -246,11 +303,13 @@ class PaymentManager:
             logging.error(f"Помилка отримання wallet {wallet_id}: {response.status_code} - {response.text}")
             return {}
 
-    def get_wallet_cards(self, wallet_id: str) -> list:
-        """Отримує список збережених карток для конкретного wallet"""
+    def get_wallet_cards(self, wallet_id: str, strict: bool = False) -> list:
+        """
+        Отримує список збережених карток для конкретного wallet.
+        strict — на відповідь не 200 повертає None замість порожнього списку (помилку API не сплутати з порожнім wallet).
+        """
         headers = {"X-Token": self.token}
-        url = f"{self.host}api/merchant/wallet/{wallet_id}/cards"
-        response = requests.get(url, headers=headers)
+        response = self._request("GET", f"api/merchant/wallet/{wallet_id}/cards", headers=headers)
         
         logging.info(f"Запит карток для wallet {wallet_id}: {response.status_code}")
         
@@ -260,33 +319,367 @@ class PaymentManager:
             return result
         else:
             logging.error(f"Помилка отримання карток для wallet {wallet_id}: {response.status_code} - {response.text}")
-            return []
-        
-        
-        
+            return None if strict else []
+
+
+
+# Термін дії рахунків: звичайний — стандартні 24 год Monobank, з токенізацією — validity 3600
+INVOICE_VALIDITY_SECONDS = 24 * 3600
+TOKENIZED_INVOICE_VALIDITY_SECONDS = 3600
+
+# Посилання на фонові задачі скасування, щоб їх не прибрав збирач сміття
+_background_tasks = set()
+
+
+async def get_or_create_invoice(payment_manager: PaymentManager, user_id: int, product_id: int, product_name: str,
+                                months: int, price: float, payment_type: str, tokenize: bool = False) -> tuple[str, str, str]:
+    """
+    Повертає (local_payment_id, invoice_id, payment_url): ще дійсний pending-рахунок на той самий
+    тариф або новий. Після створення нового — інші pending-рахунки на цей товар скасовуються.
+    """
+    existing = find_reusable_payment(user_id, product_id, months, price, payment_type)
+    if existing:
+        logging.info(f"Повторно використовуємо рахунок {existing[1]} для користувача {user_id}")
+        return existing
+
+    if tokenize:
+        local_payment_id, invoice_id, payment_url, wallet_id = await asyncio.to_thread(
+            payment_manager.create_payment_with_tokenization,
+            user_id=user_id, product_name=product_name, months=months, price=price,
+        )
+        save_payment_temp_data(invoice_id, wallet_id, payment_type, local_payment_id)
+        validity = TOKENIZED_INVOICE_VALIDITY_SECONDS
+    else:
+        local_payment_id, invoice_id, payment_url = await asyncio.to_thread(
+            payment_manager.create_payment,
+            user_id=user_id, product_name=product_name, months=months, price=price,
+        )
+        validity = INVOICE_VALIDITY_SECONDS
+
+    save_payment_info(
+        payment_id=local_payment_id,
+        invoice_id=invoice_id,
+        user_id=user_id,
+        product_id=product_id,
+        months=months,
+        amount=price,
+        status="pending",
+        payment_type=payment_type,
+        page_url=payment_url,
+        validity_seconds=validity,
+    )
+
+    superseded = get_superseded_payments(user_id, product_id, invoice_id)
+    if superseded:
+        task = asyncio.create_task(cancel_superseded_invoices(payment_manager, superseded))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return local_payment_id, invoice_id, payment_url
+
+
+async def cancel_superseded_invoices(payment_manager: PaymentManager, invoice_ids: list):
+    """Скасовує замінені рахунки у Monobank; локальний статус змінюється лише після успіху."""
+    for invoice_id in invoice_ids:
+        try:
+            if await asyncio.to_thread(payment_manager.cancel_payment, invoice_id):
+                update_payment_status(invoice_id, "cancelled")
+                logging.info(f"Рахунок {invoice_id} скасовано як замінений")
+        except Exception as e:
+            logging.error(f"Помилка при скасуванні рахунку {invoice_id}: {e}")
+
+
+
+async def settle_successful_payment(payment_manager: PaymentManager, invoice_id: str, user_id: int, product_id: int,
+                                    months: int, amount: float, payment_type: str, payment_data: dict) -> bool:
+    """
+    Проводить успішну оплату однією транзакцією: статус, доступ, партнерське нарахування і черга повідомлень.
+    Доставку повідомлень і подальші дії виконує диспетчер outbox. Повторний виклик нічого не робить.
+    """
+    logging.info(f"Платіж {invoice_id} успішний. Оновлення статусу")
+    username = get_username_by_id(user_id)
+    product = get_product_by_id(product_id)
+    product_name = product[0] if product else ""
+    ref_id = get_ref_id_by_user(user_id)
+    ref_username = get_username_by_id(ref_id) if ref_id else None
+    ref_credit = round(amount * (get_partner_referral_percent() / 100), 1) if ref_id else 0
+
+    with transaction():
+        if not claim_payment_success(invoice_id):
+            logging.info(f"Платіж {invoice_id} уже оброблено")
+            return False
+
+        enqueue_outbox("link_purchase", {"user_id": user_id, "amount": amount}, dedupe_key=f"{invoice_id}:link_purchase")
+
+        if ref_id:
+            credit_amount = add_partner_credit(
+                partner_id=ref_id,
+                buyer_id=user_id,
+                purchase_amount=amount,
+                product_name=product_name,
+                payment_type=payment_type,
+                source_ref=invoice_id,
+            )
+            if credit_amount > 0:
+                buyer_line = f"@{username}" if (username and str(username).strip()) else f"користувач (ID: {user_id}, прихований профіль)"
+                enqueue_message(
+                    ref_id,
+                    get_partner_referral_purchase_text(buyer_line, product_name, amount, credit_amount),
+                    dedupe_key=f"{invoice_id}:partner",
+                )
+
+        if not product:
+            logging.error(f"Продукт {product_id} не знайдено")
+        elif payment_type == "subscription":
+            logging.info(f"Обробка підписки для платежу {invoice_id}")
+            cursor.execute("SELECT payment_id FROM payments WHERE invoice_id = ?", (invoice_id,))
+            payment_result = cursor.fetchone()
+            if not payment_result:
+                logging.error(f"Не знайдено payment_id для invoice_id: {invoice_id}")
+            else:
+                payment_id = payment_result[0]
+                cursor.execute("SELECT wallet_id FROM payments_temp_data WHERE local_payment_id = ?", (payment_id,))
+                temp_data = cursor.fetchone()
+
+                wallet_id = temp_data[0] if temp_data else None
+                if not wallet_id and isinstance(payment_data.get("walletData"), dict):
+                    wallet_id = payment_data["walletData"].get("walletId")
+                if not wallet_id:
+                    wallet_id = f"wallet_{user_id}_{uuid.uuid4().hex[:8]}"
+                    if not temp_data:
+                        logging.warning(f"Тимчасових даних немає для платежу {payment_id}, використовуємо wallet_id: {wallet_id}")
+
+                # Токен картки може з'явитися в Monobank із затримкою — його чекає обробник черги, а не перевірка платежів
+                enqueue_outbox("activate_subscription", {
+                    "invoice_id": invoice_id,
+                    "payment_id": payment_id,
+                    "user_id": user_id,
+                    "product_id": product_id,
+                    "product_name": product_name,
+                    "months": months,
+                    "amount": amount,
+                    "wallet_id": wallet_id,
+                    "username": username,
+                    "ref_id": ref_id,
+                    "ref_username": ref_username,
+                    "ref_credit": ref_credit,
+                    "payment_data": {key: payment_data.get(key) for key in ("walletData", "paymentInfo") if payment_data.get(key)},
+                }, dedupe_key=f"{invoice_id}:activate")
+        else:
+            # Звичайна одноразова оплата
+            logging.info(f"Обробка одноразової оплати для платежу {invoice_id}")
+            start_date = datetime.now()
+            end_date = start_date + timedelta(days=30 * months)
+            if not add_subscription(
+                user_id=user_id,
+                product_type=get_product_type(product_id),
+                product_id=product_id,
+                product_name=product_name,
+                price=amount,
+                start_date=start_date.strftime("%Y-%m-%d"),
+                end_date=end_date.strftime("%Y-%m-%d"),
+                status="active"
+            ):
+                raise sqlite3.Error(f"Не вдалося видати доступ за платежем {invoice_id}")
+
+            enqueue_message(
+                user_id,
+                get_user_one_time_success_text(product_name, months, amount),
+                dedupe_key=f"{invoice_id}:user_success",
+                reply_markup=get_channel_keyboard(),
+            )
+            admin_text = get_admin_new_one_time_text(
+                invoice_id, user_id, username, product_name, amount, months,
+                end_date.strftime('%d.%m.%Y'), ref_id, ref_username, ref_credit
+            )
+            admin_event(
+                "new_one_time",
+                admin_text,
+                digest_line(user_id, username, product_name, f"{amount} ₴", f"{months} міс."),
+                amount,
+                dedupe_key=f"{invoice_id}:admin",
+                reply_markup=get_contact_user_keyboard(user_id),
+                fallback=[
+                    message_payload(admin_chat_id, admin_text),
+                    message_payload(user_id, get_user_contact_manager_text(invoice_id), reply_markup=get_manager_keyboard()),
+                ],
+            )
+
+    invalidate_profile(user_id)
+    wake_outbox()
+    logging.info(f"Платіж {invoice_id} оброблено успішно")
+    return True
+
+
+def get_contact_user_keyboard(user_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="👤 Написати користувачу", url=f"tg://user?id={user_id}")],
+    ])
+
+
+@outbox_handler("link_purchase")
+async def _track_link_purchase(payload: dict, attempts: int, outbox_id: int):
+    track_link_purchase(payload["user_id"], payload.get("amount", 0))
+
+
+# Скільки разів і з яким інтервалом чекаємо на токен картки після оплати підписки
+TOKEN_ATTEMPTS = 3
+TOKEN_RETRY_DELAY = 15
+
+
+def _find_card_token(payment_data: dict) -> Tuple[str, str, str]:
+    """Токен, маскований номер і тип картки з відповіді статусу рахунку."""
+    card_token = None
+    masked_card = "**** **** **** 1234"
+    card_type = "unknown"
+    wallet_data = payment_data.get("walletData")
+    if isinstance(wallet_data, dict):
+        card_token = wallet_data.get("cardToken")
+    payment_info = payment_data.get("paymentInfo")
+    if isinstance(payment_info, dict):
+        masked_card = payment_info.get("maskedPan", masked_card)
+        card_type = payment_info.get("paymentSystem", card_type)
+    return card_token, masked_card, card_type
+
+
+@outbox_handler("activate_subscription")
+async def activate_paid_subscription(payload: dict, attempts: int, outbox_id: int):
+    """Зберігає токен картки і створює повторювану підписку за оплаченим рахунком."""
+    invoice_id = payload["invoice_id"]
+    user_id = payload["user_id"]
+    product_name = payload["product_name"]
+    months = payload["months"]
+    amount = payload["amount"]
+    wallet_id = payload["wallet_id"]
+    payment_manager = PaymentManager()
+
+    payment_data = payload.get("payment_data") or {}
+    if attempts > 1:
+        logging.info(f"Повторна спроба {attempts}/{TOKEN_ATTEMPTS} отримати токен для {invoice_id}")
+        try:
+            payment_data = await asyncio.to_thread(payment_manager.get_payment_status, invoice_id)
+        except ServiceUnavailable as e:
+            raise OutboxRetry(max(TOKEN_RETRY_DELAY, e.retry_after), str(e))
+
+    card_token, masked_card, card_type = _find_card_token(payment_data)
+    if card_token:
+        logging.info(f"✅ Токен картки знайдено в walletData на спробі {attempts}")
+    else:
+        try:
+            wallet_cards = await asyncio.to_thread(payment_manager.get_wallet_cards, wallet_id)
+            if wallet_cards:
+                card_token = wallet_cards[-1].get("cardToken") or wallet_cards[-1].get("token")
+                if card_token:
+                    logging.info(f"✅ Токен картки отримано з wallet API на спробі {attempts}")
+        except Exception as e:
+            logging.warning(f"Wallet API на спробі {attempts}: {e}")
+
+    if not card_token:
+        if attempts < TOKEN_ATTEMPTS:
+            raise OutboxRetry(TOKEN_RETRY_DELAY, f"токен картки не знайдено, спроба {attempts}/{TOKEN_ATTEMPTS}")
+        logging.error("❌ Токен картки не знайдено після всіх спроб. Повідомляємо користувача.")
+        enqueue_message(
+            user_id,
+            get_user_subscription_token_not_found_text(product_name, months, amount),
+            dedupe_key=f"{invoice_id}:token_not_found",
+        )
+        wake_outbox()
+        return
+
+    logging.info(f"💳 Дані картки: token=..., masked={masked_card}, type={card_type}")
+    card_info = f"{get_premium_emoji('card')} <b>Картка:</b> {masked_card}"
+    if card_type != "unknown":
+        card_info += f" ({card_type.upper()})"
+    admin_text = get_admin_new_subscription_text(
+        payload["payment_id"], user_id, payload["username"], product_name, amount, months,
+        payload["ref_id"], payload["ref_username"], payload["ref_credit"]
+    )
+
+    with transaction():
+        if not save_user_token(user_id, wallet_id, card_token, masked_card, card_type) or not create_recurring_subscription(
+            user_id=user_id,
+            product_id=payload["product_id"],
+            product_name=product_name,
+            months=months,
+            price=amount,
+            wallet_id=wallet_id
+        ):
+            raise sqlite3.Error(f"Не вдалося створити підписку за платежем {invoice_id}")
+        cursor.execute("DELETE FROM payments_temp_data WHERE local_payment_id = ?", (payload["payment_id"],))
+        enqueue_message(
+            user_id,
+            get_user_subscription_success_text(product_name, months, amount, card_info=card_info),
+            dedupe_key=f"{invoice_id}:user_success",
+            reply_markup=get_channel_keyboard(),
+        )
+        admin_event(
+            "new_subscription",
+            admin_text,
+            digest_line(user_id, payload["username"], product_name, f"{amount} ₴", f"{months} міс."),
+            amount,
+            dedupe_key=f"{invoice_id}:admin",
+            reply_markup=get_contact_user_keyboard(user_id),
+            fallback=[message_payload(admin_chat_id, admin_text)],
+        )
+        # Запис закривається в тій самій транзакції, тож повтор після збою не створить другу підписку
+        mark_outbox_sent(outbox_id)
+
+    invalidate_profile(user_id)
+    wake_outbox()
+
+
+# Адаптивний розклад перевірок: свіжі рахунки — часто, покинуті — дедалі рідше
+PAYMENT_CHECK_MIN_DELAY = 10
+PAYMENT_CHECK_AGE_CAPS = (
+    (10 * 60, 30),        # перші 10 хв — не рідше ніж раз на 30 с
+)
+# Старші рахунки закриває звірка з випискою (ulits/reconciliation.py), поштучно — лише страховка раз на годину
+PAYMENT_CHECK_MAX_DELAY = 60 * 60
+PENDING_PAYMENT_TTL = 24 * 3600
+# Статуси, коли користувач уже на сторінці оплати — перевіряємо якнайчастіше
+ACTIVE_INVOICE_STATUSES = ("processing", "hold")
+# Фінальні статуси Monobank, після яких рахунок більше не опитується
+FINAL_INVOICE_STATUSES = {"expired": "expired", "failure": "failed", "reversed": "reversed"}
+
+
+def get_next_payment_check_delay(age_seconds: int, check_count: int, last_status: str) -> int:
+    """Експоненційна затримка до наступної перевірки з обмеженням за віком рахунку."""
+    if last_status in ACTIVE_INVOICE_STATUSES:
+        return PAYMENT_CHECK_MIN_DELAY
+    cap = PAYMENT_CHECK_MAX_DELAY
+    for max_age, age_cap in PAYMENT_CHECK_AGE_CAPS:
+        if age_seconds < max_age:
+            cap = age_cap
+            break
+    return min(cap, PAYMENT_CHECK_MIN_DELAY * 2 ** min(check_count or 0, 12))
+
+
+@leased_job("check_pending_payments", ttl=60)
 async def check_pending_payments():
     payment_manager = PaymentManager()
     
-    pending_payments = get_pending_payments()
+    if monobank_http.breaker.is_open:
+        logging.warning("Monobank недоступний — перевірку pending-платежів відкладено")
+        return
+
+    now_ts = int(time.time())
+    pending_payments = get_due_pending_payments(now_ts)
     
-    logging.info(f"Знайдено {len(pending_payments)} платежів у базі для перевірки")
-    if not pending_payments:
-        logging.warning("Список pending_payments порожній. Перевірте базу даних")
+    if pending_payments:
+        logging.info(f"До перевірки {len(pending_payments)} pending-платежів")
 
     for payment in pending_payments:
-        invoice_id, user_id, product_id, months, amount, payment_type = payment
+        invoice_id, user_id, product_id, months, amount, payment_type, created_ts, check_count = payment
+        age_seconds = max(0, now_ts - (created_ts or now_ts))
         logging.info(f"Перевірка платежу з БД: {invoice_id} (користувач: {user_id}, тип: {payment_type})")
+        last_status = "error"
         
         headers = {"X-Token": payment_manager.token}
-        url = f"{payment_manager.host}api/merchant/invoice/status?invoiceId={invoice_id}"
         try:
-            response = requests.get(
-                f"{payment_manager.host}api/merchant/invoice/status?invoiceId={invoice_id}",
-                headers=headers
+            response = await asyncio.to_thread(
+                payment_manager._request, "GET", "api/merchant/invoice/status",
+                params={"invoiceId": invoice_id}, headers=headers,
             )
 
-            print(response.json())
-            
             if response.status_code == 200:
                 payment_data = response.json()
                 status = payment_data.get("status", "невідомо")
@@ -294,245 +687,32 @@ async def check_pending_payments():
                 logging.info(f"Дані платежу від Monobank: {payment_data}")
                 
                 if status == "success":
-                    logging.info(f"Платіж {invoice_id} успішний. Оновлення статусу")
-                    
-                    username = get_username_by_id(user_id)
-                    update_payment_status(invoice_id, "success")
-                    track_link_purchase(user_id)
-
-                    product = get_product_by_id(product_id)
-                    product_name_for_partner = product[0] if product else ""
-                    ref_id = get_ref_id_by_user(user_id)
-                    if ref_id:
-                        add_partner_credit(
-                            partner_id=ref_id,
-                            buyer_id=user_id,
-                            purchase_amount=amount,
-                            product_name=product_name_for_partner,
-                            payment_type=payment_type,
-                        )
-                        percent = get_partner_referral_percent()
-                        credit_amount = round(amount * (percent / 100), 1)
-                        if credit_amount > 0:
-                            buyer_username = get_username_by_id(user_id)
-                            buyer_line = f"@{buyer_username}" if (buyer_username and str(buyer_username).strip()) else f"користувач (ID: {user_id}, прихований профіль)"
-                            try:
-                                await bot.send_message(
-                                    ref_id,
-                                    get_partner_referral_purchase_text(buyer_line, product_name_for_partner, amount, credit_amount),
-                                    parse_mode="HTML",
-                                )
-                            except Exception:
-                                pass
-
-                    if payment_type == "subscription":
-                        logging.info(f"Обробка підписки для платежу {invoice_id}")
-                        
-                        cursor.execute("SELECT payment_id FROM payments WHERE invoice_id = ?", (invoice_id,))
-                        payment_result = cursor.fetchone()
-                        if not payment_result:
-                            logging.error(f"Не знайдено payment_id для invoice_id: {invoice_id}")
-                            continue
-                        
-                        payment_id = payment_result[0]
-                        
-                        product = get_product_by_id(product_id)
-                        if not product:
-                            logging.error(f"Продукт {product_id} не знайдено")
-                            continue
-                        
-                        product_name, description, _, photo_path = product
-                        
-                        cursor.execute("SELECT wallet_id FROM payments_temp_data WHERE local_payment_id = ?", (payment_id,))
-                        temp_data = cursor.fetchone()
-                        
-                        wallet_id = temp_data[0] if temp_data else None
-                        if not wallet_id and "walletData" in payment_data and isinstance(payment_data.get("walletData"), dict):
-                            wallet_id = payment_data["walletData"].get("walletId")
-                        if not wallet_id:
-                            wallet_id = f"wallet_{user_id}_{uuid.uuid4().hex[:8]}"
-                            if not temp_data:
-                                logging.warning(f"Тимчасових даних немає для платежу {payment_id}, використовуємо wallet_id: {wallet_id}")
-                        
-                        from database.client_db import save_user_token, create_recurring_subscription
-                        
-                        MAX_TOKEN_ATTEMPTS = 3
-                        DELAY_SEC = 15
-                        current_payment_data = payment_data
-                        card_token = None
-                        masked_card = "**** **** **** 1234"
-                        card_type = "unknown"
-                        
-                        for attempt in range(1, MAX_TOKEN_ATTEMPTS + 1):
-                            if attempt > 1:
-                                logging.info(f"Повторна спроба {attempt}/{MAX_TOKEN_ATTEMPTS} через {DELAY_SEC} с для {invoice_id}")
-                                await asyncio.sleep(DELAY_SEC)
-                                try:
-                                    resp = requests.get(url, headers=headers)
-                                    if resp.status_code == 200:
-                                        current_payment_data = resp.json()
-                                        logging.info(f"Повторний запит статусу: {json.dumps(current_payment_data, indent=2, ensure_ascii=False)[:500]}...")
-                                    else:
-                                        logging.warning(f"Повторний запит повернув {resp.status_code}")
-                                except Exception as e:
-                                    logging.warning(f"Повторний запит статусу платежу {invoice_id}: {e}")
-                                    continue
-                            
-                            if "walletData" in current_payment_data and current_payment_data["walletData"]:
-                                wd = current_payment_data["walletData"]
-                                card_token = wd.get("cardToken") if isinstance(wd, dict) else None
-                                if card_token:
-                                    logging.info(f"✅ Токен картки знайдено в walletData на спробі {attempt}")
-                                    break
-                                logging.warning(f"walletData є, але cardToken відсутній (спроба {attempt})")
-                            else:
-                                logging.warning(f"walletData не знайдено у відповіді (спроба {attempt})")
-                            
-                            if not card_token and wallet_id:
-                                try:
-                                    wallet_cards = payment_manager.get_wallet_cards(wallet_id)
-                                    if wallet_cards and len(wallet_cards) > 0:
-                                        card_token = wallet_cards[-1].get("cardToken") or wallet_cards[-1].get("token")
-                                        if card_token:
-                                            logging.info(f"✅ Токен картки отримано з wallet API на спробі {attempt}")
-                                            break
-                                except Exception as e:
-                                    logging.warning(f"Wallet API на спробі {attempt}: {e}")
-                            
-                            if "paymentInfo" in current_payment_data:
-                                pi = current_payment_data["paymentInfo"]
-                                if isinstance(pi, dict):
-                                    masked_card = pi.get("maskedPan", masked_card)
-                                    card_type = pi.get("paymentSystem", card_type)
-                            
-                            if not card_token:
-                                logging.warning(f"Токен не знайдено, спроба {attempt}/{MAX_TOKEN_ATTEMPTS}")
-                        
-                        if card_token:
-                            logging.info(f"💳 Дані картки: token=..., masked={masked_card}, type={card_type}")
-                            save_user_token(user_id, wallet_id, card_token, masked_card, card_type)
-                            create_recurring_subscription(
-                                user_id=user_id,
-                                product_id=product_id,
-                                product_name=product_name,
-                                months=months,
-                                price=amount,
-                                wallet_id=wallet_id
-                            )
-                            card_info = f"{get_premium_emoji('card')} <b>Картка:</b> {masked_card}"
-                            if card_type != "unknown":
-                                card_info += f" ({card_type.upper()})"
-                            await bot.send_message(
-                                user_id,
-                                get_user_subscription_success_text(product_name, months, amount, card_info=card_info),
-                                parse_mode="HTML",
-                                reply_markup=get_channel_keyboard()
-                            )
-                            cursor.execute("DELETE FROM payments_temp_data WHERE local_payment_id = ?", (payment_id,))
-                            conn.commit()
-                            sub_username = get_username_by_id(user_id)
-                            sub_ref_username = get_username_by_id(ref_id) if ref_id else None
-                            sub_credit = round(amount * (get_partner_referral_percent() / 100), 1) if ref_id else 0
-                            try:
-                                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                                    [InlineKeyboardButton(text="👤 Написати користувачу", url=f"tg://user?id={user_id}")],
-                                ])
-                                await bot.send_message(
-                                    admin_chat_id,
-                                    get_admin_new_subscription_text(payment_id, user_id, sub_username, product_name, amount, months, ref_id, sub_ref_username, sub_credit),
-                                    parse_mode="HTML",
-                                    reply_markup=keyboard
-                                )
-                            except Exception as e:
-                                logging.error(f"Помилка при відправці повідомлення адміну про підписку: {e}")
-                                await bot.send_message(
-                                    admin_chat_id,
-                                    get_admin_new_subscription_text(payment_id, user_id, sub_username, product_name, amount, months, ref_id, sub_ref_username, sub_credit),
-                                    parse_mode="HTML"
-                                )
-                        else:
-                            logging.error("❌ Токен картки не знайдено після всіх спроб. Повідомляємо користувача.")
-                            try:
-                                await bot.send_message(
-                                    user_id,
-                                    get_user_subscription_token_not_found_text(product_name, months, amount),
-                                    parse_mode="HTML"
-                                )
-                            except Exception as e:
-                                logging.error(f"Не вдалося відправити повідомлення користувачу: {e}")
-                    
-                    else:
-                        # Звичайна одноразова оплата
-                        logging.info(f"Обробка одноразової оплати для платежу {invoice_id}")
-                        
-                        product = get_product_by_id(product_id)
-                        if not product:
-                            logging.error(f"Продукт {product_id} не знайдено")
-                            continue
-                            
-                        product_name, description, _, photo_path = product
-                        start_date = datetime.now()
-                        end_date = start_date + timedelta(days=30 * months)
-                        product_type = get_product_type(product_id)
-                        
-                        add_subscription(
-                            user_id=user_id,
-                            product_type=product_type,
-                            product_id=product_id,
-                            product_name=product_name,
-                            price=amount,
-                            start_date=start_date.strftime("%Y-%m-%d"),
-                            end_date=end_date.strftime("%Y-%m-%d"),
-                            status="active"
-                        )
-                        
-                        await bot.send_message(
-                            user_id,
-                            get_user_one_time_success_text(product_name, months, amount),
-                            parse_mode="HTML",
-                            reply_markup=get_channel_keyboard()
-                        )
-                        ref_username_one_time = get_username_by_id(ref_id) if ref_id else None
-                        credit_one_time = round(amount * (get_partner_referral_percent() / 100), 1) if ref_id else 0
-                        try:
-                            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                                [InlineKeyboardButton(text="👤 Написати користувачу", url=f"tg://user?id={user_id}")],
-                            ])
-                            await bot.send_message(
-                                admin_chat_id,
-                                get_admin_new_one_time_text(
-                                    invoice_id, user_id, username, product_name, amount, months,
-                                    end_date.strftime('%d.%m.%Y'), ref_id, ref_username_one_time, credit_one_time
-                                ),
-                                parse_mode="HTML",
-                                reply_markup=keyboard
-                            )
-                        except Exception as e:
-                            logging.error(f"Помилка при відправці повідомлення адміну про оплату: {e}")
-                            await bot.send_message(
-                                admin_chat_id,
-                                get_admin_new_one_time_text(
-                                    invoice_id, user_id, username, product_name, amount, months,
-                                    end_date.strftime('%d.%m.%Y'), ref_id, ref_username_one_time, credit_one_time
-                                ),
-                                parse_mode="HTML"
-                            )
-                            await bot.send_message(
-                                user_id,
-                                get_user_contact_manager_text(invoice_id),
-                                parse_mode="HTML",
-                                reply_markup=get_manager_keyboard()
-                            )
-
-                    
-                    logging.info(f"Платіж {invoice_id} оброблено успішно")
+                    await settle_successful_payment(
+                        payment_manager, invoice_id, user_id, product_id, months, amount, payment_type, payment_data
+                    )
+                    continue
+                elif status in FINAL_INVOICE_STATUSES:
+                    update_payment_status(invoice_id, FINAL_INVOICE_STATUSES[status])
+                    logging.info(f"Платіж {invoice_id} завершено зі статусом {status}, більше не перевіряємо")
+                    continue
                 else:
                     logging.info(f"Платіж {invoice_id} ще не успішний: {status}")
+                    last_status = status
             else:
                 logging.error(f"Помилка API для {invoice_id}: {response.status_code} - {response.text}")
+        except ServiceUnavailable as e:
+            # Збій на боці Monobank: рахунки лишаються в черзі без зміни розкладу
+            logging.warning(f"Перевірку pending-платежів перервано: {e}")
+            break
         except Exception as e:
             logging.error(f"Помилка при перевірці платежу {invoice_id}: {str(e)}", exc_info=True)
-    
-    logging.info("Завершення перевірки платежів")
+
+        if age_seconds >= PENDING_PAYMENT_TTL:
+            update_payment_status(invoice_id, "expired")
+            logging.info(f"Платіж {invoice_id} старший за 24 год — позначено як expired")
+            continue
+        delay = get_next_payment_check_delay(age_seconds, check_count, last_status)
+        schedule_payment_check(invoice_id, now_ts + delay, last_status)
+
 
 
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from database.outbox_db import (
+    enqueue_outbox,
+    claim_outbox_batch,
+    mark_outbox_sent,
+    mark_outbox_retry,
+    mark_outbox_dead,
+)
+from main import bot
+
+# Скільки записів доставляється паралельно і як часто опитується черга без явного сигналу
+OUTBOX_WORKERS = 4
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_POLL_INTERVAL = 2
+# Поки запис у роботі, інші процеси його не беруть; після падіння процесу він повернеться в чергу
+OUTBOX_CLAIM_SECONDS = 120
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_MAX_DELAY = 60 * 60
+
+
+class OutboxRetry(Exception):
+    """Обробник просить повторити запис пізніше (дані ще не готові), це не вважається збоєм."""
+
+    def __init__(self, delay: float, reason: str = ""):
+        super().__init__(reason or f"повтор через {delay} с")
+        self.delay = delay
+
+
+_handlers = {}
+_queue: asyncio.Queue = None
+_wake: asyncio.Event = None
+_poller_task: asyncio.Task = None
+_worker_tasks: list = []
+
+
+def outbox_handler(kind: str):
+    """Реєструє обробник записів черги: async handler(payload, attempts, outbox_id)."""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def message_payload(chat_id: int, text: str, reply_markup: InlineKeyboardMarkup = None,
+                    fallback: list = None, parse_mode: str = "HTML") -> dict:
+    """Повідомлення для черги; fallback — повідомлення, які ставляться замість нього, якщо Telegram відхилив запит."""
+    payload = {"chat_id": chat_id, "text": text, "parse_mode": parse_mode}
+    if reply_markup is not None:
+        payload["reply_markup"] = reply_markup.model_dump(mode="json", exclude_none=True)
+    if fallback:
+        payload["fallback"] = fallback
+    return payload
+
+
+def enqueue_message(chat_id: int, text: str, dedupe_key: str = None, reply_markup: InlineKeyboardMarkup = None,
+                    fallback: list = None, parse_mode: str = "HTML") -> bool:
+    return enqueue_outbox("send_message", message_payload(chat_id, text, reply_markup, fallback, parse_mode), dedupe_key)
+
+
+def wake_outbox():
+    """Будить диспетчер одразу після фіксації транзакції, не чекаючи наступного опитування."""
+    if _wake is not None:
+        _wake.set()
+
+
+@outbox_handler("send_message")
+async def _send_message(payload: dict, attempts: int, outbox_id: int):
+    markup = payload.get("reply_markup")
+    try:
+        await bot.send_message(
+            payload["chat_id"],
+            payload["text"],
+            parse_mode=payload.get("parse_mode"),
+            reply_markup=InlineKeyboardMarkup.model_validate(markup) if markup else None,
+        )
+    except TelegramBadRequest as e:
+        fallback = payload.get("fallback")
+        if not fallback:
+            raise
+        logging.warning(f"Outbox {outbox_id}: Telegram відхилив повідомлення ({e}), надсилаємо запасний варіант")
+        for index, item in enumerate(fallback):
+            enqueue_outbox("send_message", item, dedupe_key=f"outbox:{outbox_id}:fallback:{index}")
+        wake_outbox()
+
+
+async def _deliver(outbox_id: int, kind: str, payload: dict, attempts: int):
+    handler = _handlers.get(kind)
+    if handler is None:
+        logging.error(f"Outbox {outbox_id}: невідомий тип запису {kind}")
+        mark_outbox_dead(outbox_id, f"невідомий тип {kind}")
+        return
+
+    try:
+        await handler(payload, attempts, outbox_id)
+    except OutboxRetry as e:
+        mark_outbox_retry(outbox_id, e.delay, str(e))
+        return
+    except TelegramRetryAfter as e:
+        # Ліміт Telegram — не збій запису, чекаємо скільки просять
+        mark_outbox_retry(outbox_id, e.retry_after, str(e))
+        return
+    except TelegramForbiddenError as e:
+        logging.warning(f"Outbox {outbox_id}: отримувач заблокував бота, запис закрито")
+        mark_outbox_dead(outbox_id, str(e))
+        return
+    except Exception as e:
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            logging.error(f"Outbox {outbox_id} ({kind}): спроби вичерпано, останній збій: {e}")
+            mark_outbox_dead(outbox_id, str(e))
+        else:
+            delay = min(OUTBOX_MAX_DELAY, 5 * 2 ** attempts)
+            logging.warning(f"Outbox {outbox_id} ({kind}): збій спроби {attempts}, повтор через {delay} с: {e}")
+            mark_outbox_retry(outbox_id, delay, str(e))
+        return
+    mark_outbox_sent(outbox_id)
+
+
+async def _worker():
+    while True:
+        outbox_id, kind, payload, attempts = await _queue.get()
+        try:
+            await _deliver(outbox_id, kind, payload, attempts)
+        except Exception as e:
+            logging.error(f"Outbox {outbox_id}: помилка диспетчера: {e}", exc_info=True)
+        finally:
+            _queue.task_done()
+
+
+async def _poller():
+    while True:
+        try:
+            batch = claim_outbox_batch(OUTBOX_BATCH_SIZE, OUTBOX_CLAIM_SECONDS)
+        except Exception as e:
+            logging.error(f"Outbox: не вдалося вибрати чергу: {e}")
+            batch = []
+        if batch:
+            for item in batch:
+                _queue.put_nowait(item)
+            # Наступну порцію беремо лише після доставки поточної, щоб claim не сплив у черзі воркерів
+            await _queue.join()
+            continue
+        try:
+            await asyncio.wait_for(_wake.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start_outbox_dispatcher():
+    """Запускає опитувач черги та пул воркерів доставки."""
+    global _queue, _wake, _poller_task
+    if _poller_task is not None:
+        return
+    _queue = asyncio.Queue()
+    _wake = asyncio.Event()
+    _poller_task = asyncio.create_task(_poller())
+    _worker_tasks.extend(asyncio.create_task(_worker()) for _ in range(OUTBOX_WORKERS))
+
+
+async def stop_outbox_dispatcher(timeout: float = 10):
+    """Зупиняє диспетчер: дає доставити вже взяте, решту повертає в чергу без очікування claim."""
+    global _poller_task
+    if _poller_task is None:
+        return
+    _poller_task.cancel()
+    await asyncio.gather(_poller_task, return_exceptions=True)
+    _poller_task = None
+    try:
+        await asyncio.wait_for(_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        logging.warning("Outbox: не всі записи доставлено до зупинки")
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    while not _queue.empty():
+        outbox_id = _queue.get_nowait()[0]
+        mark_outbox_retry(outbox_id, 0)
@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from database.client_db import get_user_profile_rows
+
+# Скільки профілів тримаємо в пам'яті та скільки секунд знімок вважається свіжим
+PROFILE_CACHE_SIZE = 5000
+PROFILE_CACHE_TTL = 60
+
+_cache: "OrderedDict[int, tuple[float, dict]]" = OrderedDict()
+
+
+def _parse_date(value, fmt: str):
+    """Розбирає дату один раз при побудові знімка; невідомий формат не ламає кабінет."""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, fmt)
+    except (TypeError, ValueError):
+        try:
+            return datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+
+
+def _build_snapshot(rows: list) -> dict | None:
+    snapshot = {"join_date": None, "subscriptions": [], "recurring": []}
+    found_user = False
+    for kind, sub_id, product_name, price, months, first_date, second_date, status, payment_failures in rows:
+        if kind == "user":
+            found_user = True
+            snapshot["join_date"] = _parse_date(first_date, '%Y-%m-%d %H:%M:%S')
+        elif kind == "simple":
+            snapshot["subscriptions"].append({
+                "id": sub_id,
+                "product_name": product_name,
+                "price": price,
+                "start_date": _parse_date(first_date, '%Y-%m-%d'),
+                "end_date": _parse_date(second_date, '%Y-%m-%d'),
+                "status": status,
+            })
+        else:
+            snapshot["recurring"].append({
+                "id": sub_id,
+                "product_name": product_name,
+                "months": months,
+                "price": price,
+                "next_payment": _parse_date(first_date, '%Y-%m-%d %H:%M:%S'),
+                "status": status,
+                "payment_failures": payment_failures or 0,
+            })
+    return snapshot if found_user else None
+
+
+def get_profile_snapshot(user_id: int) -> dict | None:
+    """Знімок кабінету користувача з TTL-кешу; при промаху — один запит до БД."""
+    now = time.monotonic()
+    cached = _cache.get(user_id)
+    if cached and now - cached[0] < PROFILE_CACHE_TTL:
+        _cache.move_to_end(user_id)
+        return cached[1]
+
+    snapshot = _build_snapshot(get_user_profile_rows(user_id))
+    if snapshot is None:
+        _cache.pop(user_id, None)
+        return None
+    _cache[user_id] = (now, snapshot)
+    _cache.move_to_end(user_id)
+    while len(_cache) > PROFILE_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return snapshot
+
+
+def invalidate_profile(user_id: int):
+    """Скидає знімок після оплати, скасування чи зміни статусу підписки."""
+    if user_id is not None:
+        _cache.pop(int(user_id), None)
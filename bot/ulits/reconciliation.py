@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from html import escape
+
+from database.client_db import (
+    transaction,
+    get_stale_pending_payments,
+    get_stale_processing_charges,
+    get_local_payment_states,
+    update_payment_status,
+)
+from ulits.monopay_functions import PaymentManager, settle_successful_payment, FINAL_INVOICE_STATUSES
+from ulits.cron_functions import settle_recurring_charge, fail_recurring_charge
+from database.reconciliation_db import get_reported_discrepancies, mark_discrepancies_reported
+from ulits.job_locks import leased_job
+from ulits.outbox import enqueue_message, wake_outbox
+from config import admin_chat_id
+
+# Рахунки, молодші за цей вік, ще опитує check_pending_payments поштучно
+RECONCILE_MIN_AGE = 5 * 60
+# Навіть без завислих рахунків звіряємо останню годину, щоб ловити розбіжності
+RECONCILE_LOOKBACK = 60 * 60
+# Виписка запитується вікнами (Monobank віддає не більше 31 доби за запит)
+STATEMENT_WINDOW = 24 * 3600
+STATEMENT_MAX_AGE = 31 * 24 * 3600
+DISCREPANCY_REPORT_LIMIT = 15
+
+
+async def fetch_statement(payment_manager: PaymentManager, from_ts: int, to_ts: int) -> dict:
+    """Завантажує виписку вікнами STATEMENT_WINDOW; повертає invoiceId -> остання операція."""
+    operations = {}
+    window_start = from_ts
+    while window_start < to_ts:
+        window_end = min(window_start + STATEMENT_WINDOW, to_ts)
+        for item in await asyncio.to_thread(payment_manager.get_statement, window_start, window_end):
+            invoice_id = item.get("invoiceId")
+            if not invoice_id:
+                continue
+            known = operations.get(invoice_id)
+            if known is None or str(item.get("date", "")) >= str(known.get("date", "")):
+                operations[invoice_id] = item
+        window_start = window_end
+    return operations
+
+
+def _amount_matches(local_amount, statement_amount) -> bool:
+    if local_amount is None or statement_amount is None:
+        return True
+    return int(round(float(local_amount) * 100)) == int(statement_amount)
+
+
+@leased_job("reconcile_payments_with_statement", ttl=120, cooldown=4 * 60)
+async def reconcile_payments_with_statement() -> dict:
+    """Закриває завислі pending/processing рахунки за випискою мерчанта і надсилає адміну звіт про розбіжності."""
+    payment_manager = PaymentManager()
+    now_ts = int(time.time())
+    stale_before = now_ts - RECONCILE_MIN_AGE
+
+    pending = get_stale_pending_payments(stale_before)
+    processing = get_stale_processing_charges(stale_before)
+    oldest = min([row[6] for row in pending if row[6]] + [row[7] for row in processing if row[7]] + [now_ts - RECONCILE_LOOKBACK])
+    from_ts = max(oldest - 60, now_ts - STATEMENT_MAX_AGE)
+
+    try:
+        operations = await fetch_statement(payment_manager, from_ts, now_ts)
+    except Exception as e:
+        logging.error(f"Звірка з випискою не виконана: {e}")
+        return {}
+
+    result = {"settled": 0, "closed": 0, "discrepancies": 0, "statement": len(operations)}
+
+    for invoice_id, user_id, product_id, months, amount, payment_type, _created in pending:
+        operation = operations.get(invoice_id)
+        if not operation:
+            continue
+        status = operation.get("status")
+        try:
+            if status == "success":
+                payment_data = operation
+                if payment_type == "subscription":
+                    # У виписці немає walletData — для збереження токена потрібен повний статус рахунку
+                    payment_data = await asyncio.to_thread(payment_manager.get_payment_status, invoice_id)
+                if await settle_successful_payment(
+                    payment_manager, invoice_id, user_id, product_id, months, amount, payment_type, payment_data
+                ):
+                    result["settled"] += 1
+            elif status in FINAL_INVOICE_STATUSES:
+                update_payment_status(invoice_id, FINAL_INVOICE_STATUSES[status])
+                result["closed"] += 1
+        except Exception as e:
+            logging.error(f"Помилка при звірці рахунку {invoice_id}: {e}")
+
+    for payment_db_id, subscription_id, user_id, invoice_id, product_name, months, price, _created in processing:
+        operation = operations.get(invoice_id)
+        if not operation:
+            continue
+        status = operation.get("status")
+        try:
+            if status == "success":
+                if await settle_recurring_charge(payment_db_id, subscription_id, user_id, invoice_id, product_name, months, price):
+                    result["settled"] += 1
+            elif status == "failure":
+                reason = operation.get("failureReason") or "Невідома помилка"
+                if await fail_recurring_charge(payment_db_id, subscription_id, user_id, invoice_id, product_name, reason):
+                    result["closed"] += 1
+            elif status == "expired":
+                if await fail_recurring_charge(payment_db_id, subscription_id, user_id, invoice_id, product_name,
+                                               "Рахунок застарів", notify=False):
+                    result["closed"] += 1
+        except Exception as e:
+            logging.error(f"Помилка при звірці списання {invoice_id}: {e}")
+
+    discrepancies = find_discrepancies(operations)
+    result["discrepancies"] = len(discrepancies)
+    # Про кожну розбіжність повідомляємо один раз: позначки в БД, поки операція в межах вікна виписки
+    reported = get_reported_discrepancies({item[:2] for item in discrepancies})
+    fresh = [item for item in discrepancies if item[:2] not in reported]
+    if fresh:
+        with transaction():
+            enqueue_discrepancy_report(fresh)
+            mark_discrepancies_reported([item[:2] for item in fresh], STATEMENT_MAX_AGE)
+        wake_outbox()
+
+    logging.info(f"Звірка з випискою: {result}")
+    return result
+
+
+def find_discrepancies(operations: dict) -> list:
+    """Порівнює операції виписки з локальними записами: (вид, invoice_id, опис)."""
+    local = get_local_payment_states(operations.keys())
+    discrepancies = []
+    for invoice_id, operation in operations.items():
+        status = operation.get("status")
+        state = local.get(invoice_id)
+        if state is None:
+            if status == "success":
+                discrepancies.append(("unknown", invoice_id, f"оплата {operation.get('amount', 0) / 100:.2f}₴ без запису в БД"))
+            continue
+        source, local_status, local_amount = state
+        if status == "success" and local_status not in ("success", "pending", "processing"):
+            discrepancies.append(("paid_not_settled", invoice_id, f"оплачено, а в {source} статус «{local_status}»"))
+        elif status == "reversed" and local_status == "success":
+            discrepancies.append(("reversed", invoice_id, f"повернення коштів, а в {source} статус «success»"))
+        if status == "success" and not _amount_matches(local_amount, operation.get("amount")):
+            discrepancies.append((
+                "amount", invoice_id,
+                f"сума у виписці {operation.get('amount', 0) / 100:.2f}₴, в {source} {float(local_amount):.2f}₴",
+            ))
+    return discrepancies
+
+
+def enqueue_discrepancy_report(discrepancies: list):
+    """Ставить звіт у outbox: доставка з повторами, як і решта адмін-повідомлень."""
+    lines = [f"⚠️ <b>Звірка з випискою Monobank: розбіжностей {len(discrepancies)}</b>\n"]
+    for kind, invoice_id, description in discrepancies[:DISCREPANCY_REPORT_LIMIT]:
+        lines.append(f"• <code>{escape(invoice_id)}</code> — {escape(description)}")
+    if len(discrepancies) > DISCREPANCY_REPORT_LIMIT:
+        lines.append(f"… та ще {len(discrepancies) - DISCREPANCY_REPORT_LIMIT}")
+    enqueue_message(admin_chat_id, "\n".join(lines))
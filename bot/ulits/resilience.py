@@ -0,0 +1,159 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+
+class ServiceUnavailable(Exception):
+    """Зовнішній сервіс недоступний (розімкнений запобіжник або вичерпані повтори) — це не помилка клієнта."""
+
+    def __init__(self, service: str, reason: str, retry_after: float = 0.0):
+        super().__init__(f"{service} недоступний: {reason}")
+        self.service = service
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Запобіжник: після failure_threshold збоїв поспіль блокує виклики на recovery_timeout секунд, потім пропускає одну пробу."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None and time.monotonic() - self._opened_at < self.recovery_timeout
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.recovery_timeout or self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logging.info(f"Запобіжник {self.name}: сервіс відновився")
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            reopen = self._probe_in_flight
+            self._probe_in_flight = False
+            if reopen or self._failures >= self.failure_threshold:
+                if self._opened_at is None or reopen:
+                    logging.warning(f"Запобіжник {self.name}: розімкнено на {self.recovery_timeout} с після {self._failures} збоїв")
+                self._opened_at = time.monotonic()
+
+
+# Класи помилок і скільки спроб на кожен дозволено
+ERROR_CONNECT = "connect"      # з'єднання не встановлено — запит точно не дійшов
+ERROR_TIMEOUT = "timeout"      # відповідь не отримано — запит міг бути виконаний
+ERROR_THROTTLED = "throttled"  # 429
+ERROR_SERVER = "server"        # 5xx
+
+
+class RetryPolicy:
+    """Експоненційні повтори з повним джитером; кількість спроб залежить від класу помилки."""
+
+    def __init__(self, attempts: dict, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, error_class: str, attempt: int) -> bool:
+        return attempt < self.attempts.get(error_class, 1)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def classify_error(exc: Exception = None, response=None) -> str | None:
+    """Клас тимчасової помилки або None, якщо повторювати немає сенсу (4xx, успіх)."""
+    if exc is not None:
+        if isinstance(exc, requests.exceptions.ConnectTimeout):
+            return ERROR_CONNECT
+        if isinstance(exc, requests.exceptions.ConnectionError):
+            reason = getattr(exc.args[0], "reason", None) if exc.args else None
+            return ERROR_CONNECT if isinstance(reason, NewConnectionError) else ERROR_TIMEOUT
+        if isinstance(exc, requests.exceptions.Timeout):
+            return ERROR_TIMEOUT
+        return None
+    if response is not None:
+        if response.status_code == 429:
+            return ERROR_THROTTLED
+        if response.status_code >= 500:
+            return ERROR_SERVER
+    return None
+
+
+class ResilientHTTP:
+    """Спільний захист викликів зовнішнього API: ліміт паралельності, запобіжник, повтори."""
+
+    def __init__(self, service: str, breaker: CircuitBreaker, retry: RetryPolicy,
+                 max_concurrency: int = 8, timeout: tuple = (5, 20), acquire_timeout: float = 30.0):
+        self.service = service
+        self.breaker = breaker
+        self.retry = retry
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def request(self, method: str, url: str, idempotent: bool = True, **kwargs) -> requests.Response:
+        """
+        Виконує запит. Неідемпотентні запити (створення рахунку, списання) повторюються лише
+        якщо з'єднання не встановилось. Повертає відповідь (у т.ч. 4xx) або кидає ServiceUnavailable.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise ServiceUnavailable(self.service, "запобіжник розімкнено", self.breaker.retry_after())
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                raise ServiceUnavailable(self.service, "усі з'єднання зайняті")
+            exc = response = None
+            try:
+                response = requests.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                exc = e
+            finally:
+                self._slots.release()
+
+            error_class = classify_error(exc, response)
+            if error_class is None:
+                if exc is not None:
+                    raise exc
+                self.breaker.record_success()
+                return response
+
+            self.breaker.record_failure()
+            attempt += 1
+            retryable = idempotent or error_class in (ERROR_CONNECT, ERROR_THROTTLED)
+            if not retryable or not self.retry.should_retry(error_class, attempt) or self.breaker.is_open:
+                detail = str(exc) if exc is not None else f"HTTP {response.status_code}"
+                raise ServiceUnavailable(self.service, f"{error_class}: {detail}", self.breaker.retry_after())
+            delay = self.retry.delay(attempt)
+            logging.warning(f"{self.service}: {error_class}, повтор {attempt} через {delay:.1f} с")
+            time.sleep(delay)
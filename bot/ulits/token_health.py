@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from Content.texts import get_user_token_precheck_text
+from database.token_health_db import (
+    TOKEN_HEALTH_TTL,
+    get_tokens_to_check,
+    save_token_health,
+    get_invalid_token_subscriptions,
+    mark_token_health_notified,
+)
+from ulits.job_locks import leased_job
+from ulits.monopay_functions import PaymentManager, monobank_http
+from ulits.outbox import enqueue_message, wake_outbox
+from ulits.resilience import ServiceUnavailable
+
+# Перевіряємо токени підписок, що списуються протягом стількох днів
+TOKEN_CHECK_DAYS_AHEAD = 3
+# Паралельних запитів до wallet API: менше за ліміт monobank_http, щоб лишити місце платежам
+TOKEN_CHECK_CONCURRENCY = 4
+# Якщо всі перевірки (не менше стількох) дали «недійсний», це збій API або ключа, а не картки
+TOKEN_CHECK_SANITY_MIN = 5
+
+
+def _card_tokens(cards) -> set:
+    if isinstance(cards, dict):
+        cards = cards.get("wallet") or cards.get("cards") or []
+    return {card.get("cardToken") or card.get("token") for card in cards if isinstance(card, dict)}
+
+
+async def _check_token(payment_manager: PaymentManager, semaphore: asyncio.Semaphore,
+                       user_id: int, wallet_id: str, card_token: str):
+    """(user_id, card_token, статус, причина) або None, якщо перевірити не вдалося — тоді списання йде як звичайно."""
+    async with semaphore:
+        if monobank_http.breaker.is_open:
+            return None
+        try:
+            cards = await asyncio.to_thread(payment_manager.get_wallet_cards, wallet_id, strict=True)
+        except ServiceUnavailable as e:
+            logging.warning(f"Перевірка токена користувача {user_id} відкладена: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Помилка перевірки токена користувача {user_id}: {e}")
+            return None
+    if cards is None:
+        # Не 200 (зокрема 401/403 через прострочений X-Token) — вердикту немає, списання йде як звичайно
+        return None
+    tokens = _card_tokens(cards)
+    if card_token in tokens:
+        return user_id, card_token, "valid", None
+    return user_id, card_token, "invalid", "TOKEN_NOT_FOUND" if tokens else "WALLET_EMPTY"
+
+
+async def _notify_invalid_tokens(now: str, until: str) -> int:
+    """
+    Раннє попередження власникам недійсних карток — один раз на токен, через outbox.
+    Кому списання вже настало, попередження не шлемо: білінг одразу надішле скасування.
+    """
+    rows = get_invalid_token_subscriptions(until, unnotified_only=True)
+    for subscription_id, user_id, product_name, price, next_payment_date, masked_card, reason in rows:
+        if next_payment_date <= now:
+            continue
+        enqueue_message(
+            user_id,
+            get_user_token_precheck_text(product_name, masked_card, next_payment_date),
+            dedupe_key=f"token_precheck:{subscription_id}:{next_payment_date}",
+        )
+    if rows:
+        mark_token_health_notified(list({row[1] for row in rows}))
+        wake_outbox()
+    return len(rows)
+
+
+@leased_job("check_token_health", ttl=300, cooldown=20 * 3600)
+async def check_token_health() -> dict:
+    """
+    Нічна перевірка токенів карток для підписок, що списуються найближчими днями: недійсні
+    отримують попередження заздалегідь, а білінг у день списання їх уже не чіпає.
+    """
+    now = datetime.now(pytz.timezone('Europe/Kiev'))
+    until = (now + timedelta(days=TOKEN_CHECK_DAYS_AHEAD)).strftime('%Y-%m-%d %H:%M:%S')
+    candidates = get_tokens_to_check(until, int(time.time()) - TOKEN_HEALTH_TTL)
+    payment_manager = PaymentManager()
+    semaphore = asyncio.Semaphore(TOKEN_CHECK_CONCURRENCY)
+    checked = await asyncio.gather(*(
+        _check_token(payment_manager, semaphore, user_id, wallet_id, card_token)
+        for user_id, wallet_id, card_token in candidates
+    ))
+    results = [result for result in checked if result is not None]
+    invalid = sum(1 for result in results if result[2] == "invalid")
+    if len(results) >= TOKEN_CHECK_SANITY_MIN and invalid == len(results):
+        logging.error(f"Усі {invalid} перевірених токенів недійсні — схоже на збій wallet API, результати не збережено")
+        return {"candidates": len(candidates), "checked": 0, "invalid": 0, "notified": 0}
+    save_token_health(results)
+    result = {
+        "candidates": len(candidates),
+        "checked": len(results),
+        "invalid": invalid,
+        "notified": await _notify_invalid_tokens(now.strftime('%Y-%m-%d %H:%M:%S'), until),
+    }
+    logging.info(f"Перевірка токенів до {until}: {result}")
+    return result